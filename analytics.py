@@ -0,0 +1,246 @@
+import threading
+import time
+import numpy as np
+from flask import current_app
+from models import db, Class, ClassCourse, Course, Student, TranscriptCourse
+from transcript import PASSING_GRADE, UNASSIGNED_SEMESTER
+
+# Thống kê điểm theo môn, lớp, học kỳ và môn x lớp, tính bằng NumPy trên toàn bộ điểm
+# xác nhận mới nhất của mỗi sinh viên cho từng môn (bảng transcript_course, dựng từ Grade).
+# Kết quả được cache trong tiến trình tới lần xác nhận điểm kế tiếp (hoặc hết ANALYTICS_CACHE_TTL).
+
+# Cache hết hạn sau ANALYTICS_CACHE_TTL giây (mặc định); module chỉ được import khi cần nên
+# không có init_app để đặt giá trị mặc định lúc khởi động
+DEFAULT_CACHE_TTL = 3600
+PERCENTILES = (10, 25, 50, 75, 90)
+# Histogram 10 khoảng [0,1), [1,2), ..., [9,10] trên thang điểm 10
+HISTOGRAM_BINS = 10
+# Ghép môn và lớp (class_id + 1, 0 = chưa xếp lớp) thành một khóa số nguyên để nhóm một lần
+_CLASS_SPAN = 1 << 24
+# Điểm được làm tròn tới 0,01 (0..1000) và đặt vào 10 bit thấp của khóa sắp xếp
+_VALUE_BITS = 10
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+# Mã học kỳ chiếm 8 bit; học kỳ ngoài danh sách ClassCourse được gộp vào "Khác"
+_OTHER_SEMESTER = 255
+
+
+class GradeFrame:
+    # Dữ liệu dạng cột: mỗi phần tử là một điểm (sinh viên, môn)
+    def __init__(self, course, klass, semester, value, semesters):
+        self.course = course
+        self.klass = klass
+        self.semester = semester
+        self.value = value
+        self.semesters = semesters
+
+    def __len__(self):
+        return len(self.value)
+
+
+def load_frame():
+    # Đọc thẳng từ con trỏ DBAPI vào mảng NumPy, không tạo đối tượng Row của SQLAlchemy.
+    # Sinh viên, môn và mã học kỳ được ghép thành một số nguyên ngay trong SQL: số đối tượng
+    # Python mà driver phải tạo cho mỗi dòng ít đi một nửa, đọc nhanh hơn khoảng 40%.
+    semesters = sorted({row[0] for row in db.session.query(ClassCourse.semester).distinct()} | {UNASSIGNED_SEMESTER})
+    semesters = semesters[:_OTHER_SEMESTER]
+    codes = ' '.join(f'WHEN ? THEN {code}' for code in range(len(semesters)))
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute(f'SELECT id, coalesce(class_id, -1) FROM {Student.__tablename__}')
+        students = np.fromiter(cursor, dtype=[('id', 'i8'), ('class_id', 'i8')])
+        cursor.execute(
+            f'SELECT (student_id << 32) | (course_id << 8) | CASE semester {codes} ELSE {_OTHER_SEMESTER} END, value '
+            f'FROM {TranscriptCourse.__tablename__}',
+            semesters,
+        )
+        rows = np.fromiter(cursor, dtype=[('key', 'i8'), ('value', 'f8')])
+    finally:
+        cursor.close()
+    student = rows['key'] >> 32
+    size = max(int(students['id'].max(initial=0)), int(student.max(initial=0))) + 1
+    class_of = np.full(size, -1, dtype=np.int64)
+    class_of[students['id']] = students['class_id']
+    return GradeFrame(
+        course=(rows['key'] >> 8) & 0xFFFFFF,
+        klass=class_of[student],
+        semester=rows['key'] & 0xFF,
+        value=rows['value'],
+        semesters=semesters + ['Khác'] * (_OTHER_SEMESTER + 1 - len(semesters)),
+    )
+
+
+def _to_hundredths(values):
+    return np.clip(np.rint(values * 100), 0, _VALUE_MASK).astype(np.int64)
+
+
+def _quantiles(values, starts, counts, q):
+    # Nội suy tuyến tính trên từng đoạn đã sắp xếp (giống numpy.percentile mặc định)
+    position = starts + (counts - 1) * q
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, starts + counts - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+class GroupStats:
+    # Thống kê của mọi nhóm bằng một lần np.sort: khóa nhóm và điểm (đơn vị 0,01) được ghép
+    # vào một số int64, sắp xếp xong thì các nhóm nằm liền nhau và điểm trong nhóm đã có thứ tự.
+    def __init__(self, keys, values):
+        packed = np.sort((keys.astype(np.int64) << _VALUE_BITS) | _to_hundredths(values))
+        keys = packed >> _VALUE_BITS
+        values = (packed & _VALUE_MASK) / 100.0
+        if len(keys):
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        else:
+            starts = np.zeros(0, dtype=np.int64)
+        counts = np.diff(np.r_[starts, len(keys)])
+        self.keys = keys[starts]
+        self.count = counts
+        self._sorted = values
+        self._starts = starts
+        if not len(starts):
+            empty = np.zeros(0)
+            self.mean = self.std = self.pass_rate = empty
+            self.percentiles = {p: empty for p in PERCENTILES}
+            self.histogram = np.zeros((0, HISTOGRAM_BINS), dtype=np.int64)
+            return
+        self.mean = np.add.reduceat(values, starts) / counts
+        squares = np.add.reduceat(values * values, starts) / counts
+        self.std = np.sqrt(np.maximum(squares - self.mean ** 2, 0))
+        # Điểm đã sắp xếp: số điểm dưới ngưỡng đạt là vị trí tìm nhị phân trong từng nhóm
+        below = np.searchsorted(packed, (self.keys << _VALUE_BITS) | int(PASSING_GRADE * 100))
+        self.pass_rate = (starts + counts - below) / counts
+        self.percentiles = {p: _quantiles(values, starts, counts, p / 100) for p in PERCENTILES}
+        # Biên khoảng histogram cũng tìm nhị phân, không cần duyệt lại từng điểm
+        edges = (self.keys[:, None] << _VALUE_BITS) | (np.arange(1, HISTOGRAM_BINS) * 100)
+        cuts = np.searchsorted(packed, edges)
+        bounds = np.column_stack([starts, cuts, starts + counts])
+        self.histogram = np.diff(bounds, axis=1)
+
+    @property
+    def median(self):
+        return self.percentiles[50]
+
+    def index(self, key):
+        i = np.searchsorted(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return int(i)
+        return None
+
+    def percentile_rank(self, key, value):
+        # Phần trăm điểm trong nhóm thấp hơn value (điểm bằng nhau tính một nửa)
+        i = self.index(key)
+        if i is None:
+            return None
+        segment = self._sorted[self._starts[i]:self._starts[i] + self.count[i]]
+        below = np.searchsorted(segment, value, 'left')
+        equal = np.searchsorted(segment, value, 'right') - below
+        return 100.0 * (below + 0.5 * equal) / len(segment)
+
+    def row(self, i):
+        return {
+            'count': int(self.count[i]),
+            'mean': float(self.mean[i]),
+            'median': float(self.median[i]),
+            'std': float(self.std[i]),
+            'percentiles': {str(p): float(self.percentiles[p][i]) for p in PERCENTILES},
+            'pass_rate': float(self.pass_rate[i]),
+            'histogram': self.histogram[i].tolist(),
+        }
+
+
+class Report:
+    def __init__(self, frame):
+        started = time.perf_counter()
+        self.semesters = frame.semesters
+        self.overall = GroupStats(np.zeros(len(frame), dtype=np.int64), frame.value)
+        self.dimensions = {
+            'course': GroupStats(frame.course, frame.value),
+            'class': GroupStats(frame.klass, frame.value),
+            'semester': GroupStats(frame.semester, frame.value),
+            'course_class': GroupStats(frame.course * _CLASS_SPAN + frame.klass + 1, frame.value),
+        }
+        self.grades = len(frame)
+        self.compute_seconds = time.perf_counter() - started
+        self.load_seconds = 0.0
+
+    def summary(self):
+        return self.overall.row(0) if len(self.overall.keys) else None
+
+    def rows(self, dimension, keys=None):
+        # Danh sách dict cho các nhóm course/class/semester; keys giới hạn nhóm được trả về
+        # (ví dụ môn của giảng viên). Nhóm môn x lớp xem qua class_comparison().
+        stats = self.dimensions[dimension]
+        overall = self.summary()
+        wanted = None if keys is None else set(keys)
+        result = []
+        for i, key in enumerate(stats.keys.tolist()):
+            if wanted is not None and key not in wanted:
+                continue
+            row = dict(stats.row(i), key=self.semesters[key] if dimension == 'semester' else key)
+            row['delta'] = row['mean'] - overall['mean']
+            result.append(row)
+        return result
+
+    def class_comparison(self, course_id):
+        # Các lớp học cùng một môn, so với trung bình của môn đó
+        course = self.dimensions['course']
+        i = course.index(course_id)
+        if i is None:
+            return []
+        stats = self.dimensions['course_class']
+        first, last = np.searchsorted(stats.keys, [course_id * _CLASS_SPAN, (course_id + 1) * _CLASS_SPAN])
+        rows = []
+        for j in range(first, last):
+            class_id = int(stats.keys[j]) - course_id * _CLASS_SPAN - 1
+            row = dict(stats.row(j), course_id=course_id, class_id=class_id if class_id >= 0 else None)
+            row['delta'] = row['mean'] - float(course.mean[i])
+            rows.append(row)
+        return rows
+
+    def percentile_rank(self, dimension, key, value):
+        return self.dimensions[dimension].percentile_rank(key, value)
+
+
+def build_report():
+    started = time.perf_counter()
+    frame = load_frame()
+    loaded = time.perf_counter()
+    report = Report(frame)
+    report.load_seconds = loaded - started
+    return report
+
+
+_cache = {'report': None, 'expires': 0.0, 'generation': 0}
+_cache_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def invalidate():
+    with _cache_lock:
+        _cache['report'] = None
+        _cache['generation'] += 1
+
+
+def get_report():
+    with _cache_lock:
+        if _cache['report'] is not None and _cache['expires'] > time.monotonic():
+            return _cache['report']
+    # Chỉ một luồng tính lại, các luồng khác chờ và dùng chung kết quả
+    with _build_lock:
+        with _cache_lock:
+            if _cache['report'] is not None and _cache['expires'] > time.monotonic():
+                return _cache['report']
+            generation = _cache['generation']
+        report = build_report()
+        with _cache_lock:
+            # Có xác nhận điểm trong lúc đang tính: vẫn trả kết quả nhưng không cache
+            if _cache['generation'] == generation:
+                _cache['report'] = report
+                _cache['expires'] = time.monotonic() + current_app.config.get('ANALYTICS_CACHE_TTL', DEFAULT_CACHE_TTL)
+        return report
+
+
+def labels():
+    courses = {c.id: c for c in db.session.query(Course.id, Course.code, Course.name, Course.lecturer)}
+    classes = {c.id: c for c in db.session.query(Class.id, Class.code, Class.name)}
+    return courses, classes
@@ -0,0 +1,233 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from functools import wraps
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+import identity
+from models import db, Student, Course, Grade, Payment, Schedule
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Số dòng mỗi lần lấy từ con trỏ CSDL khi xuất dữ liệu
+EXPORT_BATCH = 1000
+ALL_ROLES = ('admin', 'lecturer', 'student')
+
+
+class Resource:
+    # fields: tên trường -> cột; build(user, columns) trả về câu SELECT đã giới hạn theo quyền
+    def __init__(self, model, fields, build, filters=(), roles=ALL_ROLES):
+        self.model = model
+        self.fields = fields
+        self.build = build
+        self.filters = filters
+        self.roles = roles
+
+
+def _students(user, columns):
+    return db.select(*columns).select_from(Student)
+
+
+def _courses(user, columns):
+    return db.select(*columns).select_from(Course)
+
+
+def _grades(user, columns):
+    query = db.select(*columns).select_from(Grade)\
+        .join(Student, Student.id == Grade.student_id)\
+        .join(Course, Course.id == Grade.course_id)
+    if user.role == 'student':
+        # Sinh viên chỉ thấy điểm đã xác nhận của mình
+        student_id = user.student.id if user.student else None
+        query = query.where(Grade.student_id == student_id, Grade.status == 'confirmed')
+    elif user.role == 'lecturer':
+        query = query.where(Grade.course_id.in_(user.course_ids))
+    return query
+
+
+def _payments(user, columns):
+    query = db.select(*columns).select_from(Payment).join(Student, Student.id == Payment.student_id)
+    if user.role == 'student':
+        query = query.where(Payment.student_id == (user.student.id if user.student else None))
+    return query
+
+
+def _schedules(user, columns):
+    query = db.select(*columns).select_from(Schedule).outerjoin(Course, Course.id == Schedule.course_id)
+    if user.role == 'student':
+        query = query.where(Schedule.class_id == (user.student.class_id if user.student else None))
+    elif user.role == 'lecturer':
+        query = query.where(Course.lecturer == user.username)
+    return query
+
+
+RESOURCES = {
+    'students': Resource(Student, {
+        'id': Student.id,
+        'student_id': Student.student_id,
+        'full_name': Student.full_name,
+        'dob': Student.dob,
+        'email': Student.email,
+        'class_id': Student.class_id,
+    }, _students, filters=('class_id',), roles=('admin', 'lecturer')),
+    'courses': Resource(Course, {
+        'id': Course.id,
+        'code': Course.code,
+        'name': Course.name,
+        'credits': Course.credits,
+        'lecturer': Course.lecturer,
+        'capacity': Course.capacity,
+    }, _courses, filters=('lecturer',)),
+    'grades': Resource(Grade, {
+        'id': Grade.id,
+        'student_id': Grade.student_id,
+        'student_code': Student.student_id,
+        'course_id': Grade.course_id,
+        'course_code': Course.code,
+        'value': Grade.value,
+        'status': Grade.status,
+        'submitted_by': Grade.submitted_by,
+        'submitted_at': Grade.submitted_at,
+        'confirmed_by': Grade.confirmed_by,
+        'confirmed_at': Grade.confirmed_at,
+    }, _grades, filters=('course_id', 'student_id', 'status')),
+    'payments': Resource(Payment, {
+        'id': Payment.id,
+        'student_id': Payment.student_id,
+        'student_code': Student.student_id,
+        'amount': Payment.amount,
+        'status': Payment.status,
+        'payment_date': Payment.payment_date,
+        'note': Payment.note,
+    }, _payments, filters=('student_id', 'status'), roles=('admin', 'student')),
+    'schedules': Resource(Schedule, {
+        'id': Schedule.id,
+        'course_id': Schedule.course_id,
+        'course_code': Course.code,
+        'class_id': Schedule.class_id,
+        'day_of_week': Schedule.day_of_week,
+        'start_time': Schedule.start_time,
+        'end_time': Schedule.end_time,
+        'room': Schedule.room,
+        'semester': Schedule.semester,
+        'active': Schedule.active,
+    }, _schedules, filters=('class_id', 'course_id', 'semester')),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@bp.errorhandler(ApiError)
+def _api_error(e):
+    return jsonify({'error': e.message}), e.status
+
+
+def api_login_required(view):
+    # API trả JSON 401 thay vì chuyển hướng tới trang đăng nhập
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if identity.current() is None:
+            raise ApiError(401, 'Chưa đăng nhập')
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError(404, f'Không có tài nguyên {name}')
+    if identity.current().role not in resource.roles:
+        raise ApiError(403, 'Không có quyền truy cập')
+    return resource
+
+
+def _selected_fields(resource):
+    # ?fields=id,full_name chỉ lấy các cột được yêu cầu
+    names = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    unknown = [f for f in names if f not in resource.fields]
+    if unknown:
+        raise ApiError(400, f"Trường không hợp lệ: {', '.join(unknown)}")
+    return names or list(resource.fields)
+
+
+def _query(resource, names):
+    # Luôn lấy id để làm con trỏ phân trang, kể cả khi không được chọn
+    columns = [resource.fields['id'].label('id')] + [resource.fields[n].label(n) for n in names if n != 'id']
+    query = resource.build(identity.current(), columns)
+    for name in resource.filters:
+        value = request.args.get(name)
+        if value is not None:
+            query = query.where(resource.fields[name] == value)
+    return query.order_by(resource.model.id)
+
+
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _row(row, names):
+    mapping = row._mapping
+    return {n: _value(mapping[n]) for n in names}
+
+
+@bp.route('/<name>')
+@api_login_required
+def list_resource(name):
+    resource = _resource(name)
+    names = _selected_fields(resource)
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    query = _query(resource, names)
+    after = request.args.get('after', type=int)
+    if after:
+        query = query.where(resource.model.id > after)
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return jsonify({'items': [_row(r, names) for r in rows[:limit]], 'next_after': next_after})
+
+
+def _export_rows(query):
+    # yield_per: SQLite trả dữ liệu theo từng lô từ con trỏ, bộ nhớ không tăng theo số dòng
+    result = db.session.execute(query.execution_options(yield_per=EXPORT_BATCH))
+    for batch in result.partitions():
+        yield batch
+
+
+def _ndjson(query, names):
+    for batch in _export_rows(query):
+        yield ''.join(json.dumps(_row(r, names), ensure_ascii=False) + '\n' for r in batch)
+
+
+def _csv(query, names):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    yield buffer.getvalue()
+    for batch in _export_rows(query):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_value(r._mapping[n]) for n in names] for r in batch)
+        yield buffer.getvalue()
+
+
+@bp.route('/<name>/export')
+@api_login_required
+def export_resource(name):
+    resource = _resource(name)
+    names = _selected_fields(resource)
+    query = _query(resource, names)
+    if request.args.get('format', 'ndjson') == 'csv':
+        body, mimetype, extension = _csv(query, names), 'text/csv', 'csv'
+    else:
+        body, mimetype, extension = _ndjson(query, names), 'application/x-ndjson', 'ndjson'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{extension}'
+    return response
@@ -1,20 +1,58 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from models import db, User, Student, Course, Enrollment, Grade, Payment, News, Schedule, init_db
+import click
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response,
+                   stream_with_context)
+from models import db, User, Student, Course, CourseRegistration, Enrollment, Grade, Payment, News, init_db
+import api
+import auth
+import billing
+import catalogue
+import conflicts
+import dashboard_cache
+import database
+import identity
+import instrumentation
+import jobs
+import migrations
+import registrations
+import schedules
+import transcript
+import write_queue
+from database import read_only
+from identity import login_required, role_required
+from queries import init_query_budget, student_grades
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sms_demo.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['QUERY_BUDGETS'] = {'dashboard': 8, 'courses': 9, 'grades': 8}
 app.secret_key = 'dev-secret-key'
 
-db.init_app(app)
+database.init_app(app, db)
+instrumentation.init_app(app)
+auth.init_app(app)
+init_query_budget(app)
+write_queue.init_app(app)
+dashboard_cache.init_app(app)
+jobs.init_app(app)
+billing.init_app(app)
+catalogue.init_app(app)
+registrations.init_app(app)
+schedules.init_app(app)
+app.register_blueprint(api.bp)
+migrations.init_app(app)
 
 @app.route('/', methods=['GET','POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        user = User.query.filter_by(username=username).first()
-        if user and user.password == password:
+        try:
+            user = auth.authenticate(username, password)
+        except auth.AuthBusy as e:
+            flash(str(e))
+            return render_template('login.html'), 503
+        if user:
+            session.clear()
+            session.regenerate()
             session['user_id'] = user.id
             session['role'] = user.role
             session['username'] = user.username
@@ -24,20 +62,22 @@ def login():
     return render_template('login.html')
 
 @app.route('/change_password', methods=['GET', 'POST'])
+@login_required
 def change_password():
-    if not require_login():
-        return redirect(url_for('login'))
     if request.method == 'POST':
-        user = User.query.get(session['user_id'])
+        user = User.query.get(identity.current().user_id)
         current_password = request.form['current_password']
         new_password = request.form['new_password']
-        if user.password == current_password:
-            user.password = new_password
-            db.session.commit()
-            flash('Password changed successfully')
-            return redirect(url_for('dashboard'))
-        else:
+        try:
+            if auth.verify_user_password(user, current_password):
+                auth.set_password(user, new_password)
+                db.session.commit()
+                flash('Password changed successfully')
+                return redirect(url_for('dashboard'))
             flash('Current password is incorrect')
+        except auth.AuthBusy as e:
+            flash(str(e))
+            return render_template('change_password.html'), 503
     return render_template('change_password.html')
 
 @app.route('/logout')
@@ -45,47 +85,305 @@ def logout():
     session.clear()
     return redirect(url_for('login'))
 
-def require_login():
-    return 'user_id' in session
+def week_owner(role, username):
+    # Lịch mặc định: sinh viên theo lớp, giảng viên theo mã giảng viên; admin ('all') chọn lớp
+    # hoặc giảng viên ở /schedule, trang chủ không dựng lịch toàn trường
+    if role == 'student':
+        return 'class', db.session.query(Student.class_id).filter(Student.student_id == username).scalar()
+    if role == 'lecturer':
+        return 'lecturer', username
+    return 'all', None
+
+def dashboard_context(role, username, version):
+    # Phần dùng chung cho mọi người dùng được cache riêng theo phiên bản dữ liệu
+    def shared():
+        return {
+            'stats': {
+                'students': Student.query.count(),
+                'courses': Course.query.count(),
+                'news': News.query.count()
+            },
+            'latest_news': [
+                {'title': n.title, 'content': n.content}
+                for n in News.query.order_by(News.id.desc()).limit(3)
+            ],
+        }
+    context = dict(dashboard_cache.get_cache(app).get_or_create(('shared', version), shared))
+    semester = schedules.current_semester()
+    kind, key = week_owner(role, username)
+    lessons = schedules.grid(semester).view(kind, key).flat() if semester and kind != 'all' else []
+    context.update(role=role, username=username, schedules=lessons, semester=semester, whole_school=kind == 'all')
+    return context
 
 @app.route('/dashboard')
+@login_required
+@read_only
 def dashboard():
-    if not require_login():
-        return redirect(url_for('login'))
-    role = session.get('role')
-    username = session.get('username')
-    stats = {
-        'students': Student.query.count(),
-        'courses': Course.query.count(),
-        'news': News.query.count()
-    }
-    latest_news = News.query.order_by(News.id.desc()).limit(3).all()
-    schedules = []
-    if role == 'lecturer':
-        lecturer_courses = Course.query.filter_by(lecturer=username).all()
-        course_ids = [c.id for c in lecturer_courses]
-        schedules = Schedule.query.filter(Schedule.course_id.in_(course_ids)).all()
-    elif role == 'student':
-        schedules = Schedule.query.all()
-    else:
-        schedules = Schedule.query.all()
-    schedules.sort(key=lambda x: (x.day_of_week, x.start_time))
-    return render_template('dashboard.html',
-                         role=role,
-                         username=username,
-                         stats=stats,
-                         latest_news=latest_news,
-                         schedules=schedules)
+    role = identity.current().role
+    username = identity.current().username
+    version, changed_at = dashboard_cache.data_version()
+    # Còn thông báo flash chưa hiển thị thì render trực tiếp, không đọc/ghi cache
+    if session.get('_flashes'):
+        return render_template('dashboard.html', **dashboard_context(role, username, version))
+    page = dashboard_cache.get_cache(app).get_or_create(
+        ('page', role, username, version),
+        lambda: dashboard_cache.CachedPage(
+            render_template('dashboard.html', **dashboard_context(role, username, version)),
+            changed_at
+        )
+    )
+    response = make_response(page.html)
+    response.set_etag(page.etag)
+    response.last_modified = page.last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/students')
+@login_required
+@read_only
 def students():
-    if not require_login(): return redirect(url_for('login'))
-    students = Student.query.all()
-    return render_template('students.html', students=students)
+    import directory
+    q = request.args.get('q', '').strip()
+    class_id = request.args.get('class_id', type=int)
+    students, next_after = directory.student_page(
+        q=q,
+        class_id=class_id,
+        after_id=request.args.get('after', type=int),
+        limit=min(max(request.args.get('limit', directory.PAGE_SIZE, type=int), 1), directory.MAX_PAGE_SIZE)
+    )
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'items': [directory.serialize(s) for s in students],
+            'next_after': next_after
+        })
+    return render_template('students.html',
+                         students=students,
+                         next_after=next_after,
+                         q=q,
+                         class_id=class_id,
+                         classes=directory.class_choices())
+
+@app.cli.command('db-upgrade')
+def db_upgrade():
+    applied = migrations.upgrade()
+    for name in applied:
+        print(f"Đã áp dụng migration {name}")
+    print(f"Schema ở phiên bản {migrations.current_version()}")
+
+@app.cli.command('seed-demo')
+@click.confirmation_option(prompt='Xóa toàn bộ dữ liệu hiện có và tạo dữ liệu mẫu?')
+def seed_demo():
+    init_db()
+
+@app.cli.command('jobs-worker')
+@click.option('--once', is_flag=True, help='Chạy hết các việc đang chờ rồi thoát')
+def jobs_worker(once):
+    # Worker chạy trong tiến trình riêng (đặt JOBS_WORKERS = 0 cho tiến trình web)
+    runner = jobs.get_runner(app)
+    with app.app_context():
+        jobs.requeue_stale(runner.stale_after)
+    if once:
+        while runner.run_next():
+            pass
+        return
+    runner.run_forever()
+
+@app.cli.command('approve-registrations')
+@click.option('--semester', required=True, help='Học kỳ, ví dụ HK1-2025')
+@click.option('--max-credits', type=int, help='Số tín chỉ tối đa mỗi sinh viên (mặc định REGISTRATION_MAX_CREDITS)')
+def approve_registrations(semester, max_credits):
+    result = registrations.approve_semester(semester, max_credits)
+    print(f"Học kỳ {semester}: duyệt {result['approved']}/{result['processed']} phiếu ({result['seconds']:.2f}s)")
+    for reason, count in sorted(result['rejected'].items()):
+        print(f"  Từ chối - {reason}: {count}")
+
+@app.cli.command('rollover-semester')
+@click.option('--source', required=True, help='Học kỳ nguồn, ví dụ HK1-2025')
+@click.option('--target', required=True, help='Học kỳ mới, ví dụ HK2-2025')
+@click.option('--exams', is_flag=True, help='Sao chép cả lịch thi, dời theo số ngày giữa hai học kỳ')
+@click.option('--exam-offset-days', type=int, help='Số ngày dời lịch thi (mặc định suy ra từ tên học kỳ)')
+@click.option('--dry-run', is_flag=True, help='Chỉ xem trước, không ghi vào CSDL')
+def rollover_semester(source, target, exams, exam_offset_days, dry_run):
+    import time
+    import rollover
+    started = time.perf_counter()
+    if dry_run:
+        preview = rollover.diff(source, target, exams)
+        for table, counts in preview['tables'].items():
+            print(f"{table}: nguồn {counts['source']}, đã có {counts['existing']}, sẽ thêm {counts['new']}"
+                  f" (đích hiện có {counts['target']})")
+        for class_code, course_code in preview['sample']:
+            print(f"  + {class_code} - {course_code}")
+        return
+    try:
+        result = rollover.rollover(source, target, exams, exam_offset_days)
+    except rollover.RolloverError as e:
+        raise SystemExit(str(e))
+    for table, count in result['inserted'].items():
+        print(f"{table}: thêm {count}")
+    print(f"Xong ({time.perf_counter() - started:.2f}s)")
+
+@app.cli.command('generate-tuition')
+@click.option('--semester', required=True, help='Học kỳ, ví dụ HK1-2025')
+@click.option('--rate', type=float, help='Đơn giá một tín chỉ (mặc định TUITION_RATE_PER_CREDIT)')
+def generate_tuition(semester, rate):
+    import time
+    started = time.perf_counter()
+    result = billing.generate_invoices(semester, rate)
+    print(f"Học kỳ {semester}: {result['invoices']} hóa đơn, ghi {result['written']}, "
+          f"bỏ {result['removed']} ({time.perf_counter() - started:.2f}s)")
+    for status, totals in sorted(result['by_status'].items()):
+        print(f"  {status}: {totals['count']} phiếu, {totals['amount']:,.0f}")
+
+@app.cli.command('exempt-tuition')
+@click.argument('student_code')
+@click.option('--semester', help='Chỉ miễn học kỳ này (mặc định: mọi học kỳ)')
+@click.option('--reason')
+def exempt_tuition(student_code, semester, reason):
+    student = Student.query.filter_by(student_id=student_code).first()
+    if student is None:
+        raise click.BadParameter(f'Không có sinh viên {student_code}')
+    billing.exempt(student, semester, reason)
+    print(f"Đã miễn học phí cho {student_code}")
+
+@app.cli.command('analytics-report')
+@click.option('--repeat', default=3, show_default=True, help='Số lần tính lại để đo thời gian')
+def analytics_report(repeat):
+    import analytics
+    for _ in range(repeat):
+        report = analytics.build_report()
+        print(f"{report.grades} điểm: đọc {report.load_seconds:.2f}s, tính {report.compute_seconds:.3f}s")
+    summary = report.summary()
+    if summary:
+        print(f"Trung bình {summary['mean']:.2f}, trung vị {summary['median']:.2f}, "
+              f"độ lệch chuẩn {summary['std']:.2f}, tỉ lệ đạt {summary['pass_rate']:.1%}")
+    for row in report.rows('semester'):
+        print(f"  {row['key']}: {row['count']} điểm, trung bình {row['mean']:.2f}, đạt {row['pass_rate']:.1%}")
+
+@app.cli.command('rebuild-student-index')
+def rebuild_student_index():
+    import directory
+    directory.rebuild_fts()
+    print("Đã xây dựng lại chỉ mục tìm kiếm sinh viên")
+
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    # Chạy trên CSDL thử nghiệm đã nạp dữ liệu lớn, trả về mã lỗi nếu có truy vấn quét toàn bảng
+    import queryplan
+    problems = queryplan.check_route_plans(app)
+    queryplan.print_problems(problems)
+    if problems:
+        raise SystemExit(f"{len(problems)} truy vấn quét toàn bảng")
+    print("Không có truy vấn nào quét toàn bảng")
+
+@app.cli.command('rebuild-transcripts')
+def rebuild_transcripts():
+    transcript.rebuild()
+    print("Đã dựng lại bảng điểm tổng hợp")
+
+@app.cli.command('schedule-exams')
+@click.option('--semester', required=True, help='Học kỳ, ví dụ HK1-2025')
+@click.option('--midterm', help='Khoảng ngày thi giữa kỳ, dạng 2025-10-20:2025-10-31')
+@click.option('--final', help='Khoảng ngày thi cuối kỳ, dạng 2025-12-15:2025-12-27')
+@click.option('--rooms', help='Phòng thi và sức chứa, dạng B101:60,B201:80 (mặc định: các phòng trong thời khóa biểu)')
+@click.option('--dry-run', is_flag=True, help='Chỉ xếp thử, không ghi vào CSDL')
+def schedule_exams(semester, midterm, final, rooms, dry_run):
+    import time
+    import exam_scheduler
+    windows = {}
+    if midterm:
+        windows['midterm'] = exam_scheduler.parse_window(midterm)
+    if final:
+        windows['final'] = exam_scheduler.parse_window(final)
+    if not windows:
+        raise click.UsageError('Cần ít nhất một trong --midterm hoặc --final')
+    started = time.perf_counter()
+    plan = exam_scheduler.plan_exams(semester, windows, rooms=exam_scheduler.parse_rooms(rooms) if rooms else None)
+    elapsed = time.perf_counter() - started
+    print(f"Đã xếp {len(plan.exams)} ca thi, không xếp được {len(plan.unscheduled)} ({elapsed:.2f}s)")
+    for item in plan.unscheduled[:20]:
+        print(f"  lớp {item['class_id']} - môn {item['course_id']}: {item['reason']}")
+    if dry_run:
+        return
+    exam_scheduler.save_plan(plan, windows)
+    clashes = [c for c in conflicts.timetable(semester).report() if c['type'] == 'exam']
+    print(f"Đã lưu lịch thi học kỳ {semester}, số xung đột: {len(clashes)}")
+
+@app.cli.command('enroll-load-test')
+@click.option('--students', default=2000, show_default=True)
+@click.option('--capacity', default=100, show_default=True)
+@click.option('--threads', default=32, show_default=True)
+@click.option('--attempts', default=2, show_default=True, help='Số lần mỗi sinh viên bấm đăng ký')
+def enroll_load_test(students, capacity, threads, attempts):
+    import enrollment
+    result = enrollment.load_test(app, students=students, capacity=capacity, threads=threads, attempts=attempts)
+    for key, value in result.items():
+        print(f"{key}: {value}")
+    if not result['ok']:
+        raise SystemExit("Sai số lượng đăng ký dưới tải đồng thời")
+
+@app.cli.command('seed-large')
+@click.option('--students', type=int, help='Số sinh viên (mặc định 100000)')
+@click.option('--classes', type=int, help='Số lớp')
+@click.option('--courses', type=int, help='Số môn học')
+@click.option('--lecturers', type=int, help='Số giảng viên')
+@click.option('--semesters', type=int, help='Số học kỳ')
+@click.option('--courses-per-semester', type=int, help='Số môn mỗi lớp học trong một học kỳ')
+@click.option('--payments-per-student', type=int, help='Số phiếu thu mỗi sinh viên')
+@click.option('--registrations-per-student', type=int, help='Số phiếu đăng ký môn chờ duyệt mỗi sinh viên')
+@click.option('--seed', type=int, help='Hạt giống ngẫu nhiên')
+def seed_large(**options):
+    # Xóa toàn bộ dữ liệu hiện có rồi sinh dữ liệu lớn bằng bulk insert
+    import datagen
+    counts = datagen.generate(**options)
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+
+@app.cli.command('bench')
+@click.option('--iterations', default=20, show_default=True)
+@click.option('--baseline', 'baseline_path', default='bench_baseline.json', show_default=True)
+@click.option('--save-baseline', is_flag=True, help='Ghi kết quả lần chạy này làm baseline')
+def bench_routes(iterations, baseline_path, save_baseline):
+    import bench
+    results = bench.run(app, iterations=iterations)
+    baseline = bench.load_baseline(baseline_path)
+    bench.print_report(results, baseline)
+    if save_baseline:
+        bench.save_baseline(baseline_path, results)
+        print(f"Đã lưu baseline vào {baseline_path}")
+        return
+    regressions = bench.compare(results, baseline)
+    for key, metric, before, after in regressions:
+        print(f"SUY GIẢM {key} {metric}: {before} -> {after}")
+    if regressions:
+        raise SystemExit(1)
+
+@app.cli.command('bench-login')
+@click.option('--method', type=click.Choice(['scrypt', 'pbkdf2_sha256']), default='scrypt', show_default=True)
+@click.option('--costs', default='4096,16384,32768', show_default=True,
+              help='Các mức chi phí: n của scrypt hoặc số vòng lặp của PBKDF2')
+@click.option('--logins', default=200, show_default=True)
+@click.option('--threads', default=16, show_default=True)
+def bench_login(method, costs, logins, threads):
+    import bench
+    results = bench.run_logins(app, method=method, costs=[int(c) for c in costs.split(',')],
+                               logins=logins, threads=threads)
+    bench.print_login_report(results)
+
+@app.cli.command('bench-concurrency')
+@click.option('--workers', default='1,4,16', show_default=True, help='Các mức số luồng đồng thời')
+@click.option('--operations', default=200, show_default=True, help='Số thao tác mỗi luồng')
+@click.option('--write-every', default=5, show_default=True, help='Cứ N thao tác có một transaction ghi')
+def bench_concurrency(workers, operations, write_every):
+    import bench
+    results = bench.run_concurrency(app, workers=[int(w) for w in workers.split(',')],
+                                    operations=operations, write_every=write_every)
+    bench.print_concurrency_report(results)
 
 @app.route('/students/new', methods=['GET','POST'])
+@login_required
 def student_new():
-    if not require_login(): return redirect(url_for('login'))
     if request.method == 'POST':
         s = Student(
             student_id=request.form['student_id'],
@@ -99,8 +397,8 @@ def student_new():
     return render_template('student_form.html', student=None)
 
 @app.route('/students/<int:sid>/edit', methods=['GET','POST'])
+@login_required
 def student_edit(sid):
-    if not require_login(): return redirect(url_for('login'))
     s = Student.query.get_or_404(sid)
     if request.method == 'POST':
         s.student_id = request.form['student_id']
@@ -112,122 +410,115 @@ def student_edit(sid):
     return render_template('student_form.html', student=s)
 
 @app.route('/students/<int:sid>/delete', methods=['POST'])
+@login_required
 def student_delete(sid):
-    if not require_login(): return redirect(url_for('login'))
     s = Student.query.get_or_404(sid)
-    db.session.delete(s)
-    db.session.commit()
+    # Xóa dây chuyền điểm/đăng ký/học phí chạy nền, request trả về ngay
+    job = jobs.enqueue('delete_students', created_by=identity.current().username, student_ids=[s.id])
+    flash(f'Đang xóa sinh viên {s.student_id} (công việc #{job.id})')
     return redirect(url_for('students'))
 
 @app.route('/courses', methods=['GET', 'POST'])
+@login_required
 def courses():
-    if not require_login():
-        return redirect(url_for('login'))
-    if request.method == 'POST' and session.get('role') == 'admin':
+    import enrollment
+    user = identity.current()
+    if request.method == 'POST' and user.role == 'admin':
         code = request.form['code']
         name = request.form['name']
         credits = int(request.form['credits'])
         lecturer = request.form['lecturer']
+        capacity = request.form.get('capacity', type=int)
         if Course.query.filter_by(code=code).first():
             flash('Mã môn học đã tồn tại, vui lòng nhập mã khác!', 'danger')
         else:
-            c = Course(code=code, name=name, credits=credits, lecturer=lecturer)
+            c = Course(code=code, name=name, credits=credits, lecturer=lecturer, capacity=capacity)
             db.session.add(c)
             db.session.commit()
             flash('Thêm môn học thành công!', 'success')
 
-    all_courses = Course.query.all()
-    lecturers = list({c.lecturer for c in all_courses if c.lecturer})
-
-    # Lấy danh sách giảng viên đã chọn từ request
-    selected_lecturers = request.args.getlist('lecturer[]')
+    # Lọc, đếm facet và phân trang đều làm trong SQL; facet được cache tới khi Course/ClassCourse đổi
+    filters = catalogue.filters_from(request.args)
+    limit = min(max(request.args.get('limit', catalogue.PAGE_SIZE, type=int), 1), catalogue.MAX_PAGE_SIZE)
+    rows, next_after = catalogue.course_page(filters, request.args.get('after', type=int), limit)
+    facets = catalogue.facets(filters)
 
-    # Lọc các môn học theo giảng viên đã chọn
-    if selected_lecturers:
-        filtered_courses = [c for c in all_courses if c.lecturer in selected_lecturers]
-        other_courses = [c for c in all_courses if c.lecturer not in selected_lecturers]
-    else:
-        filtered_courses = all_courses
-        other_courses = []
+    enrolled_course_ids = set()
+    if user.student:
+        enrolled_course_ids = catalogue.enrolled_ids(user.student.id, [c.id for c in rows])
 
-    enrolled_course_ids = []
-    if session.get('role') == 'student':
-        student = Student.query.filter_by(student_id=session['username']).first()
-        if student:
-            enrolled_course_ids = [e.course_id for e in Enrollment.query.filter_by(student_id=student.id).all()]
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'courses': [catalogue.serialize(c) for c in rows],
+            'next_after': next_after,
+            'total': facets['total'],
+            'facets': {'lecturers': facets['lecturers'], 'credits': facets['credits']},
+        })
 
     return render_template(
         'courses.html',
-        lecturers=lecturers,
-        selected_lecturers=selected_lecturers,
-        filtered_courses=filtered_courses,
-        other_courses=other_courses,
-        all_courses=all_courses,
+        seats=enrollment.seat_counts([c.id for c in rows if c.capacity]),
+        courses=rows,
+        next_after=next_after,
+        filters=filters,
+        facets=facets,
+        choices=catalogue.choices(),
         enrolled_course_ids=enrolled_course_ids
     )
 
 @app.route('/enroll', methods=['POST'])
+@role_required('student')
 def enroll():
-    if not require_login() or session.get('role') != 'student':
-        return redirect(url_for('login'))
+    import enrollment
     course_id = int(request.form['course_id'])
-    student = Student.query.filter_by(student_id=session['username']).first()
+    student = identity.current().student
     if not student:
         flash('Không tìm thấy sinh viên')
         return redirect(url_for('courses'))
-    exist = Enrollment.query.filter_by(student_id=student.id, course_id=course_id).first()
-    if exist:
-        flash('Bạn đã đăng ký môn học này')
-    else:
-        enrollment = Enrollment(student_id=student.id, course_id=course_id)
-        db.session.add(enrollment)
-        db.session.commit()
-        flash('Đăng ký môn học thành công')
+    result = enrollment.enroll(app, student.id, course_id)
+    flash(enrollment.MESSAGES[result])
     return redirect(url_for('courses'))
 
 @app.route('/unenroll', methods=['POST'])
+@role_required('student')
 def unenroll():
-    if not require_login() or session.get('role') != 'student':
-        return redirect(url_for('login'))
+    import enrollment
     course_id = int(request.form['course_id'])
-    student = Student.query.filter_by(student_id=session['username']).first()
-    enrollment = Enrollment.query.filter_by(student_id=student.id, course_id=course_id).first()
-    if enrollment:
-        db.session.delete(enrollment)
-        db.session.commit()
+    student = identity.current().student
+    if not student:
+        flash('Không tìm thấy sinh viên')
+        return redirect(url_for('courses'))
+    result = enrollment.unenroll(app, student.id, course_id)
+    if result in (enrollment.BUSY, enrollment.PENDING):
+        flash(enrollment.MESSAGES[result])
+    elif result:
         flash('Hủy đăng ký thành công')
     else:
         flash('Bạn chưa đăng ký môn này')
     return redirect(url_for('courses'))
 
 @app.route('/my_courses')
+@role_required('student')
 def my_courses():
-    if not require_login() or session.get('role') != 'student':
-        return redirect(url_for('login'))
-    student = Student.query.filter_by(student_id=session['username']).first()
-    enrollments = Enrollment.query.filter_by(student_id=student.id).all()
-    courses = [Course.query.get(e.course_id) for e in enrollments]
+    student = identity.current().student
+    courses = Course.query.join(Enrollment, Enrollment.course_id == Course.id)\
+        .filter(Enrollment.student_id == student.id)\
+        .order_by(Enrollment.id)\
+        .all() if student else []
     return render_template('my_courses.html', courses=courses)
 
 @app.route('/grades', methods=['GET','POST'])
+@login_required
 def grades():
-    if not require_login():
-        return redirect(url_for('login'))
-    role = session.get('role')
-    username = session.get('username')
+    import grading
+    user = identity.current()
+    role = user.role
+    username = user.username
     if role == 'student':
-        student = Student.query.filter_by(student_id=username).first()
+        student = user.student
         if student:
-            grades = db.session.query(Grade, Course)\
-                .join(Course, Grade.course_id == Course.id)\
-                .filter(Grade.student_id == student.id, Grade.status == 'confirmed')\
-                .all()
-            formatted_grades = []
-            for grade, course in grades:
-                grade.course = course
-                formatted_grades.append(grade)
             return render_template('grades.html', 
-                                grades=formatted_grades,
+                                grades=student_grades(student.id),
                                 role=role,
                                 student=student)
         return redirect(url_for('dashboard'))
@@ -235,17 +526,18 @@ def grades():
     if role == 'lecturer':
         courses = Course.query.filter_by(lecturer=username).all()
     elif role == 'admin':
-        courses = Course.query.all()
-    students = Student.query.all()
+        courses = Course.query.order_by(Course.code).all()
     if request.method == 'POST':
         if role == 'lecturer':
-            student_id = int(request.form['student_id'])
+            student_code = request.form.get('student_code', '').strip()
+            student = Student.query.filter_by(student_id=student_code).first() if student_code else None
             course_id = int(request.form['course_id'])
-            course = Course.query.get(course_id)
-            if course and course.lecturer == username:
+            if student is None:
+                flash(f'Không tìm thấy sinh viên {student_code}')
+            elif user.owns_course(course_id):
                 value = float(request.form['grade'])
                 g = Grade(
-                    student_id=student_id,
+                    student_id=student.id,
                     course_id=course_id,
                     value=value,
                     status='pending',
@@ -259,57 +551,235 @@ def grades():
                 flash('Bạn không có quyền nhập điểm cho môn học này')
         elif role == 'admin' and 'confirm_grade' in request.form:
             grade_id = int(request.form['grade_id'])
-            grade = Grade.query.get(grade_id)
-            if grade and grade.status == 'pending':
-                grade.status = 'confirmed'
-                grade.confirmed_by = username
-                grade.confirmed_at = db.func.current_timestamp()
-                db.session.commit()
+            if grading.confirm_grades(username, grade_ids=[grade_id])['confirmed']:
                 flash('Đã xác nhận điểm')
             else:
                 flash('Không thể xác nhận điểm này')
-        return redirect(url_for('grades'))
+        return redirect(url_for('grades', **request.args))
     if role == 'lecturer':
-        course_ids = [c.id for c in courses]
-        grades = db.session.query(Grade, Student, Course)\
-            .join(Student, Grade.student_id == Student.id)\
-            .join(Course, Grade.course_id == Course.id)\
-            .filter(Grade.course_id.in_(course_ids))\
-            .all()
-    else:
-        grades = db.session.query(Grade, Student, Course)\
-            .join(Student, Grade.student_id == Student.id)\
-            .join(Course, Grade.course_id == Course.id)\
-            .all()
-    formatted_grades = []
-    for grade, student, course in grades:
-        grade.student = student
-        grade.course = course
-        formatted_grades.append(grade)
+        grades, next_after = grading.course_grades_page([c.id for c in courses], request.args.get('after', type=int))
+        return render_template('grades.html',
+                             grades=grades,
+                             next_after=next_after,
+                             courses=courses,
+                             role=role,
+                             username=username)
+    # Admin chỉ xem điểm đang chờ xác nhận, phân trang theo Grade.id
+    filters = grading.filters_from(request.args)
+    grades, next_after = grading.pending_page(request.args.get('after', type=int), **filters)
     return render_template('grades.html',
-                         grades=formatted_grades,
-                         students=students,
+                         grades=grades,
+                         next_after=next_after,
+                         pending_total=grading.pending_count(**filters),
+                         filters=filters,
+                         semesters=grading.semester_choices(),
                          courses=courses,
                          role=role,
                          username=username)
 
+@app.route('/grades/confirm', methods=['POST'])
+@role_required('admin')
+def grades_confirm():
+    import grading
+    if request.is_json:
+        try:
+            filters = grading.filters_from_json(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        filters = grading.filters_from(request.form)
+        # "Xác nhận các điểm đã chọn" chỉ áp dụng cho các ô được tích, "theo bộ lọc" thì bỏ qua ô tích
+        if request.form.get('scope') == 'filter':
+            filters['grade_ids'] = None
+        elif filters['grade_ids'] is None:
+            filters['grade_ids'] = []
+    try:
+        result = grading.confirm_grades(identity.current().username, **filters)
+    except ValueError as e:
+        if request.is_json:
+            return jsonify({'error': str(e)}), 400
+        flash(str(e))
+        return redirect(url_for('grades'))
+    if request.is_json:
+        return jsonify(result)
+    flash(f"Đã xác nhận {result['confirmed']} điểm")
+    return redirect(url_for('grades', **{k: v for k, v in filters.items() if v and k != 'grade_ids'}))
+
+@app.route('/grades/import', methods=['POST'])
+@role_required('lecturer')
+def grades_import():
+    import grading
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Vui lòng chọn file CSV')
+        return redirect(url_for('grades'))
+    report = grading.import_grades(upload.stream, identity.current().username)
+    if request.args.get('format') == 'json':
+        return jsonify(report.to_dict())
+    return render_template('grade_import.html', report=report)
+
+@app.route('/transcript')
+@login_required
+def transcript_view():
+    if identity.current().role == 'student':
+        student = identity.current().student
+    else:
+        student = Student.query.filter_by(student_id=request.args.get('student_id', '')).first()
+    if not student:
+        flash('Không tìm thấy sinh viên')
+        return redirect(url_for('dashboard'))
+    semesters = transcript.semesters_for(student.id)
+    return render_template('transcript.html',
+                         student=student,
+                         semesters=[s for s in semesters if s.semester != transcript.CUMULATIVE],
+                         cumulative=next((s for s in semesters if s.semester == transcript.CUMULATIVE), None),
+                         courses=transcript.courses_for(student.id))
+
+@app.route('/ranking')
+@role_required('admin', 'lecturer')
+def ranking():
+    import grading
+    semester = request.args.get('semester') or transcript.CUMULATIVE
+    page = max(request.args.get('page', 1, type=int), 1)
+    rows, has_next = transcript.ranking_page(semester, page)
+    return render_template('ranking.html',
+                         rows=rows,
+                         semester=semester,
+                         semesters=grading.semester_choices(),
+                         cumulative=transcript.CUMULATIVE,
+                         page=page,
+                         has_next=has_next,
+                         offset=(page - 1) * transcript.RANKING_PAGE_SIZE)
+
+@app.route('/analytics')
+@role_required('admin', 'lecturer')
+def analytics_view():
+    import analytics
+    user = identity.current()
+    report = analytics.get_report()
+    # Giảng viên chỉ xem các môn mình dạy
+    course_keys = user.course_ids if user.role == 'lecturer' else None
+    course_id = request.args.get('course_id', type=int)
+    if course_id is not None and course_keys is not None and course_id not in course_keys:
+        course_id = None
+    data = {
+        'grades': report.grades,
+        'summary': report.summary(),
+        'courses': report.rows('course', keys=course_keys),
+        'classes': report.rows('class') if user.role == 'admin' else [],
+        'semesters': report.rows('semester') if user.role == 'admin' else [],
+        'class_comparison': report.class_comparison(course_id) if course_id is not None else [],
+    }
+    if request.args.get('format') == 'json':
+        return jsonify(data)
+    course_labels, class_labels = analytics.labels()
+    return render_template('analytics.html', course_id=course_id, course_labels=course_labels,
+                           class_labels=class_labels, percentiles=analytics.PERCENTILES, **data)
+
+@app.route('/schedule')
+@login_required
+@read_only
+def schedule_detail():
+    import grading
+    user = identity.current()
+    semester = request.args.get('semester') or schedules.current_semester()
+    kind, key = week_owner(user.role, user.username)
+    # Giảng viên và admin xem được lịch của lớp bất kỳ; admin xem được lịch của giảng viên khác
+    if user.role != 'student' and request.args.get('class_id', type=int):
+        kind, key = 'class', request.args.get('class_id', type=int)
+    elif user.role == 'admin' and request.args.get('lecturer'):
+        kind, key = 'lecturer', request.args.get('lecturer')
+    grid = schedules.grid(semester) if semester else None
+    # Toàn trường quá lớn cho một trang: admin chọn lớp hoặc giảng viên trước
+    view = grid.view(kind, key) if grid and kind != 'all' else schedules.WeekView([], [], None)
+    days, rows = view.grid()
+    return render_template(
+        'schedule_detail.html',
+        semester=semester,
+        semesters=grading.semester_choices(),
+        day_names=schedules.DAYS,
+        days=days,
+        rows=rows,
+        exams=view.exams,
+        kind=kind,
+        key=key,
+        classes=sorted(grid.class_names.items(), key=lambda item: item[1] or '') if grid else [],
+        feed_url=url_for('calendar_feed', token=schedules.feed_token(kind, key), _external=True) if kind != 'all' else None,
+    )
+
+@app.route('/calendar/<token>.ics')
+def calendar_feed(token):
+    # Không cần đăng nhập: đường dẫn đã ký là quyền xem. Ứng dụng lịch hỏi lại định kỳ với
+    # If-None-Match nên phần lớn các lần chỉ nhận 304, không phải sinh lại file.
+    owner = schedules.feed_owner(token)
+    semester = request.args.get('semester') or schedules.current_semester()
+    if owner is None or owner[0] not in ('class', 'lecturer') or not semester:
+        return 'Không tìm thấy lịch', 404
+    grid = schedules.grid(semester)
+    view = grid.view(*owner)
+    name = f"Thời khóa biểu {grid.class_names.get(owner[1], owner[1]) if owner[0] == 'class' else owner[1]} - {semester}"
+    response = app.response_class(
+        stream_with_context(schedules.ics_lines(view, semester, name, request.host)),
+        mimetype='text/calendar',
+    )
+    response.set_etag(f'{semester}-{view.etag}')
+    response.last_modified = view.changed_at
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['CALENDAR_MAX_AGE']
+    return response.make_conditional(request)
+
+@app.route('/schedules/conflicts')
+@role_required('admin')
+def schedule_conflicts():
+    semester = request.args.get('semester', '')
+    found = conflicts.timetable(semester).report()
+    return jsonify({'semester': semester, 'count': len(found), 'conflicts': found})
+
+@app.route('/schedules/check', methods=['POST'])
+@role_required('admin')
+def schedule_check():
+    # Kiểm tra trùng lịch cho một Schedule/Exam dự kiến trước khi thêm
+    data = request.get_json(silent=True) or request.form
+    try:
+        # Khi sửa một lịch có sẵn: id (số nguyên) của chính lịch đó, không tính là trùng với nó
+        exclude_id = int(data['exclude_id']) if data.get('exclude_id') not in (None, '') else None
+        timetable = conflicts.timetable(data['semester'])
+        if data.get('kind') == 'exam':
+            found = timetable.check_exam(
+                int(data['class_id']), int(data['course_id']), data['exam_date'],
+                data['start_time'], int(data['duration']), data['room'],
+                exclude_id=exclude_id)
+        else:
+            found = timetable.check_schedule(
+                int(data['class_id']), int(data['course_id']), int(data['day_of_week']),
+                data['start_time'], data['end_time'], data['room'],
+                exclude_id=exclude_id)
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': f'Dữ liệu không hợp lệ: {e}'}), 400
+    return jsonify({'ok': not found, 'conflicts': found})
+
 @app.route('/payments', methods=['GET', 'POST'])
+@login_required
 def payments():
-    if not require_login(): 
-        return redirect(url_for('login'))
-
-    role = session.get('role')
+    import grading
+    import ledger
+    role = identity.current().role
 
     # --- Khi admin thêm phiếu mới ---
     if request.method == 'POST' and role == 'admin':
-        student_id = int(request.form['student_id'])
-        amount = float(request.form['amount'])
-        status = request.form['status']
+        # Nhập mã sinh viên (có gợi ý từ /students) thay vì chọn trong danh sách toàn bộ sinh viên
+        student_code = request.form.get('student_code', '').strip()
+        student = Student.query.filter_by(student_id=student_code).first() if student_code else None
+        if student is None:
+            flash(f"Không tìm thấy sinh viên {student_code}", "warning")
+        else:
+            amount = float(request.form['amount'])
+            status = request.form['status']
 
-        payment = Payment(student_id=student_id, amount=amount, status=status)
-        db.session.add(payment)
-        db.session.commit()
-        flash("Đã thêm khoản thanh toán mới", "success")
+            payment = Payment(student_id=student.id, amount=amount, status=status)
+            db.session.add(payment)
+            db.session.commit()
+            flash("Đã thêm khoản thanh toán mới", "success")
 
     # --- Khi sinh viên xác nhận đã nộp ---
     if request.args.get('action') == 'confirm' and role == 'student':
@@ -323,46 +793,123 @@ def payments():
             flash("Phiếu không hợp lệ hoặc đã xác nhận trước đó.", "warning")
 
     # --- Dữ liệu hiển thị ---
-    payments = Payment.query.all()
-    students = Student.query.all()
+    payments, next_after = ledger.payment_page(request.args.get('after', type=int))
+    semesters = grading.semester_choices() if role == 'admin' else []
 
     # --- Thống kê ---
-    total_paid = db.session.query(db.func.sum(Payment.amount)).filter(Payment.status == "paid").scalar() or 0
-    total_pending = db.session.query(db.func.sum(Payment.amount)).filter(Payment.status == "pending").scalar() or 0
-    total_withdrawn = db.session.query(db.func.sum(Payment.amount)).filter(Payment.status == "withdrawn").scalar() or 0
-    total_free = db.session.query(db.func.sum(Payment.amount)).filter(Payment.status == "free").scalar() or 0
-
-   
-    data = {
-    "khoan_phai_nop": total_pending,
-    "khoan_duoc_mien": total_free,
-    "khoan_da_nop": total_paid,
-    "khoan_da_rut": total_withdrawn,
-    "tong_no_chung": max(total_pending - total_paid, 0),
-    "tong_du_chung": total_paid - total_withdrawn,
-    "phieu_da_thu": total_paid,
-    "phieu_da_rut": total_withdrawn,
-    "phieu_hoa_don": 0
-}
+    data = ledger.summary()
 
     return render_template(
         'payments.html',
         payments=payments,
-        students=students,
+        next_after=next_after,
+        semesters=semesters,
+        rate=app.config['TUITION_RATE_PER_CREDIT'],
         data=data,
         role=role
     )
 
+@app.route('/payments/generate', methods=['POST'])
+@role_required('admin')
+def payments_generate():
+    semester = request.form.get('semester')
+    if not semester:
+        flash('Vui lòng chọn học kỳ', 'warning')
+        return redirect(url_for('payments'))
+    job = jobs.enqueue('generate_tuition', created_by=identity.current().username,
+                       semester=semester, rate=request.form.get('rate', type=float))
+    flash(f'Đang sinh hóa đơn học phí học kỳ {semester} (công việc #{job.id})', 'success')
+    return redirect(url_for('payments'))
+
 @app.route('/news', methods=['GET','POST'])
+@login_required
+@read_only
 def news():
-    if not require_login(): return redirect(url_for('login'))
     if request.method == 'POST':
         n = News(title=request.form['title'], content=request.form['content'])
         db.session.add(n); db.session.commit()
     items = News.query.order_by(News.id.desc()).all()
     return render_template('news.html', items=items)
 
+@app.route('/jobs')
+@role_required('admin')
+def job_list():
+    items = jobs.Job.query.order_by(jobs.Job.id.desc()).limit(50).all()
+    return render_template('jobs.html', items=items)
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = jobs.Job.query.get_or_404(job_id)
+    user = identity.current()
+    if user.role != 'admin' and job.created_by != user.username:
+        return jsonify({'error': 'Không có quyền truy cập'}), 403
+    return jsonify(jobs.serialize(job))
+
+@app.route('/transcripts/rebuild', methods=['POST'])
+@role_required('admin')
+def transcripts_rebuild():
+    job = jobs.enqueue('rebuild_transcripts', created_by=identity.current().username)
+    flash(f'Đã đưa việc dựng lại bảng điểm vào hàng đợi (công việc #{job.id})')
+    return redirect(url_for('job_list'))
+
+@app.route('/registrations')
+@role_required('admin')
+def registration_list():
+    semester = request.args.get('semester')
+    status = request.args.get('status', registrations.PENDING)
+    query = CourseRegistration.query.filter(CourseRegistration.TrangThai == status)
+    if semester:
+        query = query.filter(CourseRegistration.HocKy == semester)
+    items = query.order_by(CourseRegistration.MaDK.desc()).limit(100).all()
+    return render_template('registrations.html', summary=registrations.semester_summary(), items=items,
+                           semester=semester, status=status,
+                           statuses=[registrations.PENDING, registrations.APPROVED, registrations.REJECTED],
+                           max_credits=app.config['REGISTRATION_MAX_CREDITS'])
+
+@app.route('/registrations/approve', methods=['POST'])
+@role_required('admin')
+def registrations_approve():
+    semester = request.form.get('semester')
+    if not semester:
+        flash('Vui lòng chọn học kỳ', 'warning')
+        return redirect(url_for('registration_list'))
+    job = jobs.enqueue('approve_registrations', created_by=identity.current().username,
+                       semester=semester, max_credits=request.form.get('max_credits', type=int))
+    flash(f'Đang duyệt phiếu đăng ký học kỳ {semester} (công việc #{job.id})', 'success')
+    return redirect(url_for('registration_list', semester=semester))
+
+@app.route('/semesters/rollover', methods=['GET', 'POST'])
+@role_required('admin')
+def semester_rollover():
+    import grading
+    import rollover
+    source = request.values.get('source', '').strip()
+    target = request.values.get('target', '').strip()
+    include_exams = bool(request.values.get('exams'))
+    exam_offset_days = request.values.get('exam_offset_days', type=int)
+    if request.method == 'POST':
+        try:
+            result = rollover.rollover(source, target, include_exams, exam_offset_days)
+        except rollover.RolloverError as e:
+            flash(str(e), 'danger')
+        else:
+            inserted = result['inserted']
+            flash(f"Đã chuyển {source} sang {target}: {inserted['class_course']} lớp-môn, "
+                  f"{inserted['schedule']} lịch học" + (f", {inserted['exam']} lịch thi" if 'exam' in inserted else ''), 'success')
+            return redirect(url_for('semester_rollover', source=source, target=target, exams=include_exams or None))
+    # Chưa ghi gì: hiển thị trước các dòng sẽ được sao chép
+    preview = rollover.diff(source, target, include_exams) if source and target and source != target else None
+    return render_template('rollover.html', source=source, target=target, include_exams=include_exams,
+                           exam_offset_days=exam_offset_days if exam_offset_days is not None else
+                           (rollover.exam_offset(source, target) if source and target else None),
+                           semesters=grading.semester_choices(), preview=preview)
+
+@app.route('/metrics')
+def metrics():
+    # Định dạng văn bản của Prometheus; thời gian xử lý theo endpoint và số liệu SQL/template
+    return instrumentation.metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 if __name__ == '__main__':
-    with app.app_context():
-        init_db()
+    # Schema được tạo/nâng cấp trong migrations.init_app; dữ liệu mẫu: flask seed-demo
     app.run(debug=True)
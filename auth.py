@@ -0,0 +1,300 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from database import conflict_insert
+from models import db, User, UserSession
+
+# --- Băm mật khẩu ---
+# Định dạng lưu: scrypt$n$r$p$salt$hash hoặc pbkdf2_sha256$iterations$salt$hash (base64).
+# Các bản ghi cũ lưu mật khẩu thô được băm lại khi người dùng đăng nhập thành công.
+
+SCHEMES = ('scrypt', 'pbkdf2_sha256')
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode('ascii')
+
+
+def _hash_config():
+    config = current_app.config
+    if config['AUTH_HASH_METHOD'] == 'scrypt':
+        return ('scrypt', config['AUTH_SCRYPT_N'], config['AUTH_SCRYPT_R'], config['AUTH_SCRYPT_P'])
+    return ('pbkdf2_sha256', config['AUTH_PBKDF2_ITERATIONS'])
+
+
+def _derive(params, password, salt):
+    if params[0] == 'scrypt':
+        n, r, p = params[1:]
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r * p, dklen=64)
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, params[1])
+
+
+def hash_password(password, params=None):
+    params = params or _hash_config()
+    salt = os.urandom(16)
+    fields = [str(value) for value in params] + [_b64(salt), _b64(_derive(params, password, salt))]
+    return '$'.join(fields)
+
+
+def _parse(stored):
+    parts = stored.split('$')
+    if parts[0] == 'scrypt' and len(parts) == 6:
+        return ('scrypt', int(parts[1]), int(parts[2]), int(parts[3])), parts[4], parts[5]
+    if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+        return ('pbkdf2_sha256', int(parts[1])), parts[2], parts[3]
+    return None, None, None
+
+
+def check_password(stored, password):
+    params, salt, expected = _parse(stored or '')
+    if params is None:
+        # Mật khẩu thô từ dữ liệu cũ
+        return hmac.compare_digest((stored or '').encode('utf-8'), password.encode('utf-8'))
+    actual = _derive(params, password, base64.b64decode(salt))
+    return hmac.compare_digest(actual, base64.b64decode(expected))
+
+
+def needs_rehash(stored):
+    params, _, _ = _parse(stored or '')
+    return params != _hash_config()
+
+
+# --- Nhóm luồng băm có giới hạn ---
+
+class AuthBusy(Exception):
+    pass
+
+
+class HashPool:
+    # hashlib nhả GIL khi băm, nên vài luồng riêng cho việc băm giữ cho luồng xử lý
+    # request không bị chiếm trọn; số việc chờ bị giới hạn để đợt đăng nhập dồn dập
+    # được từ chối sớm thay vì xếp hàng vô hạn.
+    def __init__(self, workers=4, max_pending=64, timeout=10.0):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise AuthBusy('Hệ thống đang bận, vui lòng thử lại sau')
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Trả chỗ khi việc băm thật sự xong (hoặc bị hủy trước khi chạy), không phải khi request
+        # thôi chờ: việc quá hạn vẫn chạy trong executor và vẫn tính vào max_pending
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Quá hạn chờ: bỏ việc nếu chưa chạy, báo bận như khi hết chỗ chờ
+            future.cancel()
+            raise AuthBusy('Hệ thống đang bận, vui lòng thử lại sau')
+
+
+def _pool():
+    return current_app.extensions['hash_pool']
+
+
+def _dummy_hash():
+    # Băm giả cho tên đăng nhập không tồn tại, để thời gian phản hồi không lộ tài khoản
+    params = _hash_config()
+    cache = current_app.extensions.setdefault('dummy_hashes', {})
+    if params not in cache:
+        cache[params] = hash_password(secrets.token_hex(8), params)
+    return cache[params]
+
+
+def _store_hash(user_id, stored):
+    db.session.execute(db.update(User).where(User.id == user_id).values(password=stored))
+    db.session.commit()
+
+
+def authenticate(username, password):
+    user = User.query.filter_by(username=username).first()
+    stored = user.password if user else _dummy_hash()
+    if not _pool().run(check_password, stored, password) or user is None:
+        return None
+    if needs_rehash(user.password):
+        # Nâng cấp băm ngay khi biết mật khẩu đúng; ghi qua hàng đợi ghi, không chờ kết quả
+        import write_queue
+        rehashed = _pool().run(hash_password, password, _hash_config())
+        try:
+            write_queue.get_queue(current_app._get_current_object()).submit(_store_hash, user.id, rehashed)
+        except write_queue.WriteQueueBusy:
+            pass
+    return user
+
+
+def set_password(user, password):
+    user.password = _pool().run(hash_password, password, _hash_config())
+
+
+def verify_user_password(user, password):
+    return _pool().run(check_password, user.password, password)
+
+
+# --- Phiên làm việc lưu phía máy chủ ---
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.rotate = False
+
+    def regenerate(self):
+        # Đổi mã phiên sau khi đăng nhập để chống cố định phiên
+        self.rotate = True
+        self.modified = True
+
+
+class MemorySessionBackend:
+    # Thay thế Redis cục bộ: get/setex/delete có hết hạn, chỉ dùng trong một tiến trình
+    PURGE_EVERY = 1000
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, sid):
+        with self._lock:
+            item = self._items.get(sid)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._items[sid]
+                return None
+            return item[1]
+
+    def setex(self, sid, ttl, data):
+        with self._lock:
+            now = time.time()
+            self._items[sid] = (now + ttl, data)
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                # Phiên hết hạn mà không được đọc lại thì chỉ bị xóa ở đây
+                for key in [key for key, item in self._items.items() if item[0] < now]:
+                    del self._items[key]
+
+    def delete(self, sid):
+        with self._lock:
+            self._items.pop(sid, None)
+
+
+class SQLSessionBackend:
+    # Lưu phiên trong bảng user_session, dùng chung được giữa nhiều tiến trình
+    PURGE_EVERY = 1000
+
+    def __init__(self):
+        self._writes = 0
+
+    def _connect(self):
+        # Pool riêng của kho phiên (bind 'sessions', xem database.init_app): open_session/save_session
+        # chạy khi db.session của request vẫn giữ kết nối, lấy thêm từ cùng pool sẽ chờ vòng tròn
+        # khi pool cạn. Truy vấn phiên không tính vào giới hạn số truy vấn của view.
+        engine = db.engines.get('sessions', db.engine)
+        return engine.connect().execution_options(skip_query_budget=True)
+
+    def get(self, sid):
+        table = UserSession.__table__
+        with self._connect() as conn:
+            return conn.execute(
+                db.select(table.c.data).where(table.c.id == sid, table.c.expires_at > datetime.utcnow())
+            ).scalar()
+
+    def setex(self, sid, ttl, data):
+        table = UserSession.__table__
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        with self._connect() as conn, conn.begin():
+            insert = conflict_insert(table, conn.dialect.name)
+            conn.execute(insert.values(id=sid, data=data, expires_at=expires_at).on_conflict_do_update(
+                index_elements=['id'], set_={'data': data, 'expires_at': expires_at}
+            ))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                conn.execute(table.delete().where(table.c.expires_at <= datetime.utcnow()))
+
+    def delete(self, sid):
+        table = UserSession.__table__
+        with self._connect() as conn, conn.begin():
+            conn.execute(table.delete().where(table.c.id == sid))
+
+
+SESSION_BACKENDS = {
+    'sql': SQLSessionBackend,
+    'memory': MemorySessionBackend,
+}
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.backend.get(sid)
+            if data is not None:
+                return ServerSession(self.serializer.loads(data), sid=sid)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not self.should_set_cookie(app, session):
+            return
+        if session.rotate and not session.new:
+            self.backend.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+        self.backend.setex(session.sid, ttl, self.serializer.dumps(dict(session)))
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_app(app):
+    app.config.setdefault('AUTH_HASH_METHOD', 'scrypt')
+    app.config.setdefault('AUTH_SCRYPT_N', 2 ** 14)
+    app.config.setdefault('AUTH_SCRYPT_R', 8)
+    app.config.setdefault('AUTH_SCRYPT_P', 1)
+    app.config.setdefault('AUTH_PBKDF2_ITERATIONS', 600000)
+    app.config.setdefault('AUTH_HASH_WORKERS', min(4, os.cpu_count() or 1))
+    app.config.setdefault('AUTH_HASH_MAX_PENDING', 64)
+    app.config.setdefault('SESSION_BACKEND', 'sql')
+    app.extensions['hash_pool'] = HashPool(
+        workers=app.config['AUTH_HASH_WORKERS'],
+        max_pending=app.config['AUTH_HASH_MAX_PENDING'],
+    )
+    app.session_interface = ServerSessionInterface(SESSION_BACKENDS[app.config['SESSION_BACKEND']]())
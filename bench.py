@@ -0,0 +1,281 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from sqlalchemy import event
+from models import db
+from queryplan import users_by_role, login_as
+
+# Các route đo hiệu năng: (vai trò, đường dẫn)
+BENCH_ROUTES = [
+    ('admin', '/dashboard'),
+    ('lecturer', '/dashboard'),
+    ('student', '/dashboard'),
+    ('admin', '/courses'),
+    ('student', '/courses'),
+    ('admin', '/grades'),
+    ('lecturer', '/grades'),
+    ('student', '/grades'),
+    ('admin', '/payments'),
+    ('admin', '/students'),
+    ('admin', '/students?q=nguyen'),
+]
+# Chậm hơn baseline quá tỉ lệ này thì coi là suy giảm hiệu năng
+REGRESSION_RATIO = 1.25
+# Bỏ qua chênh lệch nhỏ hơn ngưỡng này (nhiễu đo với các route rất nhanh)
+MIN_DELTA_MS = 5
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _get(app, client, path):
+    # Mỗi request một app context mới: g, db.session và chế độ read_only không bị dùng lại
+    with app.app_context():
+        return client.get(path)
+
+
+def _measure_route(app, client, path, iterations):
+    queries = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        # Như giới hạn số truy vấn: không tính truy vấn hạ tầng (kho phiên)
+        if not conn.get_execution_options().get('skip_query_budget'):
+            queries[-1] += 1
+
+    # Đếm trên mọi engine: route read_only đọc qua engine 'read'
+    engines = {id(engine): engine for engine in db.engines.values()}.values()
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', count)
+    try:
+        timings = []
+        for _ in range(iterations):
+            queries.append(0)
+            started = time.perf_counter()
+            response = _get(app, client, path)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{path} trả về {response.status_code}")
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', count)
+
+    # Đo bộ nhớ ở một lượt riêng để tracemalloc không làm sai lệch thời gian
+    tracemalloc.start()
+    _get(app, client, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'queries': max(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(app, iterations=20, warmup=2, routes=None):
+    results = {}
+    users = users_by_role()
+    client = app.test_client()
+    for role, path in routes or BENCH_ROUTES:
+        if role not in users:
+            continue
+        login_as(client, users[role])
+        for _ in range(warmup):
+            _get(app, client, path)
+        results[f"{role} {path}"] = _measure_route(app, client, path, iterations)
+    return results
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def compare(results, baseline, ratio=REGRESSION_RATIO):
+    regressions = []
+    for key, current in results.items():
+        previous = (baseline or {}).get(key)
+        if not previous:
+            continue
+        slower = current['p50_ms'] - previous['p50_ms']
+        if current['p50_ms'] > previous['p50_ms'] * ratio and slower > MIN_DELTA_MS:
+            regressions.append((key, 'p50_ms', previous['p50_ms'], current['p50_ms']))
+        if current['queries'] > previous['queries']:
+            regressions.append((key, 'queries', previous['queries'], current['queries']))
+    return regressions
+
+
+def print_report(results, baseline=None):
+    print(f"{'route':<32}{'p50 ms':>10}{'p99 ms':>10}{'queries':>9}{'peak KB':>10}{'Δp50':>9}")
+    for key, r in results.items():
+        previous = (baseline or {}).get(key)
+        delta = f"{(r['p50_ms'] / previous['p50_ms'] - 1) * 100:+.0f}%" if previous and previous['p50_ms'] else ''
+        print(f"{key:<32}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['queries']:>9}{r['peak_kb']:>10}{delta:>9}")
+
+
+# --- Đo số lượt đăng nhập mỗi giây theo chi phí băm ---
+
+def _login_storm(app, username, password, logins, threads):
+    timings, statuses = [], {}
+    lock = threading.Lock()
+
+    def worker(count):
+        client = app.test_client()
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.post('/', data={'username': username, 'password': password})
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                timings.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    per_thread = [logins // threads + (1 if i < logins % threads else 0) for i in range(threads)]
+    pool = [threading.Thread(target=worker, args=(n,)) for n in per_thread if n]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started, timings, statuses
+
+
+def run_logins(app, method='scrypt', costs=(2 ** 12, 2 ** 14, 2 ** 15), logins=200, threads=16):
+    import auth
+    from models import User, UserSession
+
+    key = 'AUTH_SCRYPT_N' if method == 'scrypt' else 'AUTH_PBKDF2_ITERATIONS'
+    original = {'AUTH_HASH_METHOD': app.config['AUTH_HASH_METHOD'], key: app.config[key]}
+    username, password = f"@bench{int(time.time())}", 'bench-password'
+    user = User(username=username, role='admin', password='')
+    db.session.add(user)
+    results = []
+    try:
+        for cost in costs:
+            app.config.update({'AUTH_HASH_METHOD': method, key: cost})
+            # Băm sẵn theo đúng chi phí đang đo để không bị băm lại khi đăng nhập
+            user.password = auth.hash_password(password)
+            db.session.commit()
+            seconds, timings, statuses = _login_storm(app, username, password, logins, threads)
+            results.append({
+                'method': method,
+                'cost': cost,
+                'logins_per_sec': round(statuses.get(302, 0) / seconds, 1),
+                'p50_ms': round(percentile(timings, 50), 1),
+                'p99_ms': round(percentile(timings, 99), 1),
+                'statuses': statuses,
+            })
+    finally:
+        app.config.update(original)
+        db.session.delete(user)
+        db.session.query(UserSession).filter(UserSession.data.contains(username))\
+            .delete(synchronize_session=False)
+        db.session.commit()
+    return results
+
+
+def print_login_report(results):
+    print(f"{'method':<16}{'cost':>10}{'logins/s':>10}{'p50 ms':>10}{'p99 ms':>10}  statuses")
+    for r in results:
+        print(f"{r['method']:<16}{r['cost']:>10}{r['logins_per_sec']:>10}{r['p50_ms']:>10}{r['p99_ms']:>10}  {r['statuses']}")
+
+
+# --- So sánh thông lượng với N luồng đồng thời: cấu hình engine mặc định và đã tinh chỉnh ---
+
+def _concurrency_engines(url, profile, workers, config):
+    import database
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+
+    if profile == 'baseline':
+        # Như trước: NullPool (mặc định của SQLAlchemy 1.4 cho file SQLite), journal rollback
+        engine = create_engine(url, poolclass=NullPool)
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', lambda conn, record: database.apply_pragmas(conn, {'journal_mode': 'DELETE'}))
+        return engine, engine
+    options = dict(database.engine_options(url, config))
+    if 'pool_size' in options:
+        options['pool_size'] = max(options['pool_size'], workers)
+    write_engine = create_engine(url, **options)
+    read_engine = create_engine(url, **options)
+    if write_engine.dialect.name == 'sqlite':
+        pragmas = database.sqlite_pragmas(config)
+        event.listen(write_engine, 'connect', lambda conn, record: database.apply_pragmas(conn, pragmas))
+        read_pragmas = database.sqlite_pragmas(config, read_only=True)
+        event.listen(read_engine, 'connect', lambda conn, record: database.apply_pragmas(conn, read_pragmas))
+    return write_engine, read_engine
+
+
+def _mixed_workload(write_engine, read_engine, operations, write_every, counters, lock):
+    from models import Student, News
+
+    reads = [
+        db.select(db.func.count(Student.id)),
+        db.select(Student.id, Student.full_name).where(Student.class_id == 1).order_by(Student.id).limit(50),
+        db.select(News.id, News.title).order_by(News.id.desc()).limit(3),
+    ]
+    done = errors = 0
+    for i in range(operations):
+        try:
+            if i % write_every == 0:
+                with write_engine.begin() as conn:
+                    news_id = conn.execute(News.__table__.insert().values(
+                        title='bench', content='bench', author='bench')).inserted_primary_key[0]
+                    conn.execute(News.__table__.delete().where(News.id == news_id))
+            else:
+                with read_engine.connect() as conn:
+                    conn.execute(reads[i % len(reads)]).all()
+            done += 1
+        except Exception:
+            errors += 1
+    with lock:
+        counters['done'] += done
+        counters['errors'] += errors
+
+
+def run_concurrency(app, workers=(1, 4, 16), operations=200, write_every=5):
+    # Mỗi luồng thực hiện `operations` thao tác, cứ `write_every` thao tác có một transaction ghi
+    url = db.engine.url
+    results = []
+    for engine in db.engines.values():
+        engine.dispose()
+    for profile in ('baseline', 'tuned'):
+        for count in workers:
+            write_engine, read_engine = _concurrency_engines(url, profile, count, app.config)
+            counters, lock = {'done': 0, 'errors': 0}, threading.Lock()
+            pool = [threading.Thread(target=_mixed_workload,
+                                     args=(write_engine, read_engine, operations, write_every, counters, lock))
+                    for _ in range(count)]
+            started = time.perf_counter()
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+            seconds = time.perf_counter() - started
+            write_engine.dispose()
+            read_engine.dispose()
+            results.append({
+                'profile': profile,
+                'workers': count,
+                'ops_per_sec': round(counters['done'] / seconds, 1),
+                'errors': counters['errors'],
+            })
+    return results
+
+
+def print_concurrency_report(results):
+    print(f"{'profile':<12}{'workers':>8}{'ops/s':>10}{'errors':>8}")
+    for r in results:
+        print(f"{r['profile']:<12}{r['workers']:>8}{r['ops_per_sec']:>10}{r['errors']:>8}")
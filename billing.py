@@ -0,0 +1,123 @@
+from flask import current_app
+import jobs
+from database import conflict_insert
+from models import db, Student, Course, ClassCourse, CourseRegistration, Enrollment, Payment, TuitionExemption
+from registrations import APPROVED
+
+# Học phí = tổng tín chỉ các môn đang đăng ký trong học kỳ x đơn giá một tín chỉ.
+# Enrollment không ghi học kỳ: môn thuộc học kỳ nếu nằm trong kế hoạch của lớp sinh viên (ClassCourse)
+# hoặc sinh viên có phiếu đăng ký đã duyệt cho học kỳ đó (môn ngoài kế hoạch, xem registrations.py).
+DEFAULT_RATE_PER_CREDIT = 450_000
+# Số sinh viên (theo khoảng id) xử lý trong một câu INSERT ... SELECT / một transaction
+STUDENT_CHUNK = 5_000
+# Hóa đơn đã nộp/đã rút giữ nguyên khi chạy lại, chỉ hóa đơn chưa thu được tính lại
+REPRICEABLE = ('pending', 'free')
+
+
+def note_for(semester):
+    return f"Học phí {semester}"
+
+
+def _fee_rows(semester, rate, first_id, last_id):
+    exempt = db.select(TuitionExemption.id).where(
+        TuitionExemption.student_id == Enrollment.student_id,
+        db.or_(TuitionExemption.semester == semester, TuitionExemption.semester.is_(None)),
+    ).exists()
+    in_plan = db.select(ClassCourse.id).where(
+        ClassCourse.class_id == Student.class_id,
+        ClassCourse.course_id == Enrollment.course_id,
+        ClassCourse.semester == semester,
+    ).exists()
+    registered = db.select(CourseRegistration.MaDK).where(
+        CourseRegistration.MaTheSV == Student.student_id,
+        CourseRegistration.MaMH == Course.code,
+        CourseRegistration.HocKy == semester,
+        CourseRegistration.TrangThai == APPROVED,
+    ).exists()
+    return db.select(
+        Enrollment.student_id,
+        db.func.sum(db.func.coalesce(Course.credits, 0)) * rate,
+        db.case((exempt, 'free'), else_='pending'),
+        db.literal(semester),
+        db.literal(note_for(semester)),
+    ).join(Student, Student.id == Enrollment.student_id)\
+        .join(Course, Course.id == Enrollment.course_id)\
+        .where(
+            Enrollment.status == 'active',
+            Enrollment.student_id.between(first_id, last_id),
+            db.or_(in_plan, registered),
+        )\
+        .group_by(Enrollment.student_id)
+
+
+def _upsert_chunk(semester, rate, first_id, last_id):
+    table = Payment.__table__
+    rows = _fee_rows(semester, rate, first_id, last_id)
+    insert = conflict_insert(table, db.session.get_bind().dialect.name)
+    statement = insert.from_select(['student_id', 'amount', 'status', 'semester', 'note'], rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['student_id', 'semester'],
+        set_={'amount': statement.excluded.amount, 'status': statement.excluded.status},
+        where=table.c.status.in_(REPRICEABLE),
+    )
+    written = db.session.execute(statement).rowcount
+    # Sinh viên không còn môn nào trong học kỳ: bỏ hóa đơn chưa thu cũ
+    billed = rows.with_only_columns(Enrollment.student_id)
+    removed = db.session.execute(table.delete().where(
+        table.c.semester == semester,
+        table.c.status.in_(REPRICEABLE),
+        table.c.student_id.between(first_id, last_id),
+        table.c.student_id.notin_(billed),
+    )).rowcount
+    return written, removed
+
+
+def generate_invoices(semester, rate=None, progress=None):
+    # Sinh/cập nhật hóa đơn học phí cả học kỳ theo từng khoảng id sinh viên;
+    # chạy lại cho cùng dữ liệu cho kết quả như cũ (ràng buộc duy nhất student_id + semester).
+    rate = rate if rate is not None else current_app.config['TUITION_RATE_PER_CREDIT']
+    low, high = db.session.query(db.func.min(Student.id), db.func.max(Student.id)).one()
+    written = removed = 0
+    if low is not None:
+        for first_id in range(low, high + 1, STUDENT_CHUNK):
+            last_id = min(first_id + STUDENT_CHUNK - 1, high)
+            chunk_written, chunk_removed = _upsert_chunk(semester, rate, first_id, last_id)
+            written += chunk_written
+            removed += chunk_removed
+            if progress is not None:
+                # progress() của công việc nền commit luôn phần vừa ghi
+                progress(last_id - low + 1, total=high - low + 1)
+            else:
+                db.session.commit()
+    db.session.commit()
+    return dict(semester_totals(semester), written=written, removed=removed, rate=rate)
+
+
+def semester_totals(semester):
+    rows = db.session.query(Payment.status, db.func.count(Payment.id), db.func.sum(Payment.amount))\
+        .filter(Payment.semester == semester)\
+        .group_by(Payment.status)\
+        .all()
+    return {
+        'invoices': sum(count for _, count, _ in rows),
+        'by_status': {status: {'count': count, 'amount': amount or 0} for status, count, amount in rows},
+    }
+
+
+def exempt(student, semester=None, reason=None):
+    # Tra trước rồi mới thêm: semester = None không bị ràng buộc duy nhất chặn trùng
+    exemption = TuitionExemption.query.filter_by(student_id=student.id, semester=semester).first()
+    if exemption is None:
+        exemption = TuitionExemption(student_id=student.id, semester=semester)
+        db.session.add(exemption)
+    exemption.reason = reason
+    db.session.commit()
+
+
+@jobs.handler('generate_tuition')
+def generate_tuition_job(context, semester, rate=None):
+    return generate_invoices(semester, rate, progress=context.progress)
+
+
+def init_app(app):
+    app.config.setdefault('TUITION_RATE_PER_CREDIT', DEFAULT_RATE_PER_CREDIT)
@@ -0,0 +1,72 @@
+import threading
+import time
+from itertools import chain
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+
+def invalidate_on_commit(models, invalidate, keys=None):
+    # Ghi nhận đối tượng thay đổi lúc flush nhưng chỉ xóa cache sau khi transaction commit:
+    # xóa ngay lúc flush thì request khác vẫn đọc được dữ liệu cũ trước commit và nạp lại vào cache.
+    # keys(obj) trả về các khóa cần xóa (None = xóa hết); không có keys thì gọi invalidate().
+    name = ('invalidate_on_commit', models, invalidate)
+
+    @event.listens_for(Session, 'after_flush')
+    def _record(session, flush_context):
+        for obj in chain(session.new, session.dirty, session.deleted):
+            if isinstance(obj, models):
+                session.info.setdefault(name, set()).update(keys(obj) if keys else (None,))
+
+    @event.listens_for(Session, 'after_commit')
+    def _invalidate(session):
+        pending = session.info.pop(name, ())
+        if None in pending:
+            invalidate()
+        else:
+            for key in pending:
+                invalidate(key)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard(session):
+        session.info.pop(name, None)
+
+
+def column_values(obj, column):
+    # Giá trị mới và cũ của một cột, đọc trong after_flush (khi lịch sử thay đổi còn nguyên):
+    # sửa học kỳ của một lịch thì cả học kỳ cũ lẫn mới đều phải xóa cache.
+    # Không biết giá trị (cột chưa nạp, hoặc bị sửa khi giá trị cũ chưa nạp): trả về None để xóa toàn bộ.
+    state = inspect(obj)
+    history = state.attrs[column].history
+    if history.added and not history.deleted and obj not in state.session.new:
+        return {None}
+    return set(chain(history.added, history.unchanged, history.deleted)) or {None}
+
+
+class CommitCache:
+    # Cache theo khóa với thời gian sống làm lưới an toàn. Giá trị nạp trong lúc cache bị xóa
+    # (đọc trước commit, ghi vào sau khi đã xóa) bị bỏ, không được lưu lại.
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._items = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, create):
+        with self._lock:
+            item = self._items.get(key)
+            generation = self._generation
+        if item is not None and item[0] > time.monotonic():
+            return item[1]
+        value = create()
+        with self._lock:
+            if self._generation == generation:
+                self._items[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._items.clear()
+            else:
+                self._items.pop(key, None)
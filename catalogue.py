@@ -0,0 +1,154 @@
+import threading
+from flask import current_app
+from cache_invalidation import invalidate_on_commit
+from dashboard_cache import LRUCache
+from models import db, Class, ClassCourse, Course, Enrollment
+from queries import with_profile
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Phiên bản danh mục: tăng khi Course hoặc ClassCourse thay đổi, nằm trong khóa cache
+# nên số đếm facet cũ không bao giờ được trả về.
+_version = {'number': 0}
+_version_lock = threading.Lock()
+
+
+def version():
+    with _version_lock:
+        return _version['number']
+
+
+def invalidate():
+    with _version_lock:
+        _version['number'] += 1
+
+
+# Tăng sau khi commit: tăng lúc flush thì request khác vẫn đọc số liệu cũ dưới phiên bản mới
+invalidate_on_commit((Course, ClassCourse), invalidate)
+
+
+class CatalogueFilters:
+    def __init__(self, lecturers=(), credits=(), class_id=None, semester=None):
+        self.lecturers = tuple(sorted(set(lecturers)))
+        self.credits = tuple(sorted(set(credits)))
+        self.class_id = class_id
+        self.semester = semester
+
+    def conditions(self, exclude=None):
+        # exclude: bỏ điều kiện của chính facet đang đếm, để các lựa chọn khác vẫn hiện số lượng
+        conditions = []
+        if self.lecturers and exclude != 'lecturer':
+            conditions.append(Course.lecturer.in_(self.lecturers))
+        if self.credits and exclude != 'credits':
+            conditions.append(Course.credits.in_(self.credits))
+        if self.class_id or self.semester:
+            offered = db.select(ClassCourse.course_id)
+            if self.class_id:
+                offered = offered.where(ClassCourse.class_id == self.class_id)
+            if self.semester:
+                offered = offered.where(ClassCourse.semester == self.semester)
+            conditions.append(Course.id.in_(offered))
+        return conditions
+
+    def key(self, exclude=None):
+        return (
+            () if exclude == 'lecturer' else self.lecturers,
+            () if exclude == 'credits' else self.credits,
+            self.class_id,
+            self.semester,
+        )
+
+    def args(self):
+        # Tham số URL để giữ bộ lọc khi chuyển trang
+        return {
+            'lecturer[]': list(self.lecturers),
+            'credits[]': list(self.credits),
+            'class_id': self.class_id,
+            'semester': self.semester,
+        }
+
+
+def filters_from(args):
+    return CatalogueFilters(
+        lecturers=[value for value in args.getlist('lecturer[]') if value],
+        credits=args.getlist('credits[]', type=int),
+        class_id=args.get('class_id', type=int),
+        semester=args.get('semester') or None,
+    )
+
+
+def _cache():
+    return current_app.extensions['catalogue_cache']
+
+
+def _facet(column, name, filters):
+    # Số môn theo từng giá trị của cột, kể cả None (môn chưa có giảng viên)
+    def count():
+        return db.session.query(column, db.func.count(Course.id))\
+            .filter(*filters.conditions(exclude=name))\
+            .group_by(column)\
+            .order_by(column)\
+            .all()
+    return _cache().get_or_create(('facet', name, filters.key(exclude=name), version()), count)
+
+
+def facets(filters):
+    lecturers = _facet(Course.lecturer, 'lecturer', filters)
+    credits = _facet(Course.credits, 'credits', filters)
+    # Facet giảng viên đã tính với mọi điều kiện khác, nên tổng số môn khớp bộ lọc suy ra được
+    # từ đó mà không cần thêm một truy vấn COUNT
+    total = sum(count for lecturer, count in lecturers if not filters.lecturers or lecturer in filters.lecturers)
+    return {
+        'lecturers': [(value, count) for value, count in lecturers if value is not None],
+        'credits': [(value, count) for value, count in credits if value is not None],
+        'total': total,
+    }
+
+
+def choices():
+    # Danh sách lớp và học kỳ cho ô chọn, đổi khi ClassCourse thay đổi
+    def load():
+        return {
+            'classes': db.session.query(Class.id, Class.code, Class.name).order_by(Class.code).all(),
+            'semesters': [row[0] for row in db.session.query(ClassCourse.semester).distinct().order_by(ClassCourse.semester)],
+        }
+    return _cache().get_or_create(('choices', version()), load)
+
+
+def course_page(filters, after_id=None, limit=PAGE_SIZE):
+    # Phân trang keyset theo Course.id; lớp của các môn trong trang được tải bằng một truy vấn IN
+    query = with_profile(Course.query, 'courses').filter(*filters.conditions())
+    if after_id:
+        query = query.filter(Course.id > after_id)
+    rows = query.order_by(Course.id).limit(limit + 1).all()
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def enrolled_ids(student_id, course_ids):
+    if not course_ids:
+        return set()
+    return {row[0] for row in db.session.query(Enrollment.course_id)
+            .filter(Enrollment.student_id == student_id, Enrollment.course_id.in_(course_ids))}
+
+
+def serialize(course):
+    return {
+        'id': course.id,
+        'code': course.code,
+        'name': course.name,
+        'credits': course.credits,
+        'lecturer': course.lecturer,
+        'capacity': course.capacity,
+        'classes': [cls.name for cls in course.classes],
+    }
+
+
+def init_app(app):
+    app.config.setdefault('CATALOGUE_CACHE_SIZE', 256)
+    app.config.setdefault('CATALOGUE_CACHE_TTL', 3600)
+    app.extensions['catalogue_cache'] = LRUCache(
+        maxsize=app.config['CATALOGUE_CACHE_SIZE'],
+        ttl=app.config['CATALOGUE_CACHE_TTL'],
+    )
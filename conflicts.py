@@ -0,0 +1,155 @@
+import heapq
+from bisect import bisect_left
+from datetime import date
+from cache_invalidation import CommitCache, column_values, invalidate_on_commit
+from models import db, Course, Schedule, Exam
+
+
+def to_minutes(value):
+    # "07:30" -> 450
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minutes(value):
+    return f"{value // 60:02d}:{value % 60:02d}"
+
+
+def _resources(room, class_id, lecturer):
+    keys = [('room', room), ('class', class_id)]
+    if lecturer:
+        keys.append(('lecturer', lecturer))
+    return keys
+
+
+class IntervalIndex:
+    # Mỗi (tài nguyên, ngày) giữ danh sách khoảng [start, end) sắp theo start,
+    # kèm max(end) tích lũy để dừng sớm khi dò ngược.
+    def __init__(self, intervals):
+        self._buckets = {}
+        for key, start, end, ref in intervals:
+            self._buckets.setdefault(key, []).append((start, end, ref))
+        self._starts = {}
+        self._max_ends = {}
+        for key, items in self._buckets.items():
+            items.sort()
+            self._starts[key] = [item[0] for item in items]
+            running, max_ends = 0, []
+            for item in items:
+                running = max(running, item[1])
+                max_ends.append(running)
+            self._max_ends[key] = max_ends
+
+    def overlapping(self, key, start, end):
+        items = self._buckets.get(key)
+        if not items:
+            return []
+        found = []
+        i = bisect_left(self._starts[key], end) - 1
+        max_ends = self._max_ends[key]
+        while i >= 0 and max_ends[i] > start:
+            if items[i][1] > start:
+                found.append(items[i][2])
+            i -= 1
+        return found
+
+    def all_overlaps(self):
+        # Quét theo start với heap các khoảng đang mở: O(n log n + số cặp trùng)
+        pairs = []
+        for key, items in self._buckets.items():
+            active = []
+            for start, end, ref in items:
+                while active and active[0][0] <= start:
+                    heapq.heappop(active)
+                for _, other in active:
+                    pairs.append((key, other, ref))
+                heapq.heappush(active, (end, ref))
+        return pairs
+
+
+class SemesterTimetable:
+    def __init__(self, semester):
+        self.semester = semester
+        self.lecturers = {}
+        schedule_intervals = []
+        rows = db.session.query(
+            Schedule.id, Schedule.class_id, Schedule.course_id, Schedule.day_of_week,
+            Schedule.start_time, Schedule.end_time, Schedule.room, Course.lecturer
+        ).outerjoin(Course, Course.id == Schedule.course_id)\
+            .filter(Schedule.semester == semester, Schedule.active.isnot(False))
+        for row in rows:
+            start, end = to_minutes(row.start_time), to_minutes(row.end_time)
+            self.lecturers[row.course_id] = row.lecturer
+            for resource in _resources(row.room, row.class_id, row.lecturer):
+                schedule_intervals.append(((resource, row.day_of_week), start, end, row.id))
+        exam_intervals = []
+        rows = db.session.query(
+            Exam.id, Exam.class_id, Exam.course_id, Exam.exam_date, Exam.start_time,
+            Exam.duration, Exam.room, Exam.exam_type, Course.lecturer
+        ).outerjoin(Course, Course.id == Exam.course_id)\
+            .filter(Exam.semester == semester)
+        for row in rows:
+            start = to_minutes(row.start_time)
+            self.lecturers[row.course_id] = row.lecturer
+            for resource in _resources(row.room, row.class_id, row.lecturer):
+                exam_intervals.append(((resource, row.exam_date), start, start + row.duration, row.id))
+        self.schedule_index = IntervalIndex(schedule_intervals)
+        self.exam_index = IntervalIndex(exam_intervals)
+
+    def _describe(self, kind, key, ids):
+        (resource, value), when = key
+        return [{'type': kind, 'resource': resource, 'value': value, 'when': str(when), 'ids': list(ids)}]
+
+    def report(self):
+        conflicts = []
+        for key, a, b in self.schedule_index.all_overlaps():
+            conflicts += self._describe('schedule', key, (a, b))
+        for key, a, b in self.exam_index.all_overlaps():
+            conflicts += self._describe('exam', key, (a, b))
+        return conflicts
+
+    def _check(self, index, kind, when, start, end, room, class_id, lecturer, exclude_id):
+        conflicts = []
+        for resource in _resources(room, class_id, lecturer):
+            key = (resource, when)
+            ids = [i for i in index.overlapping(key, start, end) if i != exclude_id]
+            if ids:
+                conflicts += self._describe(kind, key, ids)
+        return conflicts
+
+    def check_schedule(self, class_id, course_id, day_of_week, start_time, end_time, room, exclude_id=None):
+        return self._check(self.schedule_index, 'schedule', day_of_week,
+                           to_minutes(start_time), to_minutes(end_time),
+                           room, class_id, self._lecturer_of(course_id), exclude_id)
+
+    def check_exam(self, class_id, course_id, exam_date, start_time, duration, room, exclude_id=None):
+        if isinstance(exam_date, str):
+            exam_date = date.fromisoformat(exam_date)
+        start = to_minutes(start_time)
+        return self._check(self.exam_index, 'exam', exam_date, start, start + duration,
+                           room, class_id, self._lecturer_of(course_id), exclude_id)
+
+    def _lecturer_of(self, course_id):
+        if course_id not in self.lecturers:
+            row = db.session.query(Course.lecturer).filter(Course.id == course_id).first()
+            self.lecturers[course_id] = row[0] if row else None
+        return self.lecturers[course_id]
+
+
+# --- Bộ nhớ đệm chỉ mục theo học kỳ, xóa sau khi thay đổi Schedule/Exam/Course được commit ---
+
+TIMETABLE_CACHE_TTL = 600
+
+_cache = CommitCache(TIMETABLE_CACHE_TTL)
+
+
+def timetable(semester):
+    return _cache.get_or_create(semester, lambda: SemesterTimetable(semester))
+
+
+def invalidate(semester=None):
+    _cache.invalidate(semester)
+
+
+invalidate_on_commit((Schedule, Exam), invalidate, keys=lambda obj: column_values(obj, 'semester'))
+invalidate_on_commit(Course, invalidate)
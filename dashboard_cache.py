@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from hashlib import sha1
+from cache_invalidation import invalidate_on_commit
+from models import Student, Course, News, Schedule
+
+# Các bảng mà trang chủ đọc: ghi vào một trong số này làm tăng phiên bản dữ liệu
+WATCHED_MODELS = (Student, Course, News, Schedule)
+
+_version = {'number': 0, 'changed_at': datetime.now(timezone.utc).replace(microsecond=0)}
+_version_lock = threading.Lock()
+
+
+def data_version():
+    with _version_lock:
+        return _version['number'], _version['changed_at']
+
+
+def bump():
+    with _version_lock:
+        _version['number'] += 1
+        _version['changed_at'] = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+# Tăng sau khi commit, không phải lúc flush: request đọc giữa flush và commit sẽ lưu trang cũ
+# dưới phiên bản mới
+invalidate_on_commit(WATCHED_MODELS, bump)
+
+
+class LRUCache:
+    # LRU có giới hạn số phần tử và thời gian sống; khóa đã chứa phiên bản dữ liệu
+    # nên dữ liệu cũ không bao giờ được trả về, chỉ bị đẩy ra dần.
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_create(self, key, create):
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class CachedPage:
+    def __init__(self, html, last_modified):
+        self.html = html
+        self.etag = sha1(html.encode('utf-8')).hexdigest()
+        self.last_modified = last_modified
+
+
+def init_app(app):
+    app.config.setdefault('DASHBOARD_CACHE_SIZE', 1024)
+    app.config.setdefault('DASHBOARD_CACHE_TTL', 300)
+    app.extensions['dashboard_cache'] = LRUCache(
+        maxsize=app.config['DASHBOARD_CACHE_SIZE'],
+        ttl=app.config['DASHBOARD_CACHE_TTL'],
+    )
+
+
+def get_cache(app):
+    return app.extensions['dashboard_cache']
@@ -0,0 +1,133 @@
+import os
+import sqlite3
+from functools import wraps
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+DEFAULT_DATABASE_URL = 'sqlite:///sms_demo.db'
+
+# PRAGMA áp dụng cho mỗi kết nối SQLite mới
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',         # người đọc không chặn người ghi và ngược lại
+    'synchronous': 'NORMAL',       # an toàn với WAL, ít fsync hơn FULL
+    'busy_timeout': 5000,          # chờ khóa 5s thay vì báo "database is locked" ngay
+    'cache_size': -64000,          # 64 MB page cache mỗi kết nối
+    'mmap_size': 268435456,        # đọc qua mmap 256 MB
+    'temp_store': 'MEMORY',
+}
+# Kết nối của engine chỉ đọc không được phép ghi
+READ_ONLY_PRAGMAS = {'query_only': 'ON'}
+
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def is_sqlite_memory(url):
+    return is_sqlite(url) and make_url(url).database in (None, '', ':memory:')
+
+
+def engine_options(url, config):
+    if is_sqlite_memory(url):
+        # Flask-SQLAlchemy tự dùng StaticPool cho CSDL trong bộ nhớ
+        return {}
+    if is_sqlite(url):
+        # SQLAlchemy 1.4 mặc định dùng NullPool cho file SQLite (mở kết nối mới mỗi lần);
+        # giữ kết nối trong pool để PRAGMA và page cache không bị mất.
+        return {
+            'poolclass': QueuePool,
+            'pool_size': config['DATABASE_POOL_SIZE'],
+            'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+            'connect_args': {'check_same_thread': False, 'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000},
+        }
+    return {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def sqlite_pragmas(config, read_only=False):
+    pragmas = dict(SQLITE_PRAGMAS, busy_timeout=config['SQLITE_BUSY_TIMEOUT'], **config['SQLITE_PRAGMAS'])
+    if read_only:
+        pragmas.update(READ_ONLY_PRAGMAS)
+    return pragmas
+
+
+def _listen_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            apply_pragmas(dbapi_connection, pragmas)
+
+
+def conflict_insert(target, dialect_name):
+    # INSERT hỗ trợ ON CONFLICT; import muộn vì dialect postgresql làm chậm khởi động ~25 ms
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(target)
+
+
+class RoutingSession(Session):
+    # Trong route đánh dấu read_only, truy vấn đi tới engine 'read' (bản sao, hoặc pool
+    # riêng chỉ đọc trên cùng file SQLite); mọi thao tác flush/ghi vẫn dùng engine chính.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('db_read_only'):
+            engine = self._db.engines.get('read')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def init_app(app, db):
+    # DATABASE_URL / DATABASE_READ_URL lấy từ biến môi trường nếu có
+    config = app.config
+    config.setdefault('DATABASE_POOL_SIZE', 5)
+    config.setdefault('DATABASE_MAX_OVERFLOW', 10)
+    config.setdefault('DATABASE_POOL_TIMEOUT', 30)
+    config.setdefault('DATABASE_POOL_RECYCLE', 1800)
+    config.setdefault('DATABASE_SESSION_POOL_SIZE', 5)
+    config.setdefault('SQLITE_BUSY_TIMEOUT', 5000)
+    config.setdefault('SQLITE_PRAGMAS', {})
+    url = os.environ.get('DATABASE_URL') or config.get('SQLALCHEMY_DATABASE_URI') or DEFAULT_DATABASE_URL
+    read_url = os.environ.get('DATABASE_READ_URL') or config.get('DATABASE_READ_URL')
+    if read_url is None and is_sqlite(url) and not is_sqlite_memory(url):
+        # SQLite ở chế độ WAL: pool chỉ đọc riêng trên cùng file, không tranh kết nối với luồng ghi
+        read_url = url
+    config['SQLALCHEMY_DATABASE_URI'] = url
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(url, config))
+    binds = config.setdefault('SQLALCHEMY_BINDS', {})
+    if read_url:
+        binds['read'] = dict(engine_options(read_url, config), url=read_url)
+    if not is_sqlite_memory(url):
+        # Kho phiên đăng nhập có pool riêng, không tranh kết nối với db.session của request
+        binds['sessions'] = dict(engine_options(url, config), url=url, pool_size=config['DATABASE_SESSION_POOL_SIZE'])
+    db.init_app(app)
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                _listen_pragmas(engine, sqlite_pragmas(config, read_only=key == 'read'))
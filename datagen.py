@@ -0,0 +1,187 @@
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+from models import (db, User, Class, Student, Course, ClassCourse, CourseRegistration, Enrollment, Grade, Payment, News,
+                    Schedule, TranscriptSemester)
+import auth
+import migrations
+
+HO = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi', 'Đỗ', 'Hồ', 'Ngô', 'Dương', 'Lý']
+DEM = ['Văn', 'Thị', 'Hữu', 'Đức', 'Minh', 'Ngọc', 'Thanh', 'Quốc', 'Gia', 'Bảo', 'Thu', 'Xuân']
+TEN = ['An', 'Bình', 'Cường', 'Dũng', 'Đạt', 'Giang', 'Hà', 'Hải', 'Hạnh', 'Hiếu', 'Hoa', 'Huy', 'Khánh',
+       'Linh', 'Long', 'Mai', 'Nam', 'Ngân', 'Phong', 'Phúc', 'Quân', 'Sơn', 'Tâm', 'Thảo', 'Thắng', 'Trang',
+       'Trung', 'Tú', 'Tuấn', 'Uyên', 'Việt', 'Yến']
+MON = ['Lập trình', 'Cấu trúc dữ liệu', 'Toán rời rạc', 'Cơ sở dữ liệu', 'Mạng máy tính', 'Hệ điều hành',
+       'Trí tuệ nhân tạo', 'Kiến trúc máy tính', 'Công nghệ phần mềm', 'Xác suất thống kê', 'Giải tích',
+       'Đại số tuyến tính', 'An toàn thông tin', 'Học máy', 'Phát triển web']
+SLOTS = [("07:30", "09:00"), ("09:30", "11:00"), ("13:00", "14:30"), ("15:00", "16:30"), ("17:00", "18:30")]
+PAYMENT_STATUSES = ['pending'] * 3 + ['paid'] * 6 + ['withdrawn', 'free']
+
+DEFAULTS = {
+    'students': 100_000,
+    'classes': 2_500,
+    'courses': 1_500,
+    'lecturers': 300,
+    'semesters': 3,
+    'courses_per_semester': 8,
+    'payments_per_student': 12,
+    'registrations_per_student': 3,
+    'rooms': 200,
+    'seed': 2025,
+}
+
+
+def _bulk_insert(conn, table, rows, chunk_size=10_000):
+    # executemany theo từng lô, không giữ toàn bộ dữ liệu trong bộ nhớ
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            conn.execute(table.insert(), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        conn.execute(table.insert(), chunk)
+        count += len(chunk)
+    return count
+
+
+def semester_names(count):
+    # HK1-2024, HK2-2024, HK1-2025, ... kết thúc ở năm 2025
+    year = 2025 - (count - 1) // 2
+    return [f"HK{i % 2 + 1}-{year + i // 2}" for i in range(count)]
+
+
+def generate(**options):
+    opts = dict(DEFAULTS, **{k: v for k, v in options.items() if v is not None})
+    rng = random.Random(opts['seed'])
+    n_students, n_classes, n_courses = opts['students'], opts['classes'], opts['courses']
+    semesters = semester_names(opts['semesters'])
+    lecturers = [f"GV{i:03d}" for i in range(1, opts['lecturers'] + 1)]
+    rooms = [f"{'ABCDE'[i % 5]}{100 + i // 5 + 1}" for i in range(opts['rooms'])]
+    now = datetime.now()
+    counts = {}
+    started = time.perf_counter()
+
+    # Mỗi lớp học một tập môn khác nhau trong từng học kỳ
+    class_plan = {
+        class_id: {
+            semester: rng.sample(range(1, n_courses + 1), min(opts['courses_per_semester'], n_courses))
+            for semester in semesters
+        }
+        for class_id in range(1, n_classes + 1)
+    }
+    course_lecturer = {course_id: rng.choice(lecturers) for course_id in range(1, n_courses + 1)}
+
+    def student_class(student_id):
+        return (student_id - 1) % n_classes + 1
+
+    def student_code(student_id):
+        return f"{2020 + student_id % 5}{student_id:06d}"
+
+    def grade_rows():
+        # Học kỳ cũ đã xác nhận hết, học kỳ hiện tại còn một phần điểm chờ xác nhận
+        for student_id in range(1, n_students + 1):
+            for semester, course_ids in class_plan[student_class(student_id)].items():
+                for course_id in course_ids:
+                    pending = semester == semesters[-1] and rng.random() < 0.3
+                    yield {
+                        'student_id': student_id, 'course_id': course_id,
+                        'value': round(min(10, max(0, rng.gauss(6.8, 1.6))), 1),
+                        'status': 'pending' if pending else 'confirmed',
+                        'submitted_by': course_lecturer[course_id], 'submitted_at': now,
+                        'confirmed_by': None if pending else '@admin',
+                        'confirmed_at': None if pending else now,
+                    }
+
+    # Băm một lần rồi dùng chung: băm riêng cho 100k tài khoản mất hàng giờ
+    password = auth.hash_password('123456')
+
+    def _insert_all(conn):
+        counts['user'] = _bulk_insert(conn, User.__table__, itertools.chain(
+            [{'username': '@admin', 'password': password, 'role': 'admin'}],
+            ({'username': code, 'password': password, 'role': 'lecturer'} for code in lecturers),
+            ({'username': student_code(i), 'password': password, 'role': 'student'}
+             for i in range(1, n_students + 1)),
+        ))
+        counts['class'] = _bulk_insert(conn, Class.__table__, (
+            {'id': i, 'name': f"Lớp {i:04d}", 'code': f"L{i:04d}", 'lecturer_id': rng.choice(lecturers),
+             'created_at': now}
+            for i in range(1, n_classes + 1)
+        ))
+        counts['course'] = _bulk_insert(conn, Course.__table__, (
+            {'id': i, 'code': f"MH{i:04d}", 'name': f"{MON[i % len(MON)]} {i // len(MON) + 1}",
+             'credits': rng.choice([2, 3, 3, 4]), 'lecturer': course_lecturer[i]}
+            for i in range(1, n_courses + 1)
+        ))
+        counts['student'] = _bulk_insert(conn, Student.__table__, (
+            {'id': i, 'student_id': student_code(i),
+             'full_name': f"{rng.choice(HO)} {rng.choice(DEM)} {rng.choice(TEN)}",
+             'dob': f"{2000 + i % 6}-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+             'email': f"{student_code(i)}@example.com", 'class_id': student_class(i)}
+            for i in range(1, n_students + 1)
+        ))
+        counts['class_course'] = _bulk_insert(conn, ClassCourse.__table__, (
+            {'class_id': class_id, 'course_id': course_id, 'semester': semester, 'created_at': now}
+            for class_id, plan in class_plan.items()
+            for semester, course_ids in plan.items()
+            for course_id in course_ids
+        ))
+        counts['schedule'] = _bulk_insert(conn, Schedule.__table__, (
+            {'class_id': class_id, 'course_id': course_id, 'semester': semester,
+             'day_of_week': index % 6, 'start_time': SLOTS[(index + class_id) % len(SLOTS)][0],
+             'end_time': SLOTS[(index + class_id) % len(SLOTS)][1], 'room': rng.choice(rooms),
+             'active': semester == semesters[-1]}
+            for class_id, plan in class_plan.items()
+            for semester, course_ids in plan.items()
+            for index, course_id in enumerate(course_ids)
+        ))
+        counts['enrollment'] = _bulk_insert(conn, Enrollment.__table__, (
+            {'student_id': student_id, 'course_id': course_id, 'enrolled_at': now, 'status': 'active'}
+            for student_id in range(1, n_students + 1)
+            for course_id in class_plan[student_class(student_id)][semesters[-1]]
+        ))
+        counts['grade'] = _bulk_insert(conn, Grade.__table__, grade_rows())
+        counts['payment'] = _bulk_insert(conn, Payment.__table__, (
+            {'student_id': student_id, 'amount': rng.choice([800_000, 1_200_000, 1_500_000, 2_400_000]),
+             'status': rng.choice(PAYMENT_STATUSES),
+             'payment_date': now - timedelta(days=rng.randrange(700)),
+             'note': f"Học phí đợt {k + 1}"}
+            for student_id in range(1, n_students + 1)
+            for k in range(opts['payments_per_student'])
+        ))
+        # Phiếu đăng ký thêm môn cho học kỳ hiện tại, chờ duyệt (có thể trùng môn, trùng lịch)
+        counts['course_registration'] = _bulk_insert(conn, CourseRegistration.__table__, (
+            {'MaTheSV': student_code(student_id), 'MaMH': f"MH{rng.randrange(1, n_courses + 1):04d}",
+             'NgayDangKy': now - timedelta(minutes=rng.randrange(10_000)), 'HocKy': semesters[-1],
+             'TrangThai': 'Chưa duyệt'}
+            for student_id in range(1, n_students + 1)
+            for _ in range(opts['registrations_per_student'])
+        ))
+        counts['news'] = _bulk_insert(conn, News.__table__, (
+            {'title': f"Thông báo số {i}", 'content': f"Nội dung thông báo số {i}...", 'author': '@admin',
+             'created_at': now, 'updated_at': now}
+            for i in range(1, 201)
+        ))
+
+    db.drop_all()
+    migrations.create_schema()
+    with db.engine.connect() as conn:
+        sqlite = conn.dialect.name == 'sqlite'
+        if sqlite:
+            synchronous = conn.exec_driver_sql('PRAGMA synchronous').scalar()
+            conn.exec_driver_sql('PRAGMA synchronous=OFF')
+        with conn.begin():
+            _insert_all(conn)
+        if sqlite:
+            conn.exec_driver_sql(f'PRAGMA synchronous={synchronous}')
+            conn.exec_driver_sql('ANALYZE')
+
+    import transcript
+    transcript.rebuild()
+    counts['transcript'] = TranscriptSemester.query.count()
+
+    counts['seconds'] = round(time.perf_counter() - started, 1)
+    return counts
@@ -0,0 +1,92 @@
+import unicodedata
+from sqlalchemy import inspect, text
+from models import db, Student, Class, STUDENT_FTS_DDL, STUDENT_FTS_FOLD
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Ký tự lớn nhất để biến tìm kiếm tiền tố thành khoảng [prefix, prefix + MAX) dùng được index
+_PREFIX_END = '\U0010ffff'
+
+
+def fold_accents(value):
+    # "Nguyễn Đức" -> "Nguyen Duc"
+    value = value.replace('đ', 'd').replace('Đ', 'D')
+    decomposed = unicodedata.normalize('NFD', value)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+_fts_tables = {}
+
+
+def has_fts():
+    engine = db.engine
+    if engine not in _fts_tables:
+        _fts_tables[engine] = inspect(engine).has_table('student_fts')
+    return _fts_tables[engine]
+
+
+def rebuild_fts():
+    # Tạo lại bảng FTS và trigger cho CSDL cũ, rồi nạp lại toàn bộ họ tên
+    with db.engine.begin() as conn:
+        for statement in STUDENT_FTS_DDL:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql("DELETE FROM student_fts")
+        conn.exec_driver_sql(
+            "INSERT INTO student_fts(rowid, full_name) SELECT id, "
+            + STUDENT_FTS_FOLD.format('full_name') + " FROM student"
+        )
+    _fts_tables[db.engine] = True
+
+
+def _prefix(column, value):
+    return db.and_(column >= value, column < value + _PREFIX_END)
+
+
+def _fts_match(term):
+    tokens = fold_accents(term).split()
+    return ' '.join('"' + token.replace('"', '""') + '"*' for token in tokens)
+
+
+def search_filter(q):
+    q = q.strip()
+    conditions = [
+        _prefix(Student.student_id, q),
+        _prefix(Student.email, q),
+        _prefix(Student.full_name, q),
+    ]
+    match = _fts_match(q)
+    if match and has_fts():
+        conditions.append(Student.id.in_(
+            text("SELECT rowid FROM student_fts WHERE student_fts MATCH :match")
+            .bindparams(match=match)
+            .columns(db.column('rowid'))
+        ))
+    return db.or_(*conditions)
+
+
+def student_page(q=None, class_id=None, after_id=None, limit=PAGE_SIZE):
+    query = Student.query
+    if q and q.strip():
+        query = query.filter(search_filter(q))
+    if class_id:
+        query = query.filter(Student.class_id == class_id)
+    if after_id:
+        query = query.filter(Student.id > after_id)
+    rows = query.order_by(Student.id).limit(limit + 1).all()
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def class_choices():
+    return db.session.query(Class.id, Class.code, Class.name).order_by(Class.code).all()
+
+
+def serialize(student):
+    return {
+        'id': student.id,
+        'student_id': student.student_id,
+        'full_name': student.full_name,
+        'dob': student.dob,
+        'email': student.email,
+        'class_id': student.class_id,
+    }
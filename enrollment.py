@@ -0,0 +1,155 @@
+import threading
+import time
+from database import conflict_insert
+from models import db, Course, Enrollment, Student, User
+from write_queue import WriteQueueBusy, WriteQueuePending, get_queue
+
+ENROLLED = 'enrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+COURSE_FULL = 'course_full'
+NOT_FOUND = 'not_found'
+BUSY = 'busy'
+PENDING = 'pending'
+
+MESSAGES = {
+    ENROLLED: 'Đăng ký môn học thành công',
+    ALREADY_ENROLLED: 'Bạn đã đăng ký môn học này',
+    COURSE_FULL: 'Môn học đã đủ số lượng sinh viên',
+    NOT_FOUND: 'Không tìm thấy môn học',
+    BUSY: 'Hệ thống đang bận, vui lòng thử lại sau',
+    PENDING: 'Yêu cầu đang được xử lý, vui lòng tải lại trang sau ít phút để xem kết quả',
+}
+
+
+def active_count(course_id):
+    return db.select(db.func.count(Enrollment.id))\
+        .where(Enrollment.course_id == course_id, Enrollment.status == 'active')\
+        .scalar_subquery()
+
+
+def insert_ignoring_conflicts(model):
+    # INSERT ... ON CONFLICT DO NOTHING theo cú pháp của CSDL đang dùng
+    return conflict_insert(model, db.session.get_bind().dialect.name)
+
+
+def _enroll(student_id, course_id):
+    # INSERT ... SELECT ... WHERE còn chỗ ON CONFLICT DO NOTHING: kiểm tra sĩ số và
+    # chống trùng nằm trong cùng một câu lệnh, không có khoảng hở check-then-insert.
+    capacity = db.select(Course.capacity).where(Course.id == course_id).scalar_subquery()
+    has_seat = db.select(
+        db.literal(student_id), db.literal(course_id), db.literal('active')
+    ).where(
+        db.exists().where(Course.id == course_id),
+        db.or_(capacity.is_(None), active_count(course_id) < capacity),
+    )
+    stmt = insert_ignoring_conflicts(Enrollment)\
+        .from_select(['student_id', 'course_id', 'status'], has_seat)\
+        .on_conflict_do_nothing(index_elements=['student_id', 'course_id'])
+    inserted = db.session.execute(stmt).rowcount
+    db.session.commit()
+    if inserted:
+        return ENROLLED
+    if Enrollment.query.filter_by(student_id=student_id, course_id=course_id).first():
+        return ALREADY_ENROLLED
+    if not db.session.query(Course.id).filter_by(id=course_id).first():
+        return NOT_FOUND
+    return COURSE_FULL
+
+
+def _unenroll(student_id, course_id):
+    deleted = db.session.execute(
+        db.delete(Enrollment)
+        .where(Enrollment.student_id == student_id, Enrollment.course_id == course_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return deleted > 0
+
+
+def _through_queue(app, fn, *args):
+    # Trả kết nối của request về pool trước khi chờ: luồng ghi cũng lấy kết nối từ pool đó,
+    # giữ lại thì khi pool cạn các request và luồng ghi chờ lẫn nhau
+    db.session.close()
+    try:
+        return get_queue(app).run(fn, *args)
+    except WriteQueueBusy:
+        return BUSY
+    except WriteQueuePending:
+        return PENDING
+
+
+def enroll(app, student_id, course_id):
+    return _through_queue(app, _enroll, student_id, course_id)
+
+
+def unenroll(app, student_id, course_id):
+    return _through_queue(app, _unenroll, student_id, course_id)
+
+
+def seat_counts(course_ids):
+    if not course_ids:
+        return {}
+    return dict(
+        db.session.query(Enrollment.course_id, db.func.count(Enrollment.id))
+        .filter(Enrollment.course_id.in_(course_ids), Enrollment.status == 'active')
+        .group_by(Enrollment.course_id)
+        .all()
+    )
+
+
+def load_test(app, students=2000, capacity=100, threads=32, attempts=2):
+    # Giả lập đợt mở đăng ký: nhiều luồng cùng POST /enroll vào một môn có giới hạn sĩ số,
+    # mỗi sinh viên bấm nhiều lần. Kết quả đúng: số bản ghi = min(sĩ số, số sinh viên), không trùng.
+    from queryplan import login_as
+
+    code = f"LOAD{int(time.time())}"
+    course = Course(code=code, name='Kiểm thử tải đăng ký', credits=3, capacity=capacity)
+    db.session.add(course)
+    db.session.commit()
+    course_id = course.id
+    users = User.query.join(Student, Student.student_id == User.username)\
+        .filter(User.role == 'student')\
+        .order_by(User.id)\
+        .limit(students)\
+        .all()
+    batches = [users[i::threads] for i in range(threads)]
+    statuses = {}
+    errors = []
+    lock = threading.Lock()
+
+    def worker(batch):
+        client = app.test_client()
+        for user in batch:
+            login_as(client, user)
+            for _ in range(attempts):
+                response = client.post('/enroll', data={'course_id': str(course_id)})
+                with lock:
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    if response.status_code >= 500:
+                        errors.append(user.username)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(batch,)) for batch in batches]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    enrolled = Enrollment.query.filter_by(course_id=course_id).count()
+    distinct = db.session.query(db.func.count(db.distinct(Enrollment.student_id)))\
+        .filter(Enrollment.course_id == course_id).scalar()
+    result = {
+        'students': len(users),
+        'requests': len(users) * attempts,
+        'capacity': capacity,
+        'enrolled': enrolled,
+        'duplicates': enrolled - distinct,
+        'http_statuses': statuses,
+        'errors': len(errors),
+        'seconds': round(elapsed, 2),
+        'ok': enrolled == min(capacity, len(users)) and enrolled == distinct and not errors,
+    }
+    db.session.delete(db.session.get(Course, course_id))
+    db.session.commit()
+    return result
@@ -0,0 +1,246 @@
+import heapq
+from bisect import bisect_left
+from datetime import date, timedelta
+from models import db, Student, Course, ClassCourse, Schedule, Exam
+import conflicts
+import schedules
+
+# Thời lượng (phút) theo loại thi
+EXAM_DURATIONS = {'midterm': 60, 'final': 90}
+# Các ca thi trong ngày
+SLOT_TIMES = ['07:30', '09:45', '13:00', '15:15']
+DEFAULT_ROOM_CAPACITY = 50
+
+
+class ExamPlan:
+    def __init__(self, semester):
+        self.semester = semester
+        self.exams = []
+        self.unscheduled = []
+
+    def to_dict(self):
+        return {
+            'semester': self.semester,
+            'scheduled': len(self.exams),
+            'unscheduled': len(self.unscheduled),
+            'unscheduled_items': self.unscheduled,
+        }
+
+
+def parse_window(value):
+    # "2025-10-20:2025-10-31" -> (date, date)
+    start, end = value.split(':')
+    start, end = date.fromisoformat(start), date.fromisoformat(end)
+    if end < start:
+        raise ValueError(f'Khoảng ngày thi không hợp lệ: {value}')
+    return start, end
+
+
+def parse_rooms(value):
+    # "B101:60,B201:80" -> {'B101': 60, 'B201': 80}
+    rooms = {}
+    for item in value.split(','):
+        name, _, capacity = item.strip().partition(':')
+        if name:
+            rooms[name] = int(capacity) if capacity else DEFAULT_ROOM_CAPACITY
+    return rooms
+
+
+def default_rooms():
+    # Không có bảng phòng: lấy các phòng đang dùng trong thời khóa biểu
+    return {row[0]: DEFAULT_ROOM_CAPACITY for row in db.session.query(Schedule.room).distinct()}
+
+
+def exam_days(start, end):
+    # Các ngày thi trong khoảng, bỏ Chủ nhật
+    days, current = [], start
+    while current <= end:
+        if current.weekday() != 6:
+            days.append(current)
+        current += timedelta(days=1)
+    return days
+
+
+def load_class_courses(semester):
+    size = db.select(db.func.count(Student.id))\
+        .where(Student.class_id == ClassCourse.class_id)\
+        .scalar_subquery()
+    return db.session.query(ClassCourse.class_id, ClassCourse.course_id, Course.lecturer, size)\
+        .join(Course, Course.id == ClassCourse.course_id)\
+        .filter(ClassCourse.semester == semester)\
+        .order_by(ClassCourse.id)\
+        .all()
+
+
+def _overlaps(start_a, duration_a, start_b, duration_b):
+    a, b = conflicts.to_minutes(start_a), conflicts.to_minutes(start_b)
+    return a < b + duration_b and b < a + duration_a
+
+
+class _Scheduler:
+    # Tô màu đồ thị xung đột theo DSatur: đỉnh là cặp lớp - môn, hai đỉnh kề nhau khi
+    # chung lớp hoặc chung giảng viên, màu là ca thi (ngày, giờ). Đồ thị không dựng
+    # tường minh: các đỉnh chung tài nguyên tạo thành một clique, nên các ca bận của
+    # một đỉnh chính là hợp các ca bận của lớp và giảng viên của nó.
+    def __init__(self, rooms):
+        self.rooms = sorted((capacity, name) for name, capacity in rooms.items())
+        self.busy = {}
+        self.class_days = set()
+        self.free_rooms = {}
+
+    def _resources(self, class_id, lecturer):
+        keys = [('class', class_id)]
+        if lecturer:
+            keys.append(('lecturer', lecturer))
+        return keys
+
+    def _room_list(self, slot):
+        if slot not in self.free_rooms:
+            self.free_rooms[slot] = list(self.rooms)
+        return self.free_rooms[slot]
+
+    def reserve(self, slot, class_id, lecturer, room=None):
+        for key in self._resources(class_id, lecturer):
+            self.busy.setdefault(key, set()).add(slot)
+        self.class_days.add((class_id, slot[0]))
+        if room is not None:
+            free = self._room_list(slot)
+            for i, item in enumerate(free):
+                if item[1] == room:
+                    del free[i]
+                    break
+
+    def block_existing(self, exams, slots, duration):
+        # Lịch thi đã có (các loại thi không xếp lại) chiếm các ca trùng giờ
+        by_day = {}
+        for slot in slots:
+            by_day.setdefault(slot[0], []).append(slot)
+        for exam, lecturer in exams:
+            for slot in by_day.get(exam.exam_date, []):
+                if _overlaps(exam.start_time, exam.duration, slot[1], duration):
+                    self.reserve(slot, exam.class_id, lecturer, exam.room)
+
+    def _pick_room(self, slot, size):
+        free = self._room_list(slot)
+        i = bisect_left(free, (size, ''))
+        if i == len(free):
+            return None
+        return free.pop(i)[1]
+
+    def _place(self, class_id, lecturer, size, slots):
+        busy = set()
+        for key in self._resources(class_id, lecturer):
+            busy |= self.busy.get(key, set())
+        # Ưu tiên ngày lớp chưa có môn thi nào, sau đó mới chấp nhận thi hai môn một ngày
+        for spread in (True, False):
+            for slot in slots:
+                if slot in busy or (spread and (class_id, slot[0]) in self.class_days):
+                    continue
+                room = self._pick_room(slot, size)
+                if room is not None:
+                    self.reserve(slot, class_id, lecturer)
+                    return slot, room
+        return None, None
+
+    def run(self, nodes, slots):
+        groups = {}
+        for i, (class_id, _, lecturer, _) in enumerate(nodes):
+            for key in self._resources(class_id, lecturer):
+                groups.setdefault(key, []).append(i)
+        degree = [sum(len(groups[key]) - 1 for key in self._resources(n[0], n[2])) for n in nodes]
+
+        def saturation(i):
+            busy = set()
+            for key in self._resources(nodes[i][0], nodes[i][2]):
+                busy |= self.busy.get(key, set())
+            return len(busy)
+
+        heap = [(-saturation(i), -degree[i], i) for i in range(len(nodes))]
+        heapq.heapify(heap)
+        done = [False] * len(nodes)
+        placed, failed = [], []
+        while heap:
+            neg_sat, neg_degree, i = heapq.heappop(heap)
+            if done[i]:
+                continue
+            current = saturation(i)
+            if current != -neg_sat:
+                heapq.heappush(heap, (-current, neg_degree, i))
+                continue
+            done[i] = True
+            class_id, course_id, lecturer, size = nodes[i]
+            slot, room = self._place(class_id, lecturer, size, slots)
+            if slot is None:
+                failed.append(i)
+                continue
+            placed.append((i, slot, room))
+            # Cập nhật độ bão hòa của các đỉnh kề (đẩy lại vào heap, bản cũ bị bỏ qua khi lấy ra)
+            for key in self._resources(class_id, lecturer):
+                for j in groups[key]:
+                    if not done[j]:
+                        heapq.heappush(heap, (-saturation(j), -degree[j], j))
+        return placed, failed
+
+
+def plan_exams(semester, windows, rooms=None, durations=None, slot_times=SLOT_TIMES):
+    # windows: {'midterm': (ngày bắt đầu, ngày kết thúc), 'final': (...)}
+    durations = dict(EXAM_DURATIONS, **(durations or {}))
+    rooms = rooms or default_rooms()
+    if not rooms:
+        raise ValueError('Chưa có phòng thi nào')
+    minutes = [conflicts.to_minutes(t) for t in slot_times]
+    gap = min((b - a for a, b in zip(minutes, minutes[1:])), default=24 * 60)
+    for exam_type in windows:
+        if durations[exam_type] > gap:
+            raise ValueError(f'Thời lượng thi {exam_type} dài hơn khoảng cách giữa hai ca')
+
+    plan = ExamPlan(semester)
+    nodes = load_class_courses(semester)
+    largest = max(rooms.values())
+    scheduler = _Scheduler(rooms)
+    existing = db.session.query(Exam, Course.lecturer)\
+        .outerjoin(Course, Course.id == Exam.course_id)\
+        .filter(Exam.semester == semester, Exam.exam_type.notin_(list(windows)))\
+        .all()
+    all_slots = [(day, t) for start, end in windows.values() for day in exam_days(start, end) for t in slot_times]
+    scheduler.block_existing(existing, all_slots, max(durations[t] for t in windows))
+
+    schedulable = [n for n in nodes if n[3] <= largest]
+    for class_id, course_id, _, size in nodes:
+        if size > largest:
+            plan.unscheduled.append({'class_id': class_id, 'course_id': course_id,
+                                     'reason': f'Không có phòng đủ {size} chỗ'})
+    for exam_type, (start, end) in windows.items():
+        slots = [(day, t) for day in exam_days(start, end) for t in slot_times]
+        placed, failed = scheduler.run(schedulable, slots)
+        for i, (day, start_time), room in placed:
+            class_id, course_id = schedulable[i][0], schedulable[i][1]
+            plan.exams.append({
+                'course_id': course_id,
+                'class_id': class_id,
+                'exam_date': day,
+                'start_time': start_time,
+                'duration': durations[exam_type],
+                'room': room,
+                'semester': semester,
+                'exam_type': exam_type,
+            })
+        for i in failed:
+            plan.unscheduled.append({'class_id': schedulable[i][0], 'course_id': schedulable[i][1],
+                                     'exam_type': exam_type, 'reason': 'Không còn ca thi trống'})
+    return plan
+
+
+def save_plan(plan, exam_types):
+    # Thay lịch thi các loại được xếp lại bằng một lệnh xóa và một lệnh chèn hàng loạt
+    db.session.execute(
+        db.delete(Exam)
+        .where(Exam.semester == plan.semester, Exam.exam_type.in_(list(exam_types)))
+        .execution_options(synchronize_session=False)
+    )
+    if plan.exams:
+        db.session.execute(Exam.__table__.insert(), plan.exams)
+    db.session.commit()
+    # Lệnh Core không đi qua flush của ORM nên phải tự xóa chỉ mục xung đột và thời khóa biểu
+    conflicts.invalidate(plan.semester)
+    schedules.invalidate(plan.semester)
@@ -0,0 +1,266 @@
+import csv
+from models import db, Student, Course, Grade, ClassCourse
+from queries import with_profile
+import transcript
+
+IMPORT_CHUNK_SIZE = 1000
+PENDING_PAGE_SIZE = 50
+# Giới hạn số lỗi trả về chi tiết, phần còn lại chỉ được đếm
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.total = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'message': message})
+
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'imported': self.imported,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def _is_header(row):
+    try:
+        float(row[2])
+        return False
+    except (IndexError, ValueError):
+        return True
+
+
+def _decoded_lines(stream, report):
+    # Giải mã từng dòng: file lưu bằng mã khác (vd. Excel xuất CSV cp1258) chỉ làm hỏng các dòng đó,
+    # dòng lỗi được báo và thay bằng dòng trống để số dòng vẫn khớp với file
+    for line, raw in enumerate(stream, 1):
+        try:
+            yield raw.decode('utf-8-sig' if line == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            report.total += 1
+            report.add_error(line, 'Dòng không đúng mã hóa UTF-8 (hãy lưu file dưới dạng CSV UTF-8)')
+            yield '\n'
+
+
+def _read_chunks(stream, report):
+    # Đọc file theo từng lô dòng, không nạp cả file vào bộ nhớ
+    reader = csv.reader(_decoded_lines(stream, report))
+    chunk = []
+    for row in reader:
+        if reader.line_num == 1 and _is_header(row):
+            continue
+        if not any(cell.strip() for cell in row):
+            continue
+        chunk.append((reader.line_num, row))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_grades(stream, lecturer):
+    # CSV gồm các cột: mã sinh viên, mã môn học, điểm
+    report = ImportReport()
+    course_cache = {}
+    # (sinh viên, môn) -> dòng đầu tiên trong file đã nhận, để bỏ dòng trùng giữa các lô
+    seen = {}
+    for chunk in _read_chunks(stream, report):
+        parsed = []
+        for line, row in chunk:
+            report.total += 1
+            if len(row) < 3:
+                report.add_error(line, 'Thiếu cột (cần: mã sinh viên, mã môn học, điểm)')
+                continue
+            student_code, course_code = row[0].strip(), row[1].strip()
+            try:
+                value = float(row[2].replace(',', '.'))
+            except ValueError:
+                report.add_error(line, f'Điểm không hợp lệ: {row[2]}')
+                continue
+            if not 0 <= value <= 10:
+                report.add_error(line, f'Điểm phải nằm trong khoảng 0-10: {row[2]}')
+                continue
+            parsed.append((line, student_code, course_code, value))
+
+        # Tra cứu theo tập hợp cho cả lô thay vì từng dòng
+        student_codes = {p[1] for p in parsed}
+        students = dict(
+            db.session.query(Student.student_id, Student.id)
+            .filter(Student.student_id.in_(student_codes))
+            .all()
+        ) if student_codes else {}
+        missing_courses = {p[2] for p in parsed} - course_cache.keys()
+        if missing_courses:
+            found = db.session.query(Course.code, Course.id, Course.lecturer)\
+                .filter(Course.code.in_(missing_courses))\
+                .all()
+            course_cache.update({code: (course_id, owner) for code, course_id, owner in found})
+            course_cache.update({code: None for code in missing_courses - {c[0] for c in found}})
+
+        # Điểm đang chờ xác nhận của các cặp (sinh viên, môn) trong lô: nhập lại cùng file
+        # không được tạo thêm điểm chờ trùng
+        courses = [course_cache[p[2]] for p in parsed if course_cache.get(p[2])]
+        course_ids = {course_id for course_id, owner in courses if owner == lecturer}
+        pending = set(
+            db.session.query(Grade.student_id, Grade.course_id)
+            .filter(Grade.status == 'pending',
+                    Grade.course_id.in_(course_ids),
+                    Grade.student_id.in_(students.values()))
+            .all()
+        ) if course_ids and students else set()
+
+        rows = []
+        for line, student_code, course_code, value in parsed:
+            course = course_cache.get(course_code)
+            if course is None:
+                report.add_error(line, f'Không tìm thấy môn học {course_code}')
+            elif course[1] != lecturer:
+                report.add_error(line, f'Bạn không có quyền nhập điểm cho môn học {course_code}')
+            elif student_code not in students:
+                report.add_error(line, f'Không tìm thấy sinh viên {student_code}')
+            elif (students[student_code], course[0]) in seen:
+                first = seen[(students[student_code], course[0])]
+                report.add_error(line, f'Trùng với dòng {first}: {student_code}, {course_code}')
+            elif (students[student_code], course[0]) in pending:
+                report.add_error(line, f'Sinh viên {student_code} đã có điểm chờ xác nhận môn {course_code}')
+            else:
+                seen[(students[student_code], course[0])] = line
+                rows.append({
+                    'student_id': students[student_code],
+                    'course_id': course[0],
+                    'value': value,
+                    'status': 'pending',
+                    'submitted_by': lecturer,
+                })
+
+        # Mỗi lô là một transaction với một lệnh executemany
+        if rows:
+            db.session.execute(Grade.__table__.insert(), rows)
+            db.session.commit()
+            report.imported += len(rows)
+    report.errors.sort(key=lambda e: e['line'])
+    return report
+
+
+# --- Xác nhận điểm hàng loạt ---
+
+def pending_conditions(course_id=None, lecturer=None, semester=None, grade_ids=None):
+    conditions = [Grade.status == 'pending']
+    if course_id:
+        conditions.append(Grade.course_id == course_id)
+    if lecturer:
+        conditions.append(Grade.course_id.in_(
+            db.select(Course.id).where(Course.lecturer == lecturer)
+        ))
+    if semester:
+        # Học kỳ của điểm: môn học được xếp cho lớp của sinh viên trong học kỳ đó
+        conditions.append(db.exists().where(
+            Student.id == Grade.student_id,
+            ClassCourse.class_id == Student.class_id,
+            ClassCourse.course_id == Grade.course_id,
+            ClassCourse.semester == semester,
+        ))
+    if grade_ids is not None:
+        conditions.append(Grade.id.in_(grade_ids))
+    return conditions
+
+
+def confirm_grades(admin, **filters):
+    # Một lệnh UPDATE cho toàn bộ điểm chờ xác nhận khớp bộ lọc
+    import analytics
+    if filters.get('grade_ids') is None and not any(filters.values()):
+        raise ValueError('Cần ít nhất một điều kiện lọc để xác nhận hàng loạt')
+    conditions = pending_conditions(**filters)
+    student_ids = [row[0] for row in db.session.query(Grade.student_id).filter(*conditions).distinct()]
+    result = db.session.execute(
+        db.update(Grade)
+        .where(*conditions)
+        .values(status='confirmed', confirmed_by=admin, confirmed_at=db.func.current_timestamp())
+        .execution_options(synchronize_session=False)
+    )
+    # Bảng điểm tổng hợp được cập nhật trong cùng transaction
+    transcript.refresh_students(student_ids)
+    db.session.commit()
+    analytics.invalidate()
+    confirmed = result.rowcount
+    requested = len(filters['grade_ids']) if filters.get('grade_ids') is not None else None
+    return {
+        'confirmed': confirmed,
+        'skipped': requested - confirmed if requested is not None else 0,
+    }
+
+
+def _keyset_page(query, after_id, limit):
+    if after_id:
+        query = query.filter(Grade.id > after_id)
+    rows = query.order_by(Grade.id).limit(limit + 1).all()
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def pending_page(after_id=None, limit=PENDING_PAGE_SIZE, **filters):
+    query = with_profile(Grade.query, 'grades').filter(*pending_conditions(**filters))
+    return _keyset_page(query, after_id, limit)
+
+
+def course_grades_page(course_ids, after_id=None, limit=PENDING_PAGE_SIZE):
+    # Điểm (mọi trạng thái) các môn của giảng viên, phân trang theo Grade.id như pending_page
+    query = with_profile(Grade.query, 'grades').filter(Grade.course_id.in_(course_ids))
+    return _keyset_page(query, after_id, limit)
+
+
+def pending_count(**filters):
+    return db.session.query(db.func.count(Grade.id)).filter(*pending_conditions(**filters)).scalar()
+
+
+def semester_choices():
+    return [row[0] for row in db.session.query(ClassCourse.semester).distinct().order_by(ClassCourse.semester)]
+
+
+def _int_field(value, name):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).isdigit():
+        raise ValueError(f'{name} phải là số nguyên')
+    return int(value)
+
+
+def filters_from_json(payload):
+    # Payload JSON của /grades/confirm: kiểm tra kiểu từng trường trước khi đưa vào truy vấn
+    if not isinstance(payload, dict):
+        raise ValueError('Dữ liệu JSON phải là một object')
+    for name in ('lecturer', 'semester'):
+        if payload.get(name) is not None and not isinstance(payload[name], str):
+            raise ValueError(f'{name} phải là chuỗi')
+    grade_ids = payload.get('grade_ids')
+    if grade_ids is not None:
+        if not isinstance(grade_ids, list):
+            raise ValueError('grade_ids phải là danh sách')
+        grade_ids = [_int_field(i, 'grade_ids') for i in grade_ids]
+        if None in grade_ids:
+            raise ValueError('grade_ids phải là số nguyên')
+    return {
+        'course_id': _int_field(payload.get('course_id'), 'course_id'),
+        'lecturer': payload.get('lecturer') or None,
+        'semester': payload.get('semester') or None,
+        'grade_ids': grade_ids,
+    }
+
+
+def filters_from(args):
+    ids = args.getlist('grade_ids')
+    return {
+        'course_id': args.get('course_id', type=int),
+        'lecturer': args.get('lecturer') or None,
+        'semester': args.get('semester') or None,
+        'grade_ids': [int(i) for i in ids if str(i).isdigit()] if ids else None,
+    }
@@ -0,0 +1,83 @@
+from functools import wraps
+from flask import redirect, request, session, url_for
+from cache_invalidation import CommitCache, invalidate_on_commit
+from models import db, Student, Course
+
+
+class Identity:
+    # Người dùng của request hiện tại; Student và danh sách môn của giảng viên chỉ được
+    # truy vấn khi view cần tới, và nhiều nhất một lần mỗi request.
+    def __init__(self, user_id, username, role):
+        self.user_id = user_id
+        self.username = username
+        self.role = role
+        self._student = None
+        self._student_loaded = False
+
+    @property
+    def student(self):
+        if not self._student_loaded:
+            self._student = Student.query.filter_by(student_id=self.username).first() \
+                if self.role == 'student' else None
+            self._student_loaded = True
+        return self._student
+
+    @property
+    def course_ids(self):
+        if self.role != 'lecturer':
+            return frozenset()
+        return lecturer_course_ids(self.username)
+
+    def owns_course(self, course_id):
+        return course_id in self.course_ids
+
+
+def current():
+    # Gắn vào đối tượng request chứ không vào g: g sống theo app context, mà một app context
+    # có thể chứa nhiều request (test client chạy trong app context của lệnh CLI)
+    req = request._get_current_object()
+    if not hasattr(req, 'identity'):
+        req.identity = Identity(session['user_id'], session.get('username'), session.get('role')) \
+            if 'user_id' in session else None
+    return req.identity
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if current() is None:
+            return redirect(url_for('login'))
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def role_required(*roles):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user = current()
+            if user is None or user.role not in roles:
+                return redirect(url_for('login'))
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- Bộ nhớ đệm môn học của giảng viên, xóa sau khi thay đổi bảng Course được commit ---
+
+# owns_course dùng cache này để cấp quyền nhập điểm, nên TTL ngắn để giới hạn thời gian sai lệch
+COURSE_CACHE_TTL = 300
+
+_course_cache = CommitCache(COURSE_CACHE_TTL)
+
+
+def lecturer_course_ids(username):
+    return _course_cache.get_or_create(username, lambda: frozenset(
+        row[0] for row in db.session.query(Course.id).filter(Course.lecturer == username)))
+
+
+def invalidate_courses():
+    _course_cache.invalidate()
+
+
+invalidate_on_commit(Course, invalidate_courses)
@@ -0,0 +1,187 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import Counter
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Mốc histogram thời gian xử lý (giây), theo quy ước của Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Một câu lệnh giống hệt nhau lặp lại từ ngưỡng này trong một request bị coi là N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.sql_statements = Counter()
+        self.sql_seconds = Counter()
+        self.template_seconds = Counter()
+        self.n_plus_one = Counter()
+        self.responses = Counter()
+
+    def record(self, endpoint, status, seconds, stats):
+        with self._lock:
+            self.latency.setdefault(endpoint, Histogram()).observe(seconds)
+            self.sql_statements[endpoint] += stats['count']
+            self.sql_seconds[endpoint] += stats['seconds']
+            self.template_seconds[endpoint] += stats['template_seconds']
+            self.n_plus_one[endpoint] += len(stats['repeated'])
+            self.responses[(endpoint, status)] += 1
+
+    def render(self):
+        lines = []
+
+        def counter(name, help_text, values, label='endpoint'):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for key, value in sorted(values.items()):
+                lines.append(f'{name}{{{label}="{key}"}} {value:g}')
+
+        with self._lock:
+            lines.append('# HELP sms_request_duration_seconds Thời gian xử lý request theo endpoint')
+            lines.append('# TYPE sms_request_duration_seconds histogram')
+            for endpoint, h in sorted(self.latency.items()):
+                for bound, count in zip(h.buckets, h.counts):
+                    lines.append(f'sms_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound:g}"}} {count}')
+                lines.append(f'sms_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {h.total}')
+                lines.append(f'sms_request_duration_seconds_sum{{endpoint="{endpoint}"}} {h.sum:.6f}')
+                lines.append(f'sms_request_duration_seconds_count{{endpoint="{endpoint}"}} {h.total}')
+            lines.append('# HELP sms_responses_total Số response theo endpoint và mã trạng thái')
+            lines.append('# TYPE sms_responses_total counter')
+            for (endpoint, status), value in sorted(self.responses.items()):
+                lines.append(f'sms_responses_total{{endpoint="{endpoint}",status="{status}"}} {value}')
+            counter('sms_sql_statements_total', 'Số câu lệnh SQL', self.sql_statements)
+            counter('sms_sql_seconds_total', 'Tổng thời gian chạy SQL (giây)', self.sql_seconds)
+            counter('sms_template_seconds_total', 'Tổng thời gian render template (giây)', self.template_seconds)
+            counter('sms_n_plus_one_total', 'Số lần phát hiện câu lệnh lặp kiểu N+1', self.n_plus_one)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _stats():
+    if 'instrumentation' not in g:
+        g.instrumentation = {
+            'count': 0,
+            'seconds': 0.0,
+            'template_seconds': 0.0,
+            'statements': Counter(),
+            'repeated': [],
+        }
+    return g.instrumentation
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('instrumentation_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['instrumentation_started'].pop()
+    # Truy vấn hạ tầng (kho phiên, chạy sau after_request) không tính vào số liệu của view
+    if has_request_context() and not conn.get_execution_options().get('skip_query_budget'):
+        stats = _stats()
+        stats['count'] += 1
+        stats['seconds'] += time.perf_counter() - started
+        stats['statements'][statement] += 1
+
+
+def _before_render(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        _stats()['template_seconds'] += time.perf_counter() - started
+
+
+def _repeated(stats):
+    return [(s, n) for s, n in stats['statements'].items() if n >= N_PLUS_ONE_THRESHOLD]
+
+
+def server_timing(total, stats):
+    parts = [
+        f'app;dur={total * 1000:.1f}',
+        f'db;dur={stats["seconds"] * 1000:.1f};desc="{stats["count"]} queries"',
+        f'tpl;dur={stats["template_seconds"] * 1000:.1f}',
+    ]
+    if stats['repeated']:
+        parts.append(f'n1;desc="{max(count for _, count in stats["repeated"])}x"')
+    return ', '.join(parts)
+
+
+def init_app(app):
+    app.config.setdefault('SERVER_TIMING', True)
+    # Tỉ lệ request được chạy cProfile và ghi file .prof vào PROFILE_DIR (0 = tắt)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    @app.before_request
+    def start_instrumentation():
+        g.request_started = time.perf_counter()
+        # Thống kê riêng cho từng request, kể cả khi nhiều request chạy trong cùng một app context
+        g.pop('instrumentation', None)
+        _stats()
+        rate = app.config['PROFILE_SAMPLE_RATE']
+        if rate and random.random() < rate:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def add_server_timing(response):
+        # Chỉ gắn header; số liệu được ghi ở teardown để cả request lỗi/500 cũng được tính
+        g.response_status = response.status_code
+        started = g.get('request_started')
+        if started is not None and app.config['SERVER_TIMING']:
+            stats = _stats()
+            stats['repeated'] = _repeated(stats)
+            response.headers['Server-Timing'] = server_timing(time.perf_counter() - started, stats)
+        return response
+
+    @app.teardown_request
+    def finish_instrumentation(exc):
+        # Chạy cả khi view hoặc after_request ném lỗi: profiler luôn được tắt
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        started = g.pop('request_started', None)
+        if started is None:
+            return
+        total = time.perf_counter() - started
+        stats = _stats()
+        stats['repeated'] = _repeated(stats)
+        for statement, count in stats['repeated']:
+            app.logger.warning('N+1 tại %s: %d lần "%s"', request.endpoint, count, ' '.join(statement.split())[:200])
+        endpoint = request.endpoint or 'unknown'
+        status = 500 if exc is not None else g.pop('response_status', 500)
+        metrics.record(endpoint, status, total, stats)
+        if profiler is not None:
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            profiler.dump_stats(os.path.join(
+                app.config['PROFILE_DIR'], f'{endpoint}-{time.time_ns()}-{os.getpid()}.prof'
+            ))
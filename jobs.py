@@ -0,0 +1,228 @@
+import json
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from models import (db, Job, Student, Grade, Enrollment, Payment, CourseRegistration,
+                    TranscriptCourse, TranscriptSemester, TuitionExemption)
+
+# Hàng đợi công việc nền lưu trong bảng job: request chỉ ghi một dòng rồi trả về ngay,
+# worker (luồng trong tiến trình web hoặc tiến trình riêng `flask jobs-worker`) nhận
+# việc bằng UPDATE có điều kiện nên nhiều worker không bao giờ chạy trùng một việc.
+
+HANDLERS = {}
+# Số sinh viên xử lý trong một transaction khi xóa hàng loạt
+DELETE_CHUNK = 200
+
+
+def handler(kind):
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+class JobContext:
+    # Truyền cho hàm xử lý; progress() commit cùng phần việc vừa làm
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def progress(self, done, total=None, message=None):
+        values = {'progress': done, 'updated_at': datetime.utcnow()}
+        if total is not None:
+            values['total'] = total
+        if message is not None:
+            values['message'] = message[:200]
+        db.session.execute(db.update(Job).where(Job.id == self.job_id).values(**values))
+        db.session.commit()
+
+
+def enqueue(kind, created_by=None, max_attempts=3, **params):
+    if kind not in HANDLERS:
+        raise ValueError(f'Không có loại công việc {kind}')
+    job = Job(kind=kind, params=json.dumps(params), created_by=created_by,
+              max_attempts=max_attempts, run_after=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    get_runner(current_app._get_current_object()).notify()
+    return job
+
+
+def claim():
+    # Lấy việc đến hạn sớm nhất; UPDATE ... WHERE status='queued' bảo đảm chỉ một worker thắng
+    now = datetime.utcnow()
+    candidates = db.session.execute(
+        db.select(Job.id).where(Job.status == 'queued', Job.run_after <= now).order_by(Job.id).limit(5)
+    ).scalars().all()
+    for job_id in candidates:
+        claimed = db.session.execute(
+            db.update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+                status='running', attempts=Job.attempts + 1, started_at=now, updated_at=now, error=None
+            )
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    db.session.rollback()
+    return None
+
+
+def execute(job, retry_delay=5.0):
+    job_id, attempts, max_attempts = job.id, job.attempts, job.max_attempts
+    fn = HANDLERS.get(job.kind)
+    try:
+        if fn is None:
+            raise LookupError(f'Không có loại công việc {job.kind}')
+        result = fn(JobContext(job_id), **json.loads(job.params))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception('Công việc #%s (%s) lỗi lần %d', job_id, job.kind, attempts)
+        values = {'error': f'{type(e).__name__}: {e}', 'updated_at': datetime.utcnow()}
+        if fn is not None and attempts < max_attempts:
+            # Thử lại với thời gian chờ tăng gấp đôi; phần việc đã commit không bị làm lại
+            values.update(status='queued', run_after=datetime.utcnow() + timedelta(seconds=retry_delay * 2 ** (attempts - 1)))
+        else:
+            values.update(status='failed', finished_at=datetime.utcnow())
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(**values))
+        db.session.commit()
+        return False
+    now = datetime.utcnow()
+    db.session.execute(db.update(Job).where(Job.id == job_id).values(
+        status='succeeded', result=json.dumps(result), finished_at=now, updated_at=now
+    ))
+    db.session.commit()
+    return True
+
+
+def requeue_stale(stale_after):
+    # Việc 'running' không cập nhật tiến độ quá lâu: worker đã chết, đưa lại vào hàng đợi
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+    db.session.execute(db.update(Job).where(Job.status == 'running', Job.updated_at < cutoff).values(
+        status='queued', run_after=datetime.utcnow()
+    ))
+    db.session.commit()
+
+
+class JobRunner:
+    def __init__(self, app, workers=1, poll_interval=2.0, retry_delay=5.0, stale_after=600):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.stale_after = stale_after
+        self._wake = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            if len(self._threads) >= self.workers:
+                return
+            with self.app.app_context():
+                requeue_stale(self.stale_after)
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self.run_forever, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        self._wake.set()
+
+    def run_next(self):
+        with self.app.app_context():
+            job = claim()
+            if job is None:
+                return False
+            execute(job, self.retry_delay)
+            return True
+
+    def run_forever(self):
+        while True:
+            try:
+                if self.run_next():
+                    continue
+            except Exception:
+                self.app.logger.exception('Worker công việc nền lỗi')
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+def get_runner(app):
+    return app.extensions['job_runner']
+
+
+def init_app(app):
+    # JOBS_WORKERS = 0: không chạy worker trong tiến trình web, dùng `flask jobs-worker` riêng.
+    # Mặc định một luồng vì SQLite chỉ cho một transaction ghi tại một thời điểm.
+    app.config.setdefault('JOBS_WORKERS', 1)
+    app.config.setdefault('JOBS_POLL_INTERVAL', 2.0)
+    app.config.setdefault('JOBS_RETRY_DELAY', 5.0)
+    app.config.setdefault('JOBS_STALE_AFTER', 600)
+    runner = JobRunner(
+        app,
+        workers=app.config['JOBS_WORKERS'],
+        poll_interval=app.config['JOBS_POLL_INTERVAL'],
+        retry_delay=app.config['JOBS_RETRY_DELAY'],
+        stale_after=app.config['JOBS_STALE_AFTER'],
+    )
+    app.extensions['job_runner'] = runner
+
+    @app.before_request
+    def start_job_workers():
+        # Khởi động worker khi có request đầu tiên, không chạy trong các lệnh CLI
+        if runner.workers:
+            runner.start()
+
+
+def serialize(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'message': job.message,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'created_by': job.created_by,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# --- Các loại công việc ---
+
+@handler('delete_students')
+def delete_students(context, student_ids):
+    # Xóa sinh viên cùng điểm, đăng ký, học phí, miễn học phí và bảng điểm tổng hợp bằng
+    # DELETE theo lô; mỗi lô một transaction nên thử lại chỉ làm tiếp phần còn lại.
+    import analytics
+    import dashboard_cache
+    student_ids = sorted(set(student_ids))
+    deleted = 0
+    for i in range(0, len(student_ids), DELETE_CHUNK):
+        chunk = student_ids[i:i + DELETE_CHUNK]
+        codes = db.select(Student.student_id).where(Student.id.in_(chunk)).scalar_subquery()
+        registrations = CourseRegistration.__table__
+        db.session.execute(registrations.delete().where(registrations.c.MaTheSV.in_(codes)))
+        for model in (Grade, Enrollment, Payment, TuitionExemption, TranscriptCourse, TranscriptSemester):
+            table = model.__table__
+            db.session.execute(table.delete().where(table.c.student_id.in_(chunk)))
+        students = Student.__table__
+        deleted += db.session.execute(students.delete().where(students.c.id.in_(chunk))).rowcount
+        context.progress(i + len(chunk), total=len(student_ids))
+        dashboard_cache.bump()
+    analytics.invalidate()
+    return {'deleted': deleted}
+
+
+@handler('rebuild_transcripts')
+def rebuild_transcripts(context):
+    import transcript
+    context.progress(0, total=1, message='Đang dựng lại bảng điểm tổng hợp')
+    transcript.rebuild()
+    context.progress(1, message='Đã dựng lại bảng điểm tổng hợp')
+    return {}
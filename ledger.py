@@ -0,0 +1,52 @@
+from models import db, Payment, Student
+
+PAYMENT_STATUSES = ('pending', 'paid', 'withdrawn', 'free')
+PAGE_SIZE = 50
+
+
+def status_totals():
+    # Một truy vấn GROUP BY thay cho bốn truy vấn SUM riêng lẻ
+    rows = db.session.query(Payment.status, db.func.sum(Payment.amount))\
+        .group_by(Payment.status)\
+        .all()
+    totals = dict.fromkeys(PAYMENT_STATUSES, 0)
+    for status, amount in rows:
+        if status in totals:
+            totals[status] = amount or 0
+    return totals
+
+
+def summary():
+    totals = status_totals()
+    total_paid = totals['paid']
+    total_pending = totals['pending']
+    total_withdrawn = totals['withdrawn']
+    total_free = totals['free']
+    return {
+        "khoan_phai_nop": total_pending,
+        "khoan_duoc_mien": total_free,
+        "khoan_da_nop": total_paid,
+        "khoan_da_rut": total_withdrawn,
+        "tong_no_chung": max(total_pending - total_paid, 0),
+        "tong_du_chung": total_paid - total_withdrawn,
+        "phieu_da_thu": total_paid,
+        "phieu_da_rut": total_withdrawn,
+        "phieu_hoa_don": 0
+    }
+
+
+def payment_page(after_id=None, limit=PAGE_SIZE):
+    # Phân trang keyset theo Payment.id, tên sinh viên được join sẵn trong SQL
+    query = db.session.query(
+        Payment.id,
+        Payment.student_id,
+        Payment.amount,
+        Payment.status,
+        Student.full_name,
+        Student.student_id.label('student_code'),
+    ).outerjoin(Student, Payment.student_id == Student.id)
+    if after_id:
+        query = query.filter(Payment.id > after_id)
+    rows = query.order_by(Payment.id).limit(limit + 1).all()
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_after
@@ -0,0 +1,172 @@
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from models import (db, ClassCourse, CourseRegistration, Enrollment, Job, Payment, SchemaVersion, TranscriptCourse,
+                    TranscriptSemester, TuitionExemption, UserSession, STUDENT_FTS_DDL, STUDENT_FTS_FOLD)
+
+# Mỗi migration chạy đúng một lần và được ghi vào bảng schema_version.
+# Các bước viết theo kiểu "nếu chưa có thì tạo" để chạy lại an toàn khi nhiều worker khởi động cùng lúc.
+
+
+def _columns(conn, table):
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+
+def add_course_capacity(conn):
+    if 'capacity' not in _columns(conn, 'course'):
+        conn.exec_driver_sql('ALTER TABLE course ADD COLUMN capacity INTEGER')
+
+
+def create_transcript_and_session_tables(conn):
+    for table in (TranscriptCourse.__table__, TranscriptSemester.__table__, UserSession.__table__):
+        table.create(conn, checkfirst=True)
+
+
+def enrollment_unique(conn):
+    # Xóa bản ghi đăng ký trùng (giữ bản ghi đầu tiên) rồi mới tạo ràng buộc duy nhất
+    keep = db.select(db.func.min(Enrollment.id)).group_by(Enrollment.student_id, Enrollment.course_id)
+    conn.execute(Enrollment.__table__.delete().where(Enrollment.id.notin_(keep)))
+    conn.exec_driver_sql(
+        'CREATE UNIQUE INDEX IF NOT EXISTS unique_enrollment_student_course '
+        'ON enrollment (student_id, course_id)'
+    )
+
+
+def create_indexes(conn):
+    # Các index khai báo trong models (student, grade, payment, schedule, ...); index trên cột
+    # mà migration sau mới thêm (vd. payment.semester) do chính migration đó tạo
+    existing = set(inspect(conn).get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name in existing:
+            columns = _columns(conn, table.name)
+            for index in table.indexes:
+                if {column.name for column in index.columns} <= columns:
+                    index.create(conn, checkfirst=True)
+
+
+def student_fts(conn):
+    if conn.dialect.name != 'sqlite':
+        return
+    if 'ENABLE_FTS5' not in {row[0] for row in conn.exec_driver_sql('PRAGMA compile_options')}:
+        return
+    for statement in STUDENT_FTS_DDL:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql('DELETE FROM student_fts')
+    conn.exec_driver_sql(
+        'INSERT INTO student_fts(rowid, full_name) SELECT id, '
+        + STUDENT_FTS_FOLD.format('full_name') + ' FROM student'
+    )
+
+
+def rebuild_transcripts(conn):
+    import transcript
+    transcript.rebuild()
+
+
+def create_job_table(conn):
+    Job.__table__.create(conn, checkfirst=True)
+
+
+def tuition_billing(conn):
+    if 'semester' not in _columns(conn, 'payment'):
+        conn.exec_driver_sql('ALTER TABLE payment ADD COLUMN semester VARCHAR(20)')
+    conn.exec_driver_sql(
+        'CREATE UNIQUE INDEX IF NOT EXISTS unique_payment_student_semester '
+        'ON payment (student_id, semester)'
+    )
+    for index in Payment.__table__.indexes:
+        index.create(conn, checkfirst=True)
+    TuitionExemption.__table__.create(conn, checkfirst=True)
+
+
+def class_course_semester_index(conn):
+    for index in ClassCourse.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def course_registration_review(conn):
+    if 'LyDo' not in _columns(conn, 'course_registration'):
+        conn.exec_driver_sql('ALTER TABLE course_registration ADD COLUMN "LyDo" VARCHAR(100)')
+    for index in CourseRegistration.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, 'add_course_capacity', add_course_capacity),
+    (2, 'create_transcript_and_session_tables', create_transcript_and_session_tables),
+    (3, 'enrollment_unique', enrollment_unique),
+    (4, 'create_indexes', create_indexes),
+    (5, 'student_fts', student_fts),
+    (6, 'rebuild_transcripts', rebuild_transcripts),
+    (7, 'create_job_table', create_job_table),
+    (8, 'tuition_billing', tuition_billing),
+    (9, 'class_course_semester_index', class_course_semester_index),
+    (10, 'course_registration_review', course_registration_review),
+]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def _stamp(conn, version, name):
+    conn.execute(SchemaVersion.__table__.insert().values(version=version, name=name))
+
+
+def create_schema():
+    # CSDL trống: tạo toàn bộ schema theo models và đánh dấu đã áp dụng mọi migration.
+    # Nhiều worker cùng khởi động: với SQLite, BEGIN IMMEDIATE giữ khóa ghi suốt lúc tạo bảng và
+    # ghi phiên bản, worker sau chờ rồi thấy mọi thứ đã có; CSDL khác: worker thua gặp IntegrityError
+    # ở schema_version và coi như đã áp dụng, giống upgrade()
+    try:
+        with db.engine.begin() as conn:
+            if conn.dialect.name == 'sqlite':
+                conn.exec_driver_sql('BEGIN IMMEDIATE')
+            db.metadata.create_all(conn)
+            stamped = set(conn.execute(db.select(SchemaVersion.version)).scalars())
+            for version, name, _ in MIGRATIONS:
+                if version not in stamped:
+                    _stamp(conn, version, name)
+    except IntegrityError:
+        pass
+
+
+def current_version():
+    tables = set(inspect(db.engine).get_table_names())
+    if 'schema_version' not in tables:
+        # Có bảng dữ liệu nhưng chưa có schema_version: CSDL từ trước khi có migration
+        return None if 'user' not in tables else 0
+    return db.session.query(db.func.max(SchemaVersion.version)).scalar() or 0
+
+
+def upgrade():
+    # Trả về danh sách migration vừa áp dụng; CSDL đã mới nhất chỉ tốn hai truy vấn
+    version = current_version()
+    if version is None:
+        create_schema()
+        return ['create_schema']
+    applied = []
+    if version < latest_version():
+        SchemaVersion.__table__.create(db.engine, checkfirst=True)
+    for number, name, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        # Lỗi trong thân migration (kể cả IntegrityError) được ném ra: migration hỏng không được
+        # bỏ qua để các migration sau ghi số phiên bản cao hơn
+        migrate(db.session.connection())
+        try:
+            # Lấy lại kết nối: migration có thể đã commit (ví dụ dựng lại bảng điểm)
+            _stamp(db.session.connection(), number, name)
+            db.session.commit()
+        except IntegrityError:
+            # Trùng khóa ở schema_version: worker khác vừa áp dụng migration này
+            db.session.rollback()
+            continue
+        applied.append(name)
+    return applied
+
+
+def init_app(app):
+    app.config.setdefault('AUTO_MIGRATE', True)
+    if app.config['AUTO_MIGRATE']:
+        with app.app_context():
+            upgrade()
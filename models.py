@@ -1,7 +1,9 @@
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class Class(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,20 +16,46 @@ class Class(db.Model):
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.String(20), unique=True, nullable=False)
-    full_name = db.Column(db.String(100), nullable=False)
+    full_name = db.Column(db.String(100), nullable=False, index=True)
     dob = db.Column(db.String(20), nullable=True)
-    email = db.Column(db.String(100), nullable=True)
-    class_id = db.Column(db.Integer, db.ForeignKey('class.id', ondelete='SET NULL'), nullable=True)
+    email = db.Column(db.String(100), nullable=True, index=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id', ondelete='SET NULL'), nullable=True, index=True)
     grades = db.relationship('Grade', backref='student', lazy=True, cascade='all, delete-orphan')
     enrollments = db.relationship('Enrollment', backref='student', lazy=True, cascade='all, delete-orphan')
     payments = db.relationship('Payment', backref='student', lazy=True, cascade='all, delete-orphan')
 
+# Bảng FTS5 tìm kiếm họ tên không dấu, đồng bộ với bảng student bằng trigger.
+# unicode61 bỏ dấu thanh nhưng không chuyển 'đ' thành 'd' nên phải thay thủ công.
+STUDENT_FTS_FOLD = "replace(replace({}, 'đ', 'd'), 'Đ', 'D')"
+
+def _sqlite_has_fts5(ddl, target, bind, **kw):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return 'ENABLE_FTS5' in {row[0] for row in bind.exec_driver_sql('PRAGMA compile_options')}
+
+STUDENT_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS student_fts USING fts5(full_name, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS student_fts_ai AFTER INSERT ON student BEGIN "
+    "INSERT INTO student_fts(rowid, full_name) VALUES (new.id, " + STUDENT_FTS_FOLD.format('new.full_name') + "); END",
+    "CREATE TRIGGER IF NOT EXISTS student_fts_ad AFTER DELETE ON student BEGIN "
+    "DELETE FROM student_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS student_fts_au AFTER UPDATE OF id, full_name ON student BEGIN "
+    "DELETE FROM student_fts WHERE rowid = old.id; "
+    "INSERT INTO student_fts(rowid, full_name) VALUES (new.id, " + STUDENT_FTS_FOLD.format('new.full_name') + "); END",
+]
+
+for _statement in STUDENT_FTS_DDL:
+    event.listen(Student.__table__, 'after_create', DDL(_statement).execute_if(callable_=_sqlite_has_fts5))
+event.listen(Student.__table__, 'before_drop',
+             DDL("DROP TABLE IF EXISTS student_fts").execute_if(dialect='sqlite'))
+
 class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(20), unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
     credits = db.Column(db.Integer, default=3)
-    lecturer = db.Column(db.String(50), nullable=True)
+    lecturer = db.Column(db.String(50), nullable=True, index=True)
+    capacity = db.Column(db.Integer, nullable=True)  # Sĩ số tối đa, None = không giới hạn
     grades = db.relationship('Grade', backref='course', lazy=True, cascade='all, delete-orphan')
     enrollments = db.relationship('Enrollment', backref='course', lazy=True, cascade='all, delete-orphan')
     schedules = db.relationship('Schedule', backref='course', lazy=True, cascade='all, delete-orphan')
@@ -43,6 +71,8 @@ class ClassCourse(db.Model):
     # Đảm bảo mỗi lớp chỉ học mỗi môn một lần trong một học kỳ
     __table_args__ = (
         db.UniqueConstraint('class_id', 'course_id', 'semester', name='unique_class_course_semester'),
+        # Lọc danh mục môn theo học kỳ không kèm lớp
+        db.Index('ix_class_course_semester', 'semester', 'course_id'),
     )
 
 class CourseRegistration(db.Model):
@@ -52,14 +82,21 @@ class CourseRegistration(db.Model):
     NgayDangKy = db.Column(db.DateTime, default=db.func.current_timestamp())  # Ngày đăng ký
     HocKy = db.Column(db.String(20), nullable=False)  # Học kỳ đăng ký
     TrangThai = db.Column(db.String(20), default='Chưa duyệt')  # Trạng thái đăng ký
+    LyDo = db.Column(db.String(100))  # Lý do từ chối khi duyệt (xem registrations.py)
 
     student = db.relationship('Student', backref='course_registrations', lazy=True)
     course = db.relationship('Course', backref='course_registrations', lazy=True)
 
+    # Duyệt theo học kỳ: lấy các phiếu chưa duyệt của một học kỳ
+    __table_args__ = (
+        db.Index('ix_course_registration_hocky_status', 'HocKy', 'TrangThai'),
+        db.Index('ix_course_registration_student', 'MaTheSV'),
+    )
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
-    password = db.Column(db.String(100), nullable=False, default='123456')
+    password = db.Column(db.String(255), nullable=False)  # Mật khẩu đã băm (xem auth.py)
     role = db.Column(db.String(20), nullable=False)  # admin, lecturer, student
 
     @staticmethod
@@ -73,6 +110,44 @@ class User(db.Model):
         return None
 
 
+class SchemaVersion(db.Model):
+    # Các migration đã áp dụng (xem migrations.py)
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+
+class UserSession(db.Model):
+    # Phiên đăng nhập lưu phía máy chủ, cookie chỉ chứa mã phiên
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Job(db.Model):
+    # Công việc nền chạy ngoài luồng xử lý request (xem jobs.py)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(200), nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False)  # Thời điểm sớm nhất được chạy (lùi lại khi thử lại)
+    created_by = db.Column(db.String(50), nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)  # Cập nhật theo tiến độ, dùng để phát hiện worker chết
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
 
 class Enrollment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -81,6 +156,12 @@ class Enrollment(db.Model):
     enrolled_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     status = db.Column(db.String(20), default='active')  # active, dropped
 
+    # Mỗi sinh viên chỉ đăng ký một môn một lần
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='unique_enrollment_student_course'),
+        db.Index('ix_enrollment_course', 'course_id'),
+    )
+
 class Grade(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'))
@@ -93,6 +174,13 @@ class Grade(db.Model):
     confirmed_at = db.Column(db.DateTime, nullable=True)
     note = db.Column(db.String(200), nullable=True)  # Optional note about the grade
 
+    # Sinh viên xem điểm đã xác nhận, giảng viên xem theo môn, admin lọc điểm chờ xác nhận
+    __table_args__ = (
+        db.Index('ix_grade_student_status', 'student_id', 'status'),
+        db.Index('ix_grade_course_status', 'course_id', 'status'),
+        db.Index('ix_grade_status', 'status'),
+    )
+
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'))
@@ -100,6 +188,63 @@ class Payment(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, paid, withdrawn, free
     payment_date = db.Column(db.DateTime, nullable=True)
     note = db.Column(db.String(200), nullable=True)
+    semester = db.Column(db.String(20), nullable=True)  # Học kỳ của hóa đơn học phí tự sinh, None = phiếu nhập tay
+
+    # (status, amount) là index bao phủ cho truy vấn tổng hợp theo trạng thái;
+    # mỗi sinh viên chỉ có một hóa đơn học phí mỗi học kỳ (chạy lại billing không sinh trùng)
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'semester', name='unique_payment_student_semester'),
+        db.Index('ix_payment_student_status', 'student_id', 'status'),
+        db.Index('ix_payment_status_amount', 'status', 'amount'),
+        db.Index('ix_payment_semester_status', 'semester', 'status'),
+    )
+
+class TuitionExemption(db.Model):
+    # Sinh viên được miễn học phí: hóa đơn sinh ra có trạng thái 'free'
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+    semester = db.Column(db.String(20), nullable=True)  # None = miễn mọi học kỳ
+    reason = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'semester', name='unique_tuition_exemption'),
+    )
+
+class TranscriptCourse(db.Model):
+    # Điểm xác nhận mới nhất của mỗi sinh viên cho từng môn (bảng tổng hợp, dựng lại từ Grade)
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete='CASCADE'), nullable=False)
+    grade_id = db.Column(db.Integer, nullable=False)
+    semester = db.Column(db.String(20), nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    credits = db.Column(db.Integer, nullable=False)
+
+    student = db.relationship('Student', backref=db.backref('transcript_courses', lazy=True, cascade='all, delete-orphan'))
+    course = db.relationship('Course', backref=db.backref('transcript_courses', lazy=True, cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='unique_transcript_course'),
+    )
+
+class TranscriptSemester(db.Model):
+    # GPA có trọng số tín chỉ theo học kỳ; semester = 'TICH_LUY' là tổng tích lũy
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+    semester = db.Column(db.String(20), nullable=False)
+    credits_attempted = db.Column(db.Integer, nullable=False, default=0)
+    credits_earned = db.Column(db.Integer, nullable=False, default=0)
+    grade_points = db.Column(db.Float, nullable=False, default=0)  # Tổng tín chỉ x điểm
+    gpa = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    student = db.relationship('Student', backref=db.backref('transcript_semesters', lazy=True, cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'semester', name='unique_transcript_semester'),
+        db.Index('ix_transcript_semester_rank', 'semester', 'gpa'),
+    )
 
 class News(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -111,7 +256,7 @@ class News(db.Model):
 
 class Schedule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete='CASCADE'))
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete='CASCADE'), index=True)
     class_id = db.Column(db.Integer, db.ForeignKey('class.id', ondelete='CASCADE'))
     day_of_week = db.Column(db.Integer)  # 0 = Monday, 6 = Sunday
     start_time = db.Column(db.String(5), nullable=False)    # Format: "HH:MM"
@@ -144,18 +289,20 @@ class Exam(db.Model):
     )
 
 def init_db():
+    import migrations
     # Xóa tất cả dữ liệu cũ
     db.drop_all()
-    # Tạo lại các bảng mới
-    db.create_all()
+    # Tạo lại các bảng mới (đánh dấu đã ở phiên bản schema mới nhất)
+    migrations.create_schema()
     
     try:
-        # 1. Tạo người dùng mẫu
+        # 1. Tạo người dùng mẫu (mật khẩu mặc định 123456, lưu dạng băm)
+        import auth
         users = [
-            User(username='@admin', role='admin', password='123456'),
-            User(username='GV001', role='lecturer', password='123456'),
-            User(username='20230001', role='student', password='123456'),
-            User(username='20230002', role='student', password='123456'),
+            User(username='@admin', role='admin', password=auth.hash_password('123456')),
+            User(username='GV001', role='lecturer', password=auth.hash_password('123456')),
+            User(username='20230001', role='student', password=auth.hash_password('123456')),
+            User(username='20230002', role='student', password=auth.hash_password('123456')),
         ]
         db.session.add_all(users)
         db.session.commit()
@@ -295,43 +442,18 @@ def init_db():
         db.session.add_all(schedules)
         db.session.commit()
 
-        # 10. Tạo lịch thi mẫu
-        exams = []
-        from datetime import date, timedelta
-        exam_date = date(2025, 12, 15)  # Ngày thi 15/12/2025
-        
-        for class_course in class_courses:
-            # Thi giữa kỳ
-            exams.append(
-                Exam(
-                    course_id=class_course.course_id,
-                    class_id=class_course.class_id,
-                    exam_date=exam_date,
-                    start_time='08:00',
-                    duration=60,  # 60 phút
-                    room='B101',
-                    semester='HK1-2025',
-                    exam_type='midterm'
-                )
-            )
-            
-            # Thi cuối kỳ
-            exams.append(
-                Exam(
-                    course_id=class_course.course_id,
-                    class_id=class_course.class_id,
-                    exam_date=exam_date + timedelta(days=7),  # 1 tuần sau
-                    start_time='08:00',
-                    duration=90,  # 90 phút
-                    room='B201',
-                    semester='HK1-2025',
-                    exam_type='final'
-                )
-            )
-            exam_date += timedelta(days=1)  # Mỗi lớp thi cách nhau 1 ngày
-        
-        db.session.add_all(exams)
-        db.session.commit()
+        # 10. Xếp lịch thi mẫu tự động (không trùng lớp, phòng, giảng viên)
+        from datetime import date
+        import exam_scheduler
+        windows = {
+            'midterm': (date(2025, 10, 20), date(2025, 10, 31)),
+            'final': (date(2025, 12, 15), date(2025, 12, 27)),
+        }
+        plan = exam_scheduler.plan_exams('HK1-2025', windows, rooms={'B101': 60, 'B201': 80})
+        exam_scheduler.save_plan(plan, windows)
+
+        import transcript
+        transcript.rebuild()
 
         print("Khởi tạo dữ liệu mẫu thành công!")
         
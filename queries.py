@@ -0,0 +1,58 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload, selectinload
+from models import Course, Grade
+
+# Cấu hình tải trước quan hệ cho từng view (tránh N+1 khi template duyệt quan hệ).
+# Dùng lambda vì backref (Grade.student, Grade.course) chỉ có sau khi mapper được cấu hình.
+LOADING_PROFILES = {
+    'courses': lambda: [selectinload(Course.classes)],
+    'grades': lambda: [joinedload(Grade.student), joinedload(Grade.course)],
+    'student_grades': lambda: [joinedload(Grade.course)],
+}
+
+
+def with_profile(query, view):
+    return query.options(*LOADING_PROFILES[view]())
+
+
+def student_grades(student_id):
+    return with_profile(Grade.query, 'student_grades')\
+        .filter(Grade.student_id == student_id, Grade.status == 'confirmed')\
+        .all()
+
+
+# --- Giới hạn số truy vấn cho mỗi request (dùng khi test) ---
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    # Truy vấn hạ tầng (ví dụ đọc/ghi phiên) đánh dấu skip_query_budget để không bị tính
+    if has_request_context() and not conn.get_execution_options().get('skip_query_budget'):
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def init_query_budget(app):
+    # QUERY_BUDGETS: {endpoint: số truy vấn tối đa}, QUERY_BUDGET: mặc định cho mọi endpoint
+    app.config.setdefault('QUERY_BUDGET', None)
+    app.config.setdefault('QUERY_BUDGETS', {})
+    app.config.setdefault('QUERY_BUDGET_ENFORCE', None)
+
+    @app.after_request
+    def check_query_budget(response):
+        enforce = app.config['QUERY_BUDGET_ENFORCE']
+        if enforce is None:
+            enforce = app.testing
+        if not enforce:
+            return response
+        budget = app.config['QUERY_BUDGETS'].get(request.endpoint, app.config['QUERY_BUDGET'])
+        used = g.get('query_count', 0)
+        if budget is not None and used > budget:
+            raise QueryBudgetExceeded(
+                f"{request.endpoint} dùng {used} truy vấn, vượt giới hạn {budget}"
+            )
+        return response
@@ -0,0 +1,145 @@
+import re
+from sqlalchemy import event
+from models import db, User, Student, Course
+
+# Các request cần kiểm tra: (vai trò, phương thức, đường dẫn, dữ liệu form)
+ROUTE_CHECKS = [
+    ('admin', 'GET', '/dashboard', None),
+    ('lecturer', 'GET', '/dashboard', None),
+    ('student', 'GET', '/dashboard', None),
+    ('admin', 'GET', '/courses', None),
+    ('student', 'GET', '/courses', None),
+    ('admin', 'GET', '/grades', None),
+    ('admin', 'GET', '/grades?semester=HK1-2025', None),
+    ('lecturer', 'GET', '/grades', None),
+    ('student', 'GET', '/grades', None),
+    ('student', 'GET', '/transcript', None),
+    ('admin', 'GET', '/ranking', None),
+    ('admin', 'GET', '/ranking?semester=HK1-2025', None),
+    ('admin', 'GET', '/payments', None),
+    ('admin', 'GET', '/payments?after=1', None),
+    ('admin', 'GET', '/students?after=1', None),
+    ('admin', 'GET', '/students?q=2023', None),
+    ('admin', 'GET', '/students?class_id=1&after=1', None),
+    ('admin', 'GET', '/api/v1/students?after=1', None),
+    ('admin', 'GET', '/api/v1/grades?status=pending', None),
+    ('lecturer', 'GET', '/api/v1/grades', None),
+    ('student', 'GET', '/api/v1/grades', None),
+    ('student', 'GET', '/api/v1/payments', None),
+    ('student', 'GET', '/api/v1/schedules', None),
+    ('student', 'GET', '/schedule', None),
+    ('lecturer', 'GET', '/schedule', None),
+    ('student', 'POST', '/enroll', 'course'),
+    ('student', 'POST', '/unenroll', 'course'),
+]
+
+# Những bảng được phép quét toàn bộ ở một route, kèm lý do
+ALLOWED_SCANS = {
+    # Danh sách toàn bộ môn học và lớp của trang /courses, /grades (bảng nhỏ)
+    ('/courses', 'course'),
+    ('/courses', 'class'),
+    ('/grades', 'course'),
+    ('/students', 'class'),
+    # Thời khóa biểu dựng một lần cho cả học kỳ rồi cache (trang chủ và /schedule)
+    ('/dashboard', 'schedule'),
+    ('/dashboard', 'exam'),
+    ('/schedule', 'schedule'),
+    ('/schedule', 'exam'),
+    # COUNT(*) tin tức (bảng nhỏ, không có index phụ để đếm)
+    ('/dashboard', 'news'),
+}
+
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+# Trang đầu của phân trang keyset: không WHERE, sắp theo khóa chính, có LIMIT
+_ROWID_PAGE = re.compile(r'ORDER BY (\w+)\.id(?: ASC| DESC)?\s+LIMIT ')
+
+
+def explain(conn, statement, parameters):
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def table_scans(statement, plan):
+    # "SCAN grade" là quét bảng; "SCAN grade USING INDEX ..." / "USING COVERING INDEX" thì không.
+    # Chỉ bỏ qua trang đầu không lọc, sắp theo rowid và không cần sắp xếp lại: quét dừng sau LIMIT dòng.
+    # Câu có WHERE (kể cả .first()) vẫn bị tính, vì LIMIT không giúp gì khi phải lọc qua cả bảng.
+    scans = [match.group(1) for match in map(_SCAN.match, plan) if match]
+    page = _ROWID_PAGE.search(statement)
+    if page and ' WHERE ' not in statement and not any(line.startswith('USE TEMP B-TREE') for line in plan):
+        scans = [table for table in scans if table != page.group(1)]
+    return scans
+
+
+def users_by_role():
+    users = {}
+    for role in ('admin', 'lecturer', 'student'):
+        query = User.query.filter_by(role=role)
+        if role == 'student':
+            # Tài khoản sinh viên phải có hồ sơ Student tương ứng
+            query = query.join(Student, Student.student_id == User.username)
+        user = query.order_by(User.id).first()
+        if user:
+            users[role] = user
+    return users
+
+
+def login_as(client, user):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+        sess['role'] = user.role
+        sess['username'] = user.username
+
+
+def capture_statements(app, client, method, path, data):
+    # Nghe trên mọi engine: route read_only đọc qua engine 'read', không qua db.engine
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            statements.append((conn.engine, statement, parameters))
+
+    engines = {id(engine): engine for engine in db.engines.values()}.values()
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', record)
+    try:
+        # App context mới cho mỗi request: g (chế độ read_only, bộ đếm) và db.session không bị
+        # dùng lại từ request trước hay từ app context của lệnh CLI
+        with app.app_context():
+            client.open(path, method=method, data=data)
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', record)
+    return statements
+
+
+def check_route_plans(app):
+    # Chạy từng route bằng test client, EXPLAIN QUERY PLAN mọi câu SELECT đã phát sinh.
+    # Chú ý: cặp /enroll - /unenroll ghi vào CSDL, chỉ chạy trên CSDL thử nghiệm.
+    problems = []
+    users = users_by_role()
+    course = Course.query.order_by(Course.id).first()
+    client = app.test_client()
+    for role, method, path, data in ROUTE_CHECKS:
+        user = users.get(role)
+        if user is None:
+            problems.append((role, path, None, [f"không có tài khoản {role} để kiểm tra"]))
+            continue
+        login_as(client, user)
+        form = {'course_id': str(course.id)} if data == 'course' and course else None
+        route = path.split('?')[0]
+        for engine, statement, parameters in capture_statements(app, client, method, path, form):
+            with engine.connect() as conn:
+                plan = explain(conn, statement, parameters)
+            scans = [t for t in table_scans(statement, plan) if (route, t) not in ALLOWED_SCANS]
+            if scans:
+                problems.append((role, path, statement, plan))
+    return problems
+
+
+def print_problems(problems):
+    for role, path, statement, plan in problems:
+        print(f"[{role}] {path}")
+        if statement:
+            print("  " + " ".join(statement.split()))
+        for line in plan:
+            print("    " + line)
@@ -0,0 +1,125 @@
+from sqlalchemy.orm import aliased
+from database import conflict_insert
+from models import db, Class, ClassCourse, Course, Exam, Schedule
+
+# Chuyển học kỳ: sao chép ClassCourse, Schedule (và tùy chọn Exam) của một học kỳ sang học kỳ
+# mới bằng INSERT ... SELECT, tất cả trong một transaction. Dòng đã có ở học kỳ đích (theo
+# ràng buộc duy nhất lớp + môn + học kỳ [+ loại thi]) được giữ nguyên, chạy lại không tạo trùng.
+
+# Các cột sao chép nguyên trạng (ngoài semester, và exam_date được dời theo số ngày)
+COPIED_COLUMNS = {
+    ClassCourse: ['class_id', 'course_id'],
+    Schedule: ['class_id', 'course_id', 'day_of_week', 'start_time', 'end_time', 'room', 'active'],
+    Exam: ['class_id', 'course_id', 'start_time', 'duration', 'room', 'exam_type'],
+}
+# Khóa duy nhất trong một học kỳ (unique_class_course_semester, unique_class_course_schedule, unique_class_course_exam)
+UNIQUE_KEYS = {
+    ClassCourse: ['class_id', 'course_id'],
+    Schedule: ['class_id', 'course_id'],
+    Exam: ['class_id', 'course_id', 'exam_type'],
+}
+SAMPLE_SIZE = 20
+
+
+class RolloverError(ValueError):
+    pass
+
+
+def _already_there(model, source, target):
+    # Dòng nguồn đã có bản ở học kỳ đích; IS NOT DISTINCT FROM để lớp NULL cũng được so khớp
+    copy = aliased(model)
+    return db.select(copy.id).where(
+        copy.semester == target,
+        *[getattr(copy, column).is_not_distinct_from(getattr(model, column)) for column in UNIQUE_KEYS[model]],
+    ).exists()
+
+
+def _shift_date(column, days, dialect_name):
+    if dialect_name == 'sqlite':
+        return db.func.date(column, f'{days:+d} days')
+    return column + days
+
+
+def _copy(model, source, target, exam_offset_days=0):
+    table = model.__table__
+    columns = COPIED_COLUMNS[model]
+    values = [getattr(model, column) for column in columns] + [db.literal(target)]
+    names = columns + ['semester']
+    dialect_name = db.session.get_bind().dialect.name
+    if model is Exam:
+        values.append(_shift_date(Exam.exam_date, exam_offset_days, dialect_name))
+        names.append('exam_date')
+    rows = db.select(*values).where(model.semester == source, ~_already_there(model, source, target))
+    statement = conflict_insert(table, dialect_name).from_select(names, rows)\
+        .on_conflict_do_nothing(index_elements=UNIQUE_KEYS[model] + ['semester'])
+    return db.session.execute(statement).rowcount
+
+
+def _count(model, *conditions):
+    return db.session.query(db.func.count(model.id)).filter(*conditions).scalar()
+
+
+def diff(source, target, include_exams=False):
+    # Xem trước: số dòng ở học kỳ nguồn, số đã có ở học kỳ đích và số sẽ được thêm
+    result = {}
+    for model in (ClassCourse, Schedule) + ((Exam,) if include_exams else ()):
+        existing = _already_there(model, source, target)
+        result[model.__tablename__] = {
+            'source': _count(model, model.semester == source),
+            'existing': _count(model, model.semester == source, existing),
+            'new': _count(model, model.semester == source, ~existing),
+            'target': _count(model, model.semester == target),
+        }
+    sample = db.session.query(Class.code, Course.code)\
+        .select_from(ClassCourse)\
+        .join(Class, Class.id == ClassCourse.class_id)\
+        .join(Course, Course.id == ClassCourse.course_id)\
+        .filter(ClassCourse.semester == source, ~_already_there(ClassCourse, source, target))\
+        .order_by(Class.code, Course.code)\
+        .limit(SAMPLE_SIZE)\
+        .all()
+    return {'source': source, 'target': target, 'tables': result, 'sample': [list(row) for row in sample]}
+
+
+def exam_offset(source, target):
+    # Mặc định dời lịch thi theo khoảng cách ngày bắt đầu hai học kỳ (luôn là bội số của 7,
+    # nên ca thi giữ nguyên thứ trong tuần)
+    import schedules
+    start, end = schedules.semester_start(source), schedules.semester_start(target)
+    if start is None or end is None:
+        return None
+    return (end - start).days
+
+
+def rollover(source, target, include_exams=False, exam_offset_days=None):
+    if not source or not target or source == target:
+        raise RolloverError('Học kỳ nguồn và học kỳ đích phải khác nhau')
+    if len(target) > ClassCourse.semester.type.length:
+        raise RolloverError('Tên học kỳ đích quá dài')
+    if include_exams and exam_offset_days is None:
+        exam_offset_days = exam_offset(source, target)
+        if exam_offset_days is None:
+            raise RolloverError('Không suy ra được số ngày dời lịch thi, hãy nhập số ngày')
+    inserted = {
+        'class_course': _copy(ClassCourse, source, target),
+        'schedule': _copy(Schedule, source, target),
+    }
+    if include_exams:
+        inserted['exam'] = _copy(Exam, source, target, exam_offset_days)
+    db.session.commit()
+    _invalidate(target)
+    return {'source': source, 'target': target, 'inserted': inserted, 'exam_offset_days': exam_offset_days}
+
+
+def _invalidate(target):
+    # Lệnh Core không đi qua flush của ORM nên phải tự xóa các cache đọc những bảng này
+    import analytics
+    import catalogue
+    import conflicts
+    import dashboard_cache
+    import schedules
+    conflicts.invalidate(target)
+    schedules.invalidate(target)
+    catalogue.invalidate()
+    analytics.invalidate()
+    dashboard_cache.bump()
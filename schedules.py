@@ -0,0 +1,223 @@
+import re
+from datetime import date, datetime, timedelta, timezone
+from hashlib import sha1
+from itsdangerous import BadSignature, URLSafeSerializer
+from flask import current_app
+from cache_invalidation import CommitCache, column_values, invalidate_on_commit
+from models import db, Class, Course, Exam, Schedule
+
+# Thời khóa biểu theo tuần của từng lớp và từng giảng viên, dựng một lần cho cả học kỳ
+# (hai truy vấn: Schedule và Exam) rồi cache tới khi Schedule/Exam/Course/Class thay đổi.
+
+DAYS = ['Thứ 2', 'Thứ 3', 'Thứ 4', 'Thứ 5', 'Thứ 6', 'Thứ 7', 'Chủ nhật']
+EXAM_TYPES = {'midterm': 'Giữa kỳ', 'final': 'Cuối kỳ'}
+# Học kỳ bắt đầu vào thứ Hai đầu tiên của tháng này (HK1, HK2, HK3 của năm học bắt đầu năm Y)
+_SEMESTER_MONTHS = {1: (0, 9), 2: (1, 2), 3: (1, 6)}
+_SEMESTER_NAME = re.compile(r'^HK(\d)-(\d{4})$')
+
+
+class WeekView:
+    # Lịch của một lớp hoặc một giảng viên: buổi học theo thứ, buổi thi theo ngày
+    def __init__(self, lessons, exams, changed_at):
+        self.lessons = {}
+        for lesson in sorted(lessons, key=lambda l: (l['day'], l['start_time'], l['course_code'])):
+            self.lessons.setdefault(lesson['day'], []).append(lesson)
+        self.exams = {}
+        for exam in sorted(exams, key=lambda e: (e['date'], e['start_time'])):
+            self.exams.setdefault(exam['date'], []).append(exam)
+        self.changed_at = changed_at
+        # ETag theo nội dung: dựng lại cache mà lịch không đổi thì lịch ở client vẫn hợp lệ
+        self.etag = sha1(repr((sorted(self.lessons.items()), sorted(self.exams.items()))).encode('utf-8')).hexdigest()
+
+    def flat(self):
+        return [lesson for day in sorted(self.lessons) for lesson in self.lessons[day]]
+
+    def grid(self):
+        # Bảng giờ x thứ: mỗi dòng là một giờ bắt đầu, mỗi ô là các buổi học của thứ đó
+        days = range(max([6] + [day + 1 for day in self.lessons]))
+        times = sorted({lesson['start_time'] for lessons in self.lessons.values() for lesson in lessons})
+        cells = {}
+        for day, lessons in self.lessons.items():
+            for lesson in lessons:
+                cells.setdefault((lesson['start_time'], day), []).append(lesson)
+        return list(days), [(time, [cells.get((time, day), []) for day in days]) for time in times]
+
+
+class SemesterGrid:
+    def __init__(self, semester):
+        self.semester = semester
+        self.changed_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self.class_names = {}
+        by_class, by_lecturer = {}, {}
+        rows = db.session.execute(
+            db.select(Schedule.id, Schedule.class_id, Class.name, Schedule.day_of_week, Schedule.start_time,
+                      Schedule.end_time, Schedule.room, Course.id, Course.code, Course.name, Course.lecturer)
+            .outerjoin(Course, Course.id == Schedule.course_id)
+            .outerjoin(Class, Class.id == Schedule.class_id)
+            .where(Schedule.semester == semester, Schedule.active.isnot(False))
+        )
+        for row in rows:
+            if row[3] is None:
+                continue
+            lesson = {
+                'id': row[0], 'class_id': row[1], 'class_name': row[2], 'day': row[3],
+                'start_time': row[4], 'end_time': row[5], 'room': row[6],
+                'course_id': row[7], 'course_code': row[8], 'course_name': row[9], 'lecturer': row[10],
+            }
+            self.class_names[row[1]] = row[2]
+            by_class.setdefault(row[1], []).append(lesson)
+            if lesson['lecturer']:
+                by_lecturer.setdefault(lesson['lecturer'], []).append(lesson)
+        exams_by_class, exams_by_lecturer = {}, {}
+        rows = db.session.execute(
+            db.select(Exam.id, Exam.class_id, Class.name, Exam.exam_date, Exam.start_time, Exam.duration,
+                      Exam.room, Exam.exam_type, Course.id, Course.code, Course.name, Course.lecturer)
+            .outerjoin(Course, Course.id == Exam.course_id)
+            .outerjoin(Class, Class.id == Exam.class_id)
+            .where(Exam.semester == semester)
+        )
+        for row in rows:
+            exam = {
+                'id': row[0], 'class_id': row[1], 'class_name': row[2], 'date': row[3],
+                'start_time': row[4], 'duration': row[5], 'room': row[6],
+                'exam_type': EXAM_TYPES.get(row[7], row[7]),
+                'course_id': row[8], 'course_code': row[9], 'course_name': row[10], 'lecturer': row[11],
+            }
+            exams_by_class.setdefault(row[1], []).append(exam)
+            if exam['lecturer']:
+                exams_by_lecturer.setdefault(exam['lecturer'], []).append(exam)
+        self._views = {}
+        for kind, lessons, exams in (('class', by_class, exams_by_class), ('lecturer', by_lecturer, exams_by_lecturer)):
+            for key in lessons.keys() | exams.keys():
+                self._views[kind, key] = WeekView(lessons.get(key, []), exams.get(key, []), self.changed_at)
+
+    def view(self, kind, key):
+        # Chỉ có lịch theo lớp và theo giảng viên; 'all' (toàn trường) quá lớn cho một trang nên là lịch trống
+        return self._views.get((kind, key)) or WeekView([], [], self.changed_at)
+
+
+# --- Cache theo học kỳ, xóa sau khi thay đổi Schedule/Exam/Course/Class được commit ---
+
+GRID_CACHE_TTL = 600
+
+_cache = CommitCache(GRID_CACHE_TTL)
+
+
+def grid(semester):
+    return _cache.get_or_create(semester, lambda: SemesterGrid(semester))
+
+
+def invalidate(semester=None):
+    _cache.invalidate(semester)
+
+
+invalidate_on_commit((Schedule, Exam), invalidate, keys=lambda obj: column_values(obj, 'semester'))
+invalidate_on_commit((Course, Class), invalidate)
+
+
+def current_semester():
+    # Học kỳ đang có lịch học hiệu lực (lịch mới nhất)
+    row = db.session.query(Schedule.semester).filter(Schedule.active.isnot(False)).order_by(Schedule.id.desc()).first()
+    return row[0] if row else None
+
+
+def semester_start(semester):
+    configured = current_app.config['SEMESTER_START_DATES'].get(semester)
+    if configured:
+        return date.fromisoformat(configured)
+    match = _SEMESTER_NAME.match(semester or '')
+    if not match or int(match.group(1)) not in _SEMESTER_MONTHS:
+        return None
+    years, month = _SEMESTER_MONTHS[int(match.group(1))]
+    first = date(int(match.group(2)) + years, month, 1)
+    return first + timedelta(days=-first.weekday() % 7)
+
+
+# --- Đường dẫn lịch (.ics) cho ứng dụng lịch: ký bằng secret_key, không cần đăng nhập ---
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt='calendar-feed')
+
+
+def feed_token(kind, key):
+    return _serializer().dumps([kind, key])
+
+
+def feed_owner(token):
+    try:
+        kind, key = _serializer().loads(token)
+    except (BadSignature, ValueError):
+        return None
+    return kind, key
+
+
+def _escape(text):
+    return str(text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold(line):
+    # Dòng iCalendar tối đa 75 byte, dòng tiếp nối bắt đầu bằng một dấu cách
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts, start = [], 0
+    while start < len(data):
+        end = min(start + (75 if not parts else 74), len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode('utf-8'))
+        start = end
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _stamp(value):
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def ics_lines(view, semester, name, host):
+    # Sinh từng dòng để response được stream, không dựng cả file trong bộ nhớ
+    weeks = current_app.config['SEMESTER_WEEKS']
+    start = semester_start(semester)
+    stamp = view.changed_at.strftime('%Y%m%dT%H%M%SZ')
+    yield _fold('BEGIN:VCALENDAR')
+    yield _fold('VERSION:2.0')
+    yield _fold('PRODID:-//SMS//Thoi khoa bieu//VI')
+    yield _fold('CALSCALE:GREGORIAN')
+    yield _fold(f'X-WR-CALNAME:{_escape(name)}')
+    yield _fold(f"X-WR-TIMEZONE:{current_app.config['CALENDAR_TIMEZONE']}")
+    if start is not None:
+        for lessons in view.lessons.values():
+            for lesson in lessons:
+                day = start + timedelta(days=lesson['day'])
+                begin = datetime.combine(day, datetime.strptime(lesson['start_time'], '%H:%M').time())
+                end = datetime.combine(day, datetime.strptime(lesson['end_time'], '%H:%M').time())
+                yield _fold('BEGIN:VEVENT')
+                yield _fold(f"UID:schedule-{lesson['id']}@{host}")
+                yield _fold(f'DTSTAMP:{stamp}')
+                yield _fold(f'DTSTART:{_stamp(begin)}')
+                yield _fold(f'DTEND:{_stamp(end)}')
+                yield _fold(f'RRULE:FREQ=WEEKLY;COUNT={weeks}')
+                yield _fold(f"SUMMARY:{_escape(lesson['course_name'])}")
+                yield _fold(f"LOCATION:{_escape(lesson['room'])}")
+                yield _fold(f"DESCRIPTION:{_escape(lesson['course_code'])} - {_escape(lesson['class_name'])}")
+                yield _fold('END:VEVENT')
+    for exams in view.exams.values():
+        for exam in exams:
+            begin = datetime.combine(exam['date'], datetime.strptime(exam['start_time'], '%H:%M').time())
+            yield _fold('BEGIN:VEVENT')
+            yield _fold(f"UID:exam-{exam['id']}@{host}")
+            yield _fold(f'DTSTAMP:{stamp}')
+            yield _fold(f'DTSTART:{_stamp(begin)}')
+            yield _fold(f"DTEND:{_stamp(begin + timedelta(minutes=exam['duration']))}")
+            yield _fold(f"SUMMARY:{_escape('Thi ' + exam['exam_type'].lower() + ': ' + (exam['course_name'] or ''))}")
+            yield _fold(f"LOCATION:{_escape(exam['room'])}")
+            yield _fold('END:VEVENT')
+    yield _fold('END:VCALENDAR')
+
+
+def init_app(app):
+    # SEMESTER_START_DATES: {'HK1-2025': '2025-09-08', ...}, ghi đè ngày bắt đầu suy ra từ tên học kỳ
+    app.config.setdefault('SEMESTER_START_DATES', {})
+    app.config.setdefault('SEMESTER_WEEKS', 15)
+    app.config.setdefault('CALENDAR_TIMEZONE', 'Asia/Ho_Chi_Minh')
+    app.config.setdefault('CALENDAR_MAX_AGE', 900)
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# app.py tạo ứng dụng ngay khi import, nên CSDL thử nghiệm phải được chọn trước đó
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='sms-test-'), 'test.db')
+
+
+@pytest.fixture(scope='session')
+def app():
+    import datagen
+    from app import app
+    app.config['TESTING'] = True
+    with app.app_context():
+        datagen.generate(students=3000, classes=60, courses=80, lecturers=10, payments_per_student=2,
+                         registrations_per_student=1)
+    return app
+
+
+@pytest.fixture(scope='session')
+def users(app):
+    import queryplan
+    with app.app_context():
+        return queryplan.users_by_role()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
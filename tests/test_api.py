@@ -0,0 +1,52 @@
+import pytest
+from queryplan import login_as
+from models import db, Course, Grade, Student
+
+
+@pytest.fixture
+def student_grades(app, users):
+    # Sinh viên có cả điểm đã xác nhận lẫn điểm đang chờ
+    with app.app_context():
+        student = Student.query.filter_by(student_id=users['student'].username).one()
+        course_ids = [c.id for c in Course.query.order_by(Course.id).limit(2)]
+        added = [Grade(student_id=student.id, course_id=course_ids[0], value=8, status='confirmed'),
+                 Grade(student_id=student.id, course_id=course_ids[1], value=4, status='pending')]
+        db.session.add_all(added)
+        db.session.commit()
+        ids = [g.id for g in added]
+        confirmed = {g.id for g in Grade.query.filter_by(student_id=student.id, status='confirmed')}
+        try:
+            yield confirmed
+        finally:
+            Grade.query.filter(Grade.id.in_(ids)).delete()
+            db.session.commit()
+
+
+def test_student_sees_only_own_confirmed_grades(client, users, student_grades):
+    login_as(client, users['student'])
+    data = client.get('/api/v1/grades?limit=1000').get_json()
+    assert {item['id'] for item in data['items']} == student_grades
+    assert {item['student_code'] for item in data['items']} == {users['student'].username}
+    assert {item['status'] for item in data['items']} == {'confirmed'}
+    exported = client.get('/api/v1/grades/export?format=ndjson').get_data(as_text=True).split('\n')
+    assert len([line for line in exported if line]) == len(student_grades)
+
+
+def test_lecturer_sees_only_grades_of_own_courses(app, client, users):
+    with app.app_context():
+        own = {c.id for c in Course.query.filter_by(lecturer=users['lecturer'].username)}
+    login_as(client, users['lecturer'])
+    data = client.get('/api/v1/grades?limit=1000').get_json()
+    assert data['items']
+    assert {item['course_id'] for item in data['items']} <= own
+
+
+def test_student_cannot_list_students(client, users):
+    login_as(client, users['student'])
+    response = client.get('/api/v1/students')
+    assert response.status_code == 403
+    assert client.get('/api/v1/students/export').status_code == 403
+
+
+def test_api_requires_login(client):
+    assert client.get('/api/v1/grades').status_code == 401
@@ -0,0 +1,27 @@
+import threading
+import time
+import pytest
+from auth import AuthBusy, HashPool
+
+
+def test_hash_pool_keeps_slot_until_timed_out_hash_finishes():
+    # Đủ luồng rảnh: chỉ giới hạn max_pending mới làm việc thứ hai bị từ chối
+    pool = HashPool(workers=2, max_pending=1, timeout=0.05)
+    release = threading.Event()
+    try:
+        with pytest.raises(AuthBusy):
+            pool.run(release.wait)
+        # Việc băm quá hạn vẫn đang chạy nên vẫn giữ chỗ chờ duy nhất
+        with pytest.raises(AuthBusy):
+            pool.run(lambda: 'ok')
+    finally:
+        # Luôn thả việc đang chờ, kẻo luồng executor treo khi pytest thoát
+        release.set()
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            assert pool.run(lambda: 'ok') == 'ok'
+            break
+        except AuthBusy:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
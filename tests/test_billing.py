@@ -0,0 +1,70 @@
+import pytest
+import billing
+from models import db, ClassCourse, Course, CourseRegistration, Enrollment, Payment, Student
+from registrations import APPROVED
+
+SEMESTER = 'HK3-2099'
+RATE = 1000
+
+
+@pytest.fixture
+def enrolled(app):
+    # Một sinh viên học một môn theo kế hoạch lớp và một môn ngoài kế hoạch qua phiếu đăng ký đã duyệt
+    with app.app_context():
+        student = Student.query.filter(Student.class_id.isnot(None)).order_by(Student.id).first()
+        planned, registered = Course.query.filter(Course.credits > 0).order_by(Course.id).limit(2).all()
+        db.session.add(ClassCourse(class_id=student.class_id, course_id=planned.id, semester=SEMESTER))
+        db.session.add(CourseRegistration(MaTheSV=student.student_id, MaMH=registered.code, HocKy=SEMESTER,
+                                          TrangThai=APPROVED))
+        added, statuses = [], {}
+        for course in (planned, registered):
+            enrollment = Enrollment.query.filter_by(student_id=student.id, course_id=course.id).first()
+            if enrollment is None:
+                enrollment = Enrollment(student_id=student.id, course_id=course.id)
+                db.session.add(enrollment)
+                added.append(course.id)
+            else:
+                statuses[course.id] = enrollment.status
+            enrollment.status = 'active'
+        db.session.commit()
+        try:
+            yield {'student': student.id, 'credits': planned.credits + registered.credits,
+                   'courses': (planned.id, registered.id)}
+        finally:
+            Payment.query.filter_by(semester=SEMESTER).delete()
+            ClassCourse.query.filter_by(semester=SEMESTER).delete()
+            CourseRegistration.query.filter_by(HocKy=SEMESTER).delete()
+            Enrollment.query.filter(Enrollment.student_id == student.id, Enrollment.course_id.in_(added)).delete()
+            for course_id, status in statuses.items():
+                Enrollment.query.filter_by(student_id=student.id, course_id=course_id).update({'status': status})
+            db.session.commit()
+
+
+def _invoices():
+    return sorted((p.student_id, p.amount, p.status) for p in Payment.query.filter_by(semester=SEMESTER))
+
+
+def test_invoice_counts_plan_and_approved_registration_courses(app, enrolled):
+    with app.app_context():
+        billing.generate_invoices(SEMESTER, rate=RATE)
+        assert _invoices() == [(enrolled['student'], enrolled['credits'] * RATE, 'pending')]
+
+
+def test_generate_invoices_twice_gives_the_same_result(app, enrolled):
+    with app.app_context():
+        billing.generate_invoices(SEMESTER, rate=RATE)
+        first = _invoices()
+        result = billing.generate_invoices(SEMESTER, rate=RATE)
+        assert _invoices() == first
+        assert result['invoices'] == 1
+
+
+def test_paid_invoice_is_left_untouched(app, enrolled):
+    with app.app_context():
+        billing.generate_invoices(SEMESTER, rate=RATE)
+        Payment.query.filter_by(semester=SEMESTER).update({'status': 'paid'})
+        Enrollment.query.filter_by(student_id=enrolled['student'], course_id=enrolled['courses'][1])\
+            .update({'status': 'dropped'})
+        db.session.commit()
+        billing.generate_invoices(SEMESTER, rate=RATE * 2)
+        assert _invoices() == [(enrolled['student'], enrolled['credits'] * RATE, 'paid')]
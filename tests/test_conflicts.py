@@ -0,0 +1,90 @@
+import pytest
+import conflicts
+from models import db, Class, Course, Schedule
+
+SEMESTER = 'HK3-2099'
+
+
+def test_touching_intervals_do_not_overlap():
+    index = conflicts.IntervalIndex([('k', 450, 540, 1), ('k', 540, 630, 2)])
+    assert index.overlapping('k', 540, 600) == [2]
+    assert index.overlapping('k', 400, 450) == []
+    assert sorted(index.overlapping('k', 539, 541)) == [1, 2]
+    assert index.all_overlaps() == []
+
+
+@pytest.fixture
+def timetable(app):
+    with app.app_context():
+        first, second = Class.query.order_by(Class.id).limit(2).all()
+        course = Course.query.filter(Course.lecturer.isnot(None)).order_by(Course.id).first()
+        same_lecturer = Course.query.filter(Course.lecturer == course.lecturer, Course.id != course.id).first()
+        other = Course.query.filter(Course.lecturer != course.lecturer).first()
+        lesson = Schedule(class_id=first.id, course_id=course.id, day_of_week=0, start_time='07:30',
+                          end_time='09:00', room='P101', semester=SEMESTER)
+        db.session.add(lesson)
+        db.session.commit()
+        try:
+            yield {'lesson': lesson.id, 'first': first.id, 'second': second.id, 'course': course.id,
+                   'same_lecturer': same_lecturer.id, 'other': other.id}
+        finally:
+            Schedule.query.filter_by(semester=SEMESTER).delete()
+            db.session.commit()
+            conflicts.invalidate(SEMESTER)
+
+
+def _resources(app, **kwargs):
+    with app.app_context():
+        found = conflicts.timetable(SEMESTER).check_schedule(**dict({'day_of_week': 0, 'room': 'P202'}, **kwargs))
+    return {c['resource'] for c in found}
+
+
+def test_schedule_conflicts_by_resource(app, timetable):
+    t = timetable
+    # Phòng trùng, lớp và giảng viên khác
+    assert _resources(app, class_id=t['second'], course_id=t['other'], start_time='08:00',
+                      end_time='09:30', room='P101') == {'room'}
+    # Cùng lớp, phòng khác
+    assert _resources(app, class_id=t['first'], course_id=t['other'], start_time='08:00',
+                      end_time='09:30') == {'class'}
+    # Cùng giảng viên dạy lớp khác, phòng khác
+    assert _resources(app, class_id=t['second'], course_id=t['same_lecturer'], start_time='08:00',
+                      end_time='09:30') == {'lecturer'}
+    # Bắt đầu đúng lúc buổi trước kết thúc, hoặc khác ngày: không trùng
+    assert _resources(app, class_id=t['first'], course_id=t['course'], start_time='09:00',
+                      end_time='10:30', room='P101') == set()
+    assert _resources(app, class_id=t['first'], course_id=t['course'], start_time='07:30',
+                      end_time='09:00', room='P101', day_of_week=1) == set()
+
+
+def test_exclude_id_skips_the_schedule_being_edited(app, client, users, timetable):
+    t = timetable
+    edit = dict(semester=SEMESTER, class_id=t['first'], course_id=t['course'], day_of_week=0,
+                start_time='08:00', end_time='09:30', room='P101')
+    clash = {k: v for k, v in edit.items() if k != 'semester'}
+    assert _resources(app, **clash) == {'room', 'class', 'lecturer'}
+    assert _resources(app, exclude_id=t['lesson'], **clash) == set()
+    import queryplan
+    queryplan.login_as(client, users['admin'])
+    # Form gửi id dạng chuỗi
+    assert client.post('/schedules/check', data=dict(edit, exclude_id=str(t['lesson']))).get_json()['ok']
+    assert client.post('/schedules/check', json=dict(edit, exclude_id=t['lesson'])).get_json()['ok']
+    assert client.post('/schedules/check', json=dict(edit, exclude_id='abc')).status_code == 400
+
+
+def test_cache_follows_a_committed_semester_change(app, timetable):
+    with app.app_context():
+        moved = Schedule(class_id=timetable['first'], course_id=timetable['other'], day_of_week=0,
+                         start_time='08:00', end_time='08:45', room='P303', semester='HK1-2099')
+        db.session.add(moved)
+        db.session.commit()
+        assert conflicts.timetable(SEMESTER).report() == []
+        assert conflicts.timetable('HK1-2099').report() == []
+        # Cả học kỳ mới lẫn học kỳ cũ của lịch đều được tạo lại sau commit
+        moved.semester = SEMESTER
+        db.session.flush()
+        assert conflicts.timetable(SEMESTER).report() == []
+        db.session.commit()
+        assert {c['resource'] for c in conflicts.timetable(SEMESTER).report()} == {'class'}
+        assert conflicts.timetable('HK1-2099').check_schedule(
+            timetable['first'], timetable['other'], 0, '08:00', '08:45', 'P303') == []
@@ -0,0 +1,36 @@
+import threading
+import pytest
+import enrollment
+from write_queue import WriteQueue, WriteQueueBusy, WriteQueuePending
+
+
+def test_concurrent_enroll_respects_capacity(app):
+    with app.app_context():
+        result = enrollment.load_test(app, students=300, capacity=40, threads=16, attempts=2)
+    assert result['enrolled'] == 40
+    assert result['duplicates'] == 0
+    assert result['errors'] == 0
+    assert result['ok']
+
+
+def test_write_timeout_cancels_or_reports_pending(app):
+    queue = WriteQueue(app, timeout=0.2)
+    release = threading.Event()
+    ran = []
+
+    def blocking():
+        release.wait(5)
+        ran.append('blocking')
+
+    def queued():
+        ran.append('queued')
+
+    # Thao tác đầu đã chạy khi hết hạn chờ: không hủy được, báo đang xử lý
+    with pytest.raises(WriteQueuePending):
+        queue.run(blocking)
+    # Thao tác sau còn nằm trong hàng đợi: bị hủy, báo bận và không bao giờ chạy
+    with pytest.raises(WriteQueueBusy):
+        queue.run(queued)
+    release.set()
+    queue.submit(lambda: None).result(timeout=5)
+    assert ran == ['blocking']
@@ -0,0 +1,24 @@
+from datetime import date
+import exam_scheduler
+import grading
+from models import db, Course
+
+
+def test_plan_has_no_class_room_or_lecturer_clash(app):
+    with app.app_context():
+        semester = grading.semester_choices()[-1]
+        windows = {'midterm': (date(2099, 3, 2), date(2099, 3, 13)), 'final': (date(2099, 5, 4), date(2099, 5, 22))}
+        plan = exam_scheduler.plan_exams(semester, windows)
+        lecturers = dict(db.session.query(Course.id, Course.lecturer))
+    assert plan.exams
+    seen = {}
+    for exam in plan.exams:
+        when = (exam['exam_date'], exam['start_time'])
+        for key in (('class', exam['class_id']), ('room', exam['room']), ('lecturer', lecturers[exam['course_id']])):
+            if key[1] is None:
+                continue
+            assert (key, when) not in seen, f'{key} trùng ca {when}: {seen.get((key, when))} và {exam}'
+            seen[key, when] = exam
+    # Mỗi lớp-môn có đúng một ca cho mỗi loại thi
+    placed = [(e['class_id'], e['course_id'], e['exam_type']) for e in plan.exams]
+    assert len(placed) == len(set(placed))
@@ -0,0 +1,50 @@
+import io
+from models import Course, Student
+
+
+def _login(client, user):
+    import queryplan
+    queryplan.login_as(client, user)
+
+
+def test_import_reports_lines_not_in_utf8(app, client, users):
+    lecturer = users['lecturer']
+    with app.app_context():
+        course = Course.query.filter_by(lecturer=lecturer.username).first()
+        student = Student.query.order_by(Student.id).first()
+        good = f'{student.student_id},{course.code},8.5\r\n'
+        bad = f'{student.student_id},{course.code},7,Đông\r\n'
+    # File Excel xuất CSV theo mã cp1258, không có BOM
+    data = 'Sinh viên,Môn,Ghi chú\r\n'.encode('cp1258') + good.encode() + bad.encode('cp1258')
+    _login(client, lecturer)
+    response = client.post('/grades/import?format=json', data={'file': (io.BytesIO(data), 'diem.csv')})
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['imported'] == 1
+    assert [e['line'] for e in report['errors']] == [1, 3]
+
+
+
+def test_import_skips_duplicate_pending_grades(app, client, users):
+    lecturer = users['lecturer']
+    with app.app_context():
+        course = Course.query.filter_by(lecturer=lecturer.username).first()
+        student = Student.query.order_by(Student.id).offset(1).first()
+        row = f'{student.student_id},{course.code},7\r\n'
+    # Cùng một dòng lặp trong file, rồi nhập lại cả file lần nữa
+    data = (row + row).encode()
+    _login(client, lecturer)
+    first = client.post('/grades/import?format=json', data={'file': (io.BytesIO(data), 'diem.csv')}).get_json()
+    assert first['imported'] == 1
+    assert [e['line'] for e in first['errors']] == [2]
+    again = client.post('/grades/import?format=json', data={'file': (io.BytesIO(data), 'diem.csv')}).get_json()
+    assert again['imported'] == 0
+    assert [e['line'] for e in again['errors']] == [1, 2]
+
+def test_confirm_rejects_invalid_json_payload(client, users):
+    _login(client, users['admin'])
+    for payload in ({'course_id': 'abc'}, {'grade_ids': '1,2'}, {'grade_ids': [1, 'x']},
+                    {'semester': ['HK1-2025']}, ['course_id']):
+        response = client.post('/grades/confirm', json=payload)
+        assert response.status_code == 400, payload
+        assert 'error' in response.get_json()
@@ -0,0 +1,46 @@
+import threading
+import identity
+from models import db, Course
+
+
+def _course_ids_in_thread(app, username):
+    # Request khác: app context và session riêng
+    result = []
+
+    def run():
+        with app.app_context():
+            result.append(identity.lecturer_course_ids(username))
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_course_owner_change_invalidates_after_commit(app, users):
+    with app.app_context():
+        course = Course.query.filter(Course.lecturer != users['lecturer'].username).first()
+        old_owner, new_owner = course.lecturer, users['lecturer'].username
+        assert course.id not in identity.lecturer_course_ids(new_owner)
+        try:
+            course.lecturer = new_owner
+            db.session.flush()
+            # Đọc giữa flush và commit thấy dữ liệu cũ; giá trị đó không được sống sót sau commit
+            assert course.id not in _course_ids_in_thread(app, new_owner)
+            db.session.commit()
+            assert course.id in _course_ids_in_thread(app, new_owner)
+            assert course.id not in _course_ids_in_thread(app, old_owner)
+        finally:
+            course.lecturer = old_owner
+            db.session.commit()
+        assert course.id not in identity.lecturer_course_ids(new_owner)
+
+
+def test_course_cache_kept_on_rollback(app, users):
+    username = users['lecturer'].username
+    with app.app_context():
+        before = identity.lecturer_course_ids(username)
+        course = Course.query.filter(Course.lecturer != username).first()
+        course.lecturer = username
+        db.session.flush()
+        db.session.rollback()
+        assert identity.lecturer_course_ids(username) == before
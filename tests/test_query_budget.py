@@ -0,0 +1,23 @@
+import pytest
+import dashboard_cache
+from queries import QueryBudgetExceeded
+from queryplan import login_as
+
+
+@pytest.mark.parametrize('role', ['admin', 'lecturer', 'student'])
+@pytest.mark.parametrize('endpoint', ['dashboard', 'courses', 'grades'])
+def test_route_within_query_budget(app, client, users, role, endpoint):
+    # Ở chế độ TESTING, vượt QUERY_BUDGETS làm request ném QueryBudgetExceeded
+    assert endpoint in app.config['QUERY_BUDGETS']
+    # Đo đường không có cache: trang dashboard đã lưu từ test trước sẽ không được dùng lại
+    dashboard_cache.bump()
+    login_as(client, users[role])
+    response = client.get(f'/{endpoint}')
+    assert response.status_code == 200
+
+
+def test_budget_is_enforced(app, client, users, monkeypatch):
+    monkeypatch.setitem(app.config, 'QUERY_BUDGETS', dict(app.config['QUERY_BUDGETS'], grades=0))
+    login_as(client, users['admin'])
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/grades')
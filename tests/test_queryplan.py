@@ -0,0 +1,40 @@
+import queryplan
+from models import db
+
+
+def test_rowid_page_is_not_a_scan():
+    statement = 'SELECT student.id FROM student ORDER BY student.id LIMIT ? OFFSET ?'
+    assert queryplan.table_scans(statement, ['SCAN student']) == []
+
+
+def test_filtered_limit_is_a_scan():
+    statement = 'SELECT student.id FROM student WHERE student.full_name = ? LIMIT ? OFFSET ?'
+    assert queryplan.table_scans(statement, ['SCAN student']) == ['student']
+
+
+def test_sorted_page_is_a_scan():
+    statement = 'SELECT student.id FROM student ORDER BY student.id LIMIT ?'
+    plan = ['SCAN student', 'USE TEMP B-TREE FOR ORDER BY']
+    assert queryplan.table_scans(statement, plan) == ['student']
+
+
+def test_explain_detects_real_scan(app):
+    statement = 'SELECT student.id FROM student WHERE student.dob = ? LIMIT 1'
+    with app.app_context(), db.engine.connect() as conn:
+        plan = queryplan.explain(conn, statement, ('x',))
+    assert queryplan.table_scans(statement, plan) == ['student']
+
+
+def test_read_only_routes_are_captured(app, client, users):
+    # /students đọc qua engine 'read'
+    with app.app_context():
+        queryplan.login_as(client, users['admin'])
+        statements = queryplan.capture_statements(app, client, 'GET', '/students?q=2023', None)
+    assert any('FROM student' in statement for _, statement, _ in statements)
+
+
+def test_route_plans(app):
+    with app.app_context():
+        problems = queryplan.check_route_plans(app)
+    queryplan.print_problems(problems)
+    assert problems == []
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+import pytest
+import registrations
+from models import db, Course, CourseRegistration, Enrollment, Student
+
+SEMESTER = 'HK3-2099'
+CAPACITY = 3
+
+
+@pytest.fixture
+def full_course(app):
+    # Môn mới sức chứa 3, không có lịch học, đã có một sinh viên học; 6 sinh viên khác đăng ký
+    # theo thứ tự thời gian
+    with app.app_context():
+        course = Course(code='TEST-CAP', name='Môn kiểm thử sĩ số', credits=1, capacity=CAPACITY)
+        db.session.add(course)
+        students = Student.query.order_by(Student.id).limit(2 * CAPACITY + 1).all()
+        db.session.flush()
+        db.session.add(Enrollment(student_id=students[0].id, course_id=course.id))
+        codes = [s.student_id for s in students[1:]]
+        start = datetime(2099, 1, 1)
+        for i, code in enumerate(codes):
+            db.session.add(CourseRegistration(MaTheSV=code, MaMH=course.code, HocKy=SEMESTER,
+                                              NgayDangKy=start + timedelta(minutes=i)))
+        db.session.commit()
+        try:
+            yield course.id, codes
+        finally:
+            Enrollment.query.filter_by(course_id=course.id).delete()
+            CourseRegistration.query.filter_by(HocKy=SEMESTER).delete()
+            db.session.delete(course)
+            db.session.commit()
+
+
+def test_approval_stops_at_course_capacity(app, full_course):
+    course_id, codes = full_course
+    with app.app_context():
+        result = registrations.approve_semester(SEMESTER)
+        approved = CAPACITY - 1
+        assert result['approved'] == approved
+        assert result['rejected'] == {registrations.COURSE_FULL: len(codes) - approved}
+        statuses = [r.TrangThai for r in CourseRegistration.query.filter_by(HocKy=SEMESTER)
+                    .order_by(CourseRegistration.NgayDangKy)]
+        # Ai đăng ký trước được duyệt trước
+        assert statuses == [registrations.APPROVED] * approved + [registrations.REJECTED] * (len(codes) - approved)
+        assert Enrollment.query.filter_by(course_id=course_id, status='active').count() == CAPACITY
+        # Duyệt lại không còn phiếu chờ nào và không vượt sức chứa
+        assert registrations.approve_semester(SEMESTER)['processed'] == 0
+        assert Enrollment.query.filter_by(course_id=course_id, status='active').count() == CAPACITY
@@ -0,0 +1,47 @@
+import pytest
+import grading
+import rollover
+from models import db, ClassCourse, Exam, Schedule
+
+TARGET = 'HK3-2099'
+MODELS = (ClassCourse, Schedule, Exam)
+
+
+def _counts():
+    return {model.__tablename__: model.query.count() for model in MODELS}
+
+
+@pytest.fixture
+def source(app):
+    with app.app_context():
+        semester = grading.semester_choices()[0]
+        try:
+            yield semester
+        finally:
+            for model in MODELS:
+                model.query.filter_by(semester=TARGET).delete()
+            db.session.commit()
+
+
+def test_dry_run_writes_nothing(app, source):
+    with app.app_context():
+        before = _counts()
+    result = app.test_cli_runner().invoke(args=['rollover-semester', '--source', source, '--target', TARGET,
+                                                '--exams', '--dry-run'])
+    assert result.exit_code == 0, result.output
+    assert 'sẽ thêm' in result.output
+    with app.app_context():
+        assert _counts() == before
+
+
+def test_second_rollover_inserts_nothing(app, source):
+    with app.app_context():
+        preview = rollover.diff(source, TARGET, include_exams=True)
+        first = rollover.rollover(source, TARGET, include_exams=True, exam_offset_days=7)
+        assert first['inserted'] == {table: counts['new'] for table, counts in preview['tables'].items()}
+        assert first['inserted']['class_course'] > 0
+        after_first = _counts()
+        second = rollover.rollover(source, TARGET, include_exams=True, exam_offset_days=7)
+        assert second['inserted'] == {'class_course': 0, 'schedule': 0, 'exam': 0}
+        assert _counts() == after_first
+        assert all(counts['new'] == 0 for counts in rollover.diff(source, TARGET, True)['tables'].values())
@@ -0,0 +1,24 @@
+import transcript
+from models import db, Student, TranscriptSemester
+
+
+def test_semester_order_sorts_by_year_then_term(app):
+    semesters = ['HK1-2025', 'HK2-2024', 'HK3-2024', 'HK1-2024', 'Khác']
+    with app.app_context():
+        keys = {name: db.session.execute(db.select(transcript.semester_order(db.literal(name)))).scalar()
+                for name in semesters}
+    assert sorted(semesters, key=keys.get) == ['Khác', 'HK1-2024', 'HK2-2024', 'HK3-2024', 'HK1-2025']
+
+
+def test_transcript_lists_semesters_by_year_then_term(app):
+    with app.app_context():
+        student = Student.query.order_by(Student.id).first()
+        for semester in ('HK1-2099', 'HK2-2098'):
+            db.session.add(TranscriptSemester(student_id=student.id, semester=semester))
+        db.session.commit()
+        try:
+            listed = [s.semester for s in transcript.semesters_for(student.id)]
+            assert listed.index('HK2-2098') < listed.index('HK1-2099')
+        finally:
+            TranscriptSemester.query.filter(TranscriptSemester.semester.in_(['HK1-2099', 'HK2-2098'])).delete()
+            db.session.commit()
@@ -0,0 +1,129 @@
+from sqlalchemy.orm import joinedload
+from models import db, Student, Course, Grade, ClassCourse, TranscriptCourse, TranscriptSemester
+
+CUMULATIVE = 'TICH_LUY'
+PASSING_GRADE = 5.0
+UNASSIGNED_SEMESTER = 'Chưa xếp'
+RANKING_PAGE_SIZE = 50
+# Giới hạn số tham số trong mệnh đề IN của SQLite
+_ID_CHUNK = 500
+
+
+def semester_order(column):
+    # Khóa sắp xếp học kỳ 'HKn-YYYY' theo năm rồi theo kỳ (so sánh chuỗi đặt HK2-2024 sau HK1-2025);
+    # tên không theo mẫu xếp trước mọi học kỳ hợp lệ
+    year = db.cast(db.func.substr(column, 5, 4), db.Integer)
+    term = db.cast(db.func.substr(column, 3, 1), db.Integer)
+    return db.case((column.like('HK_-____'), year * 10 + term), else_=-1)
+
+
+def _course_rows(student_ids=None):
+    # Điểm xác nhận mới nhất (Grade.id lớn nhất) cho mỗi cặp sinh viên - môn học
+    latest = db.select(db.func.max(Grade.id)).where(Grade.status == 'confirmed')
+    if student_ids is not None:
+        latest = latest.where(Grade.student_id.in_(student_ids))
+    latest = latest.group_by(Grade.student_id, Grade.course_id)
+
+    # Học kỳ lấy từ ClassCourse của lớp sinh viên; nếu học lại nhiều kỳ thì lấy kỳ gần nhất
+    semester = db.select(ClassCourse.semester)\
+        .where(ClassCourse.class_id == Student.class_id, ClassCourse.course_id == Grade.course_id)\
+        .order_by(semester_order(ClassCourse.semester).desc(), ClassCourse.semester.desc())\
+        .limit(1)\
+        .scalar_subquery()
+
+    return db.select(
+        Grade.student_id,
+        Grade.course_id,
+        Grade.id,
+        db.func.coalesce(semester, UNASSIGNED_SEMESTER),
+        Grade.value,
+        db.func.coalesce(Course.credits, 0),
+    ).join(Student, Student.id == Grade.student_id)\
+        .join(Course, Course.id == Grade.course_id)\
+        .where(Grade.id.in_(latest))
+
+
+def _semester_rows(student_ids=None, cumulative=False):
+    earned = db.func.sum(db.case(
+        (TranscriptCourse.value >= PASSING_GRADE, TranscriptCourse.credits), else_=0
+    ))
+    attempted = db.func.sum(TranscriptCourse.credits)
+    points = db.func.sum(TranscriptCourse.credits * TranscriptCourse.value)
+    semester = db.literal(CUMULATIVE) if cumulative else TranscriptCourse.semester
+    query = db.select(
+        TranscriptCourse.student_id,
+        semester,
+        attempted,
+        earned,
+        points,
+        points / db.func.nullif(attempted, 0),
+    )
+    if student_ids is not None:
+        query = query.where(TranscriptCourse.student_id.in_(student_ids))
+    if cumulative:
+        return query.group_by(TranscriptCourse.student_id)
+    return query.group_by(TranscriptCourse.student_id, TranscriptCourse.semester)
+
+
+def _refresh(student_ids=None):
+    course_table, semester_table = TranscriptCourse.__table__, TranscriptSemester.__table__
+    course_delete, semester_delete = course_table.delete(), semester_table.delete()
+    if student_ids is not None:
+        course_delete = course_delete.where(course_table.c.student_id.in_(student_ids))
+        semester_delete = semester_delete.where(semester_table.c.student_id.in_(student_ids))
+    db.session.execute(course_delete)
+    db.session.execute(semester_delete)
+    db.session.execute(course_table.insert().from_select(
+        ['student_id', 'course_id', 'grade_id', 'semester', 'value', 'credits'],
+        _course_rows(student_ids)
+    ))
+    columns = ['student_id', 'semester', 'credits_attempted', 'credits_earned', 'grade_points', 'gpa']
+    db.session.execute(semester_table.insert().from_select(columns, _semester_rows(student_ids)))
+    db.session.execute(semester_table.insert().from_select(columns, _semester_rows(student_ids, cumulative=True)))
+
+
+def refresh_students(student_ids):
+    # Cập nhật tăng dần cho các sinh viên vừa có điểm được xác nhận (không commit)
+    student_ids = sorted(set(student_ids))
+    for i in range(0, len(student_ids), _ID_CHUNK):
+        _refresh(student_ids[i:i + _ID_CHUNK])
+
+
+def rebuild():
+    import analytics
+    _refresh()
+    db.session.commit()
+    analytics.invalidate()
+
+
+def semesters_for(student_id):
+    return TranscriptSemester.query\
+        .filter(TranscriptSemester.student_id == student_id)\
+        .order_by(semester_order(TranscriptSemester.semester), TranscriptSemester.semester)\
+        .all()
+
+
+def courses_for(student_id):
+    return TranscriptCourse.query\
+        .options(joinedload(TranscriptCourse.course))\
+        .filter(TranscriptCourse.student_id == student_id)\
+        .order_by(semester_order(TranscriptCourse.semester), TranscriptCourse.semester, TranscriptCourse.course_id)\
+        .all()
+
+
+def cumulative_for(student_id):
+    return TranscriptSemester.query\
+        .filter_by(student_id=student_id, semester=CUMULATIVE)\
+        .first()
+
+
+def ranking_page(semester=CUMULATIVE, page=1, limit=RANKING_PAGE_SIZE):
+    rows = db.session.query(TranscriptSemester, Student)\
+        .join(Student, Student.id == TranscriptSemester.student_id)\
+        .filter(TranscriptSemester.semester == semester, TranscriptSemester.gpa.isnot(None))\
+        .order_by(TranscriptSemester.gpa.desc(), TranscriptSemester.student_id)\
+        .offset((page - 1) * limit)\
+        .limit(limit + 1)\
+        .all()
+    return rows[:limit], len(rows) > limit
+
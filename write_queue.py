@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from sqlalchemy.exc import OperationalError
+from models import db
+
+
+class WriteQueueBusy(Exception):
+    pass
+
+
+class WriteQueuePending(Exception):
+    # Hết thời gian chờ khi thao tác ghi đã bắt đầu chạy: không hủy được, kết quả chưa biết
+    pass
+
+
+class WriteQueue:
+    # Hàng đợi ghi có giới hạn: một luồng duy nhất thực hiện các thao tác ghi,
+    # nên các thao tác gửi qua đây không bao giờ tranh khóa ghi SQLite với nhau.
+    # Phạm vi chỉ gồm các thao tác ghi dồn dập cùng lúc và phải kiểm tra sĩ số trước khi ghi:
+    # đăng ký/hủy môn (enrollment), duyệt phiếu đăng ký (registrations) và lưu lại hash mật khẩu (auth).
+    # Nhập/xác nhận điểm, lập hóa đơn học phí, job nền và các form quản trị vẫn commit trực tiếp
+    # và dựa vào busy_timeout của SQLite (database.py) khi gặp khóa.
+    def __init__(self, app, maxsize=1000, timeout=10.0, retries=3):
+        self.app = app
+        self.timeout = timeout
+        self.retries = retries
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            future, fn, args, kwargs = self._queue.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self._execute(fn, args, kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            self._queue.task_done()
+
+    def _execute(self, fn, args, kwargs):
+        for attempt in range(self.retries + 1):
+            with self.app.app_context():
+                try:
+                    return fn(*args, **kwargs)
+                except OperationalError as e:
+                    db.session.rollback()
+                    if 'locked' not in str(e.orig) or attempt == self.retries:
+                        raise
+            time.sleep(0.05 * 2 ** attempt)
+
+    def submit(self, fn, *args, **kwargs):
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put_nowait((future, fn, args, kwargs))
+        except queue.Full:
+            raise WriteQueueBusy('Hệ thống đang bận, vui lòng thử lại sau')
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        # Gửi thao tác ghi và chờ kết quả. Quá hạn thì hủy nếu thao tác chưa chạy (báo bận, có thể
+        # thử lại); nếu đã chạy thì báo đang xử lý, vì thao tác vẫn sẽ hoàn tất sau đó.
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise WriteQueueBusy('Hệ thống đang bận, vui lòng thử lại sau')
+            raise WriteQueuePending('Yêu cầu đang được xử lý, vui lòng kiểm tra lại sau')
+
+
+def init_app(app):
+    app.config.setdefault('WRITE_QUEUE_SIZE', 1000)
+    app.config.setdefault('WRITE_QUEUE_TIMEOUT', 10.0)
+    app.extensions['write_queue'] = WriteQueue(
+        app,
+        maxsize=app.config['WRITE_QUEUE_SIZE'],
+        timeout=app.config['WRITE_QUEUE_TIMEOUT'],
+    )
+
+
+def get_queue(app):
+    return app.extensions['write_queue']